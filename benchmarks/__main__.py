@@ -0,0 +1,285 @@
+import argparse
+import fnmatch
+import gc
+import importlib.util
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from itertools import count
+
+from employes import (ColumnarRows, CsvImport, DashboardStats, DataValidator, EmployeeStore, Export,
+                      FilterEngine, PdfReport, SearchIndex, SortCache, open_storage)
+from employes.store import COLUMNS
+
+from .roster import roster, write_csv
+
+# Times the hot paths of the application on synthetic rosters and writes the
+# results as JSON, optionally compared against an earlier run:
+#
+#   python -m benchmarks --rows 10000 100000 --out results.json
+#   python -m benchmarks --rows 10000 100000 --baseline results.json
+#
+# Everything runs on a headless store; --tk adds the table under a display
+# (e.g. `xvfb-run python -m benchmarks --tk`). Each benchmark is run
+# --repeat times on fresh state and its best time is what gets compared.
+FORMAT = 1
+SIZES = (10000, 100000)
+BACKENDS = (("sqlite", ".db"), ("text", ".txt"), ("binary", ".emp"))
+QUERIES = ("martin", "emp-2001", "ab12", "1985")
+
+
+class Job:
+    # Stands in for a JobQueue job: never cancelled, progress ignored
+    cancelled = False
+
+    def report(self, done, total=None):
+        pass
+
+    def check(self):
+        pass
+
+
+class Suite:
+    def __init__(self, rows, workdir, repeat, selected):
+        self.rows = rows
+        self.workdir = workdir
+        self.repeat = repeat
+        self.selected = selected
+        self.results = {}
+
+    def bench(self, name, run, setup=None):
+        # run(state) is timed, setup() builds a fresh state before each run
+        if not any(fnmatch.fnmatch(name, pattern) for pattern in self.selected):
+            return
+        times = []
+        for _ in range(self.repeat):
+            state = setup() if setup is not None else None
+            gc.collect()
+            gc.disable()
+            try:
+                start = time.perf_counter()
+                run(state)
+                times.append(time.perf_counter() - start)
+            finally:
+                gc.enable()
+        self.results[name] = {"best": min(times), "median": statistics.median(times), "runs": times}
+        print(f"{self.rows:>9} {name:<36} {min(times) * 1000:10.2f} ms", file=sys.stderr)
+
+    def path(self, name):
+        return os.path.join(self.workdir, name)
+
+    def store(self):
+        store = EmployeeStore(rows=ColumnarRows)
+        store.load(self.records)
+        return store
+
+    def run(self, tk=False):
+        self.records = list(roster(self.rows))
+        write_csv(self.path("roster.csv"), self.rows)
+        for backend, extension in BACKENDS:
+            self.storage_benchmarks(backend, self.path("employes" + extension))
+        self.engine_benchmarks()
+        self.io_benchmarks()
+        if tk:
+            self.tk_benchmarks()
+        return self.results
+
+    def storage_benchmarks(self, backend, path):
+        storage = open_storage(path)
+        storage.replace_all(enumerate(self.records))
+        storage.close()
+
+        def load(_):
+            storage = open_storage(path)
+            store = EmployeeStore(rows=ColumnarRows)
+            storage.load_into(store)
+            store.keys()  # What the table is handed
+            storage.close()
+
+        self.bench(f"load_employees[{backend}]", load)
+
+        def opened():
+            storage = open_storage(path)
+            store = EmployeeStore(rows=ColumnarRows)
+            storage.attach(store)
+            storage.load_into(store)
+            key = store.keys()[0]
+            store.update(key, ("Modifié",) + store.get(key)[1:])
+            return storage
+
+        def save(storage):
+            storage.write_snapshot(storage.snapshot())
+            storage.close()
+
+        self.bench(f"save_current_state[{backend}]", save, opened)
+
+    def engine_benchmarks(self):
+        self.bench("search_employees[build]", lambda index: index.build(),
+                   lambda: SearchIndex(self.store()))
+        index = SearchIndex(self.store())
+        index.build()
+
+        def search(_):
+            # None of the queries extends the one before, so each is a full lookup
+            for query in QUERIES:
+                index.search(query)
+
+        self.bench("search_employees", search)
+
+        criteria = {"year_from": "1980", "year_to": "1995", "dept": "Finance"}
+        self.bench("apply_filters[build]", lambda filters: filters.keys(filters.select(**criteria)),
+                   lambda: FilterEngine(self.store()))
+        filters = FilterEngine(self.store())
+        filters.select(dept="Finance")
+        ends = count(1995, -1)  # New criteria every run, selections are cached
+
+        def apply(_):
+            filters.keys(filters.select(year_from="1980", year_to=str(next(ends)), dept="Finance"))
+
+        self.bench("apply_filters", apply)
+
+        for column in COLUMNS:
+            self.bench(f"sort_treeview[{column}]", lambda sorter, spec=((column, False),): sorter.order(spec),
+                       lambda: SortCache(self.store()))
+        self.bench("sort_treeview[Année,Nom]",
+                   lambda sorter: sorter.order((("Année", True), ("Nom", False))),
+                   lambda: SortCache(self.store()))
+
+        def dashboard(stats):
+            stats.age_histogram()
+            stats.mean_age()
+            dict(stats.departments)
+
+        self.bench("dashboard_refresh", dashboard, lambda: DashboardStats(self.store()))
+        stats = DashboardStats(self.store())
+        dashboard(stats)
+        store = stats.store
+        key = store.keys()[0]
+
+        def dashboard_update(_):
+            record = store.get(key)
+            store.update(key, record[:2] + (str(int(record[2]) - 1),) + record[3:])
+            dashboard(stats)
+
+        self.bench("dashboard_refresh[update]", dashboard_update)
+
+    def io_benchmarks(self):
+        def csv_import(store):
+            job = CsvImport(self.path("roster.csv"), DataValidator(store))
+            job.start()
+            while True:
+                item = job.chunks.get()
+                if item[0] == "error":
+                    raise item[1]
+                if item[0] == "done":
+                    break
+                store.extend(item[1])
+
+        self.bench("csv_import", csv_import, lambda: EmployeeStore(rows=ColumnarRows))
+        store = self.store()
+        self.bench("csv_export", lambda _: Export(self.path("export.csv"), store.records(),
+                                                  len(store)).run(Job()))
+        if not all(importlib.util.find_spec(name) for name in ("reportlab", "pypdf")):
+            print(f"{self.rows:>9} pdf_export skipped: reportlab or pypdf missing", file=sys.stderr)
+            return
+        self.bench("pdf_export", lambda _: PdfReport(self.path("export.pdf"), store.records(),
+                                                     len(store)).run(Job()))
+
+    def tk_benchmarks(self):
+        if sys.platform.startswith("linux") and not os.environ.get("DISPLAY"):
+            print(f"{self.rows:>9} tk skipped: no display (run under xvfb-run)", file=sys.stderr)
+            return
+        from tkinter import Tk
+        from gestion_des_employes import VirtualTreeview
+
+        root = Tk()
+        try:
+            store = self.store()
+            table = VirtualTreeview(root, store, COLUMNS)
+            table.tree.pack()
+            keys = store.keys()
+
+            def show(_):
+                table.set_rows(keys)
+                root.update()
+
+            self.bench("table_refresh[tk]", show)
+
+            def scroll(_):
+                for _ in range(100):
+                    table.scroll(table.visible)
+                    root.update()
+
+            self.bench("table_scroll[tk]", scroll)
+        finally:
+            root.destroy()
+
+
+def compare(results, baseline, threshold, min_delta):
+    # Returns the regressions: slower than threshold x baseline by more than min_delta
+    regressions = []
+    print(f"{'lignes':>9} {'mesure':<36} {'base ms':>10} {'ms':>10} {'ratio':>7}")
+    for rows, current in results.items():
+        for name, result in current.items():
+            before = baseline.get("results", {}).get(rows, {}).get(name)
+            if before is None:
+                continue
+            ratio = result["best"] / max(before["best"], 1e-9)
+            slower = ratio > threshold and result["best"] - before["best"] > min_delta
+            if slower:
+                regressions.append((rows, name, ratio))
+            print(f"{rows:>9} {name:<36} {before['best'] * 1000:10.2f} {result['best'] * 1000:10.2f} "
+                  f"{ratio:6.2f}x{'  RÉGRESSION' if slower else ''}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks",
+                                     description="Mesures de performance sur des rosters synthétiques")
+    parser.add_argument("--rows", type=int, nargs="+", default=SIZES,
+                        help="tailles de roster (ex: 10000 100000 1000000)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", nargs="+", default=["*"], metavar="PATTERN",
+                        help="mesures à lancer, motifs fnmatch (ex: 'load_*' csv_export)")
+    parser.add_argument("--out", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="résultats précédents à comparer")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="ratio au-delà duquel une mesure est une régression")
+    parser.add_argument("--min-delta", type=float, default=0.005,
+                        help="écart minimal en secondes pour compter une régression")
+    parser.add_argument("--tk", action="store_true", help="mesurer aussi la table Tk")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for rows in args.rows:
+        workdir = tempfile.mkdtemp(prefix="employes-bench-")
+        try:
+            results[str(rows)] = Suite(rows, workdir, args.repeat, args.only).run(args.tk)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    document = {"format": FORMAT, "created": datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(), "platform": platform.platform(),
+                "cpus": os.cpu_count(), "repeat": args.repeat, "results": results}
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(document, f, indent=2, ensure_ascii=False)
+    print(f"Résultats écrits dans {args.out}", file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold, args.min_delta)
+        if regressions:
+            print(f"{len(regressions)} régression(s)", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
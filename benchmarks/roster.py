@@ -0,0 +1,49 @@
+import csv
+import random
+
+from employes.store import FIELDS, make_record
+
+# Deterministic synthetic employees that pass DataValidator: the same seed
+# and row count always give the same roster, CINs and IDs are unique.
+FIRST_NAMES = ("Adam", "Amine", "Aya", "Youssef", "Salma", "Omar", "Imane", "Mehdi", "Sara",
+               "Karim", "Nadia", "Hamza", "Leila", "Rachid", "Fatima", "Yassine", "Hajar",
+               "Ilyas", "Zineb", "Anas", "Camille", "Lucas", "Chloé", "Hugo", "Inès", "Léa")
+LAST_NAMES = ("Alaoui", "Benali", "Chraibi", "El Idrissi", "Fassi", "Bennani", "Tazi",
+              "Amrani", "Berrada", "Naciri", "Ouazzani", "Sqalli", "Zahraoui", "Lahlou",
+              "Martin", "Bernard", "Dubois", "Moreau", "Laurent", "Lefèvre", "Garcia")
+DEPARTMENTS = ("Ressources humaines", "Informatique", "Finance", "Ventes", "Marketing",
+               "Logistique", "Production", "Juridique", "")
+# Latest birth year generated, fixed so the roster doesn't change with the
+# calendar year (it stays valid: the validator's bound only moves later)
+LAST_YEAR = 2007
+CIN_SPACE = 26 * 26 * 1000000
+CIN_STEP = 7919 * 104729  # Coprime with CIN_SPACE: i -> i * step is a permutation
+
+
+def cin(index):
+    value = (index * CIN_STEP + 12345) % CIN_SPACE
+    letters, number = divmod(value, 1000000)
+    return f"{chr(65 + letters // 26)}{chr(65 + letters % 26)}{number:06d}"
+
+
+def employee_id(index):
+    # 1000 sequence numbers per year, so a million rows span years 1990-2989
+    year, number = divmod(index, 1000)
+    return f"EMP-{1990 + year}-{number:03d}"
+
+
+def roster(rows, seed=0):
+    # Yields `rows` records (Nom, CIN, Année, ID, Département)
+    rng = random.Random(seed)
+    for index in range(rows):
+        name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+        year = str(rng.randint(LAST_YEAR - 47, LAST_YEAR))
+        yield make_record((name, cin(index), year, employee_id(index), rng.choice(DEPARTMENTS)))
+
+
+def write_csv(path, rows, seed=0):
+    # Same layout as the application's CSV import expects: a header, then rows
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(FIELDS)
+        writer.writerows(roster(rows, seed))
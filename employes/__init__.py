@@ -0,0 +1,21 @@
+from .store import (COLUMNS, FIELDS, Employee, EmployeeStore, format_line, make_record,
+                    parse_line, read_employees, write_employees)
+from .columns import ColumnarRows
+from .search import SearchCancelled, SearchIndex, SearchWorker
+from .filters import FilterEngine
+from .sorting import SortCache
+from .storage import SqliteStorage, TextStorage, open_storage
+from .journal import Journal, JournaledTextStorage
+from .shared import ChangeWatcher, FileLock, Merge, SharedTextStorage
+from .binfile import BinaryStorage
+from .autosave import AutoSaver
+from .validation import DataValidator, ValidationReport
+from .importer import CsvImport
+from .exporter import Export, export_format
+from .stats import DashboardStats
+from .pdfreport import PdfReport
+from .jobs import HIGH, LOW, NORMAL, Job, JobCancelled, JobQueue
+from .backups import BackupStore
+from .restore import RestorePlan, apply_restore, load_restore, plan_restore, write_restore
+from .metrics import Metrics, StallDetector
+# employes.mailer pulls in smtplib and email.mime, it is imported on demand
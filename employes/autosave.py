@@ -0,0 +1,73 @@
+import queue
+import threading
+import time
+
+from .metrics import metrics
+
+
+class AutoSaver:
+    # Tracks which records changed since the last save and writes storage
+    # snapshots on a background thread; nothing is written while the change
+    # set is empty. The snapshot is taken on the caller's thread so the
+    # saved state is consistent. Results land in `results` as
+    # (bytes, seconds, changes, error).
+    def __init__(self, store, storage):
+        self.store = store
+        self.storage = storage
+        self.changes = {}  # key -> last op since the last save
+        self.results = queue.Queue()
+        self._thread = None
+        store.subscribe(self._on_change)
+
+    @property
+    def dirty(self):
+        return bool(self.changes)
+
+    def busy(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def save(self):
+        # Returns False when there is nothing to save or a save is running
+        if not self.changes or self.busy():
+            return False
+        changes, self.changes = self.changes, {}
+        snapshot = self.storage.snapshot()
+        self._thread = threading.Thread(target=self._write, args=(snapshot, changes),
+                                        name="auto-save", daemon=True)
+        self._thread.start()
+        return True
+
+    def poll(self):
+        # Latest finished save, or None. A failed save puts its changes back
+        # so the next one retries them.
+        result = None
+        while True:
+            try:
+                result = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if result[3] is not None:
+                for key, op in result[2].items():
+                    self.changes.setdefault(key, op)
+        return result
+
+    def wait(self):
+        if self._thread is not None:
+            self._thread.join()
+
+    def _write(self, snapshot, changes):
+        start = time.perf_counter()
+        try:
+            written = self.storage.write_snapshot(snapshot)
+        except Exception as e:
+            self.results.put((0, time.perf_counter() - start, changes, e))
+        else:
+            seconds = time.perf_counter() - start
+            metrics.record("save", seconds, len(changes), written)
+            self.results.put((written, seconds, changes, None))
+
+    def _on_change(self, op, key, old, new):
+        if op == "reset":
+            self.changes.clear()  # Freshly loaded from storage
+        else:
+            self.changes[key] = op
@@ -0,0 +1,188 @@
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+from datetime import datetime
+
+from .store import make_record
+
+BACKUP_DIR = "backups"
+KEEP = 1000  # Snapshots kept, older ones are pruned
+# Record-aligned content-defined chunking: a chunk ends after a record whose
+# line hash is 0 modulo CUT (so ~CUT records per chunk), within MIN..MAX
+# records. Boundaries depend only on nearby records, so an edit, insert or
+# delete changes the chunk around it and leaves the others as they were.
+CUT = 256
+MIN_RECORDS = 32
+MAX_RECORDS = 4096
+LEVEL = 6
+DIGEST = 16  # blake2b digest bytes naming a chunk
+
+
+def _chunks(items, keys):
+    # Yields the serialized chunks of (key, record) pairs, one JSON array per
+    # record. Keys are left out so chunks only depend on the rows' contents
+    # (backends renumber keys when they reload); they are appended to `keys`.
+    lines = []
+    dumps = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+    for key, record in items:
+        keys.append(key)
+        line = (dumps(list(record)) + "\n").encode("utf-8")
+        lines.append(line)
+        if len(lines) >= MAX_RECORDS or (len(lines) >= MIN_RECORDS and zlib.crc32(line) % CUT == 0):
+            yield b"".join(lines)
+            lines = []
+    if lines:
+        yield b"".join(lines)
+
+
+def _pack_keys(keys):
+    # Increasing keys as [gap, run length, gap, run length...]: a roster
+    # numbered without holes packs into two numbers
+    packed = []
+    last = -1
+    for key in keys:
+        if packed and key == last + 1:
+            packed[-1] += 1
+        else:
+            packed += [key - last - 1, 1]
+        last = key
+    return packed
+
+
+def _unpack_keys(packed):
+    key = 0
+    for index in range(0, len(packed), 2):
+        key += packed[index]
+        yield from range(key, key + packed[index + 1])
+        key += packed[index + 1]
+
+
+class BackupStore:
+    # Incremental backups: snapshots are lists of content-addressed, zlib
+    # compressed chunks under chunks/, described by a small JSON manifest
+    # under snapshots/. A chunk shared by many snapshots is stored once, so a
+    # backup after a few edits writes a few chunks and one manifest. Chunks
+    # hold the records only; the manifest keeps their store keys. Snapshot
+    # names sort by creation time, listing them only reads the directory.
+    def __init__(self, root=BACKUP_DIR):
+        self.root = root
+        self.chunk_dir = os.path.join(root, "chunks")
+        self.snapshot_dir = os.path.join(root, "snapshots")
+        os.makedirs(self.chunk_dir, exist_ok=True)
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        self._lock = threading.Lock()  # prune() must not see chunks of a backup in progress
+
+    def snapshots(self):
+        # Snapshot names, newest first
+        return sorted((name[:-5] for name in os.listdir(self.snapshot_dir) if name.endswith(".json")),
+                      reverse=True)
+
+    def manifest(self, name):
+        # On disk the chunk digests are packed into one base64 string, which
+        # keeps manifests of large rosters at a few KB
+        with open(self._manifest_path(name), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        packed = base64.b64decode(manifest["chunks"])
+        manifest["chunks"] = [packed[i:i + DIGEST].hex() for i in range(0, len(packed), DIGEST)]
+        return manifest
+
+    def create(self, items):
+        # Stores (key, record) pairs as a new snapshot. Returns the manifest,
+        # with "written" = compressed bytes actually added to the store; when
+        # nothing changed since the latest snapshot no new one is made.
+        with self._lock:
+            return self._create(items)
+
+    def _create(self, items):
+        start = time.perf_counter()
+        hashes = []
+        keys = []
+        rows = size = written = 0
+        for chunk in _chunks(items, keys):
+            digest = hashlib.blake2b(chunk, digest_size=DIGEST).hexdigest()
+            hashes.append(digest)
+            rows += chunk.count(b"\n")
+            size += len(chunk)
+            written += self._put_chunk(digest, chunk)
+        latest = self.snapshots()[:1]
+        if latest:
+            manifest = self.manifest(latest[0])
+            if manifest["chunks"] == hashes:
+                manifest["written"] = manifest["seconds"] = 0
+                return manifest
+        name = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        manifest = {"name": name, "created": time.time(), "rows": rows, "size": size,
+                    "keys": _pack_keys(keys),
+                    "chunks": base64.b64encode(b"".join(map(bytes.fromhex, hashes))).decode("ascii")}
+        self._write(self._manifest_path(name), json.dumps(manifest).encode("utf-8"))
+        manifest["chunks"] = hashes
+        manifest["written"] = written + os.path.getsize(self._manifest_path(name))
+        manifest["seconds"] = time.perf_counter() - start
+        return manifest
+
+    def load(self, name):
+        # Yields the (key, record) pairs of a snapshot, in key order.
+        # Snapshots without "keys" have the key at the start of each line.
+        manifest = self.manifest(name)
+        keys = _unpack_keys(manifest["keys"]) if "keys" in manifest else None
+        for digest in manifest["chunks"]:
+            with open(self._chunk_path(digest), "rb") as f:
+                chunk = zlib.decompress(f.read())
+            for line in chunk.splitlines():
+                values = json.loads(line)
+                if keys is None:
+                    yield values[0], make_record(values[1:])
+                else:
+                    yield next(keys), make_record(values)
+
+    def prune(self, keep):
+        # Keeps the `keep` newest snapshots, then deletes the chunks no
+        # remaining manifest refers to. Returns (snapshots, chunks) deleted.
+        with self._lock:
+            return self._prune(keep)
+
+    def _prune(self, keep):
+        names = self.snapshots()
+        for name in names[keep:]:
+            os.remove(self._manifest_path(name))
+        if len(names) <= keep:
+            return 0, 0
+        used = set()
+        for name in names[:keep]:
+            used.update(self.manifest(name)["chunks"])
+        removed = 0
+        for prefix in os.listdir(self.chunk_dir):
+            directory = os.path.join(self.chunk_dir, prefix)
+            for filename in os.listdir(directory):
+                if filename[:-2] not in used and not filename.endswith(".tmp"):
+                    os.remove(os.path.join(directory, filename))
+                    removed += 1
+        return len(names) - keep, removed
+
+    def _put_chunk(self, digest, chunk):
+        path = self._chunk_path(digest)
+        if os.path.exists(path):
+            return 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = zlib.compress(chunk, LEVEL)
+        self._write(path, data)
+        return len(data)
+
+    def _write(self, path, data):
+        # Complete or absent: a manifest is written after all of its chunks
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def _chunk_path(self, digest):
+        return os.path.join(self.chunk_dir, digest[:2], digest + ".z")
+
+    def _manifest_path(self, name):
+        return os.path.join(self.snapshot_dir, name + ".json")
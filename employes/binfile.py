@@ -0,0 +1,338 @@
+import mmap
+import os
+import struct
+import zlib
+from array import array
+from bisect import bisect_left
+from collections.abc import MutableMapping
+from itertools import accumulate
+
+from .journal import JournaledTextStorage, apply_entry, read_journal
+from .store import FIELDS, Employee, EmployeeStore
+
+# Layout, little-endian:
+#   header   magic, version, column count, row count, journal generation
+#            folded in, CRC32 of everything after the header, then one
+#            (offsets position, data position, data length) triple per column
+#   keys     uint64[rows], increasing
+#   per column: uint32 offsets[rows + 1] into its UTF-8 data, 8-byte aligned
+#   per column: UTF-8 data
+# A field is data[offsets[i]:offsets[i + 1]], so one row or one column is
+# read without touching the rest of the file.
+MAGIC = b"EMPB"
+VERSION = 1
+HEADER = struct.Struct("<4sHHQQI4x")
+COLUMN = struct.Struct("<QQQ")
+CACHE = 4096  # Decoded rows kept, the table redraws the same rows a lot
+
+
+class FormatError(ValueError):
+    pass
+
+
+def _header_size(columns):
+    return HEADER.size + COLUMN.size * columns
+
+
+def write_binary(path, items, generation=0):
+    # Writes (key, record) pairs, keys increasing, through a temporary file
+    # renamed over path. Returns the number of bytes written.
+    keys = array("Q")
+    values = [[] for _ in FIELDS]
+    for key, record in items:
+        keys.append(key)
+        for column, value in zip(values, record):
+            column.append(value.encode("utf-8"))
+    body = [keys.tobytes()]
+    position = _header_size(len(FIELDS)) + len(body[0])
+    tables = []
+    for column in values:
+        table = array("I", accumulate(map(len, column), initial=0)).tobytes()
+        table += bytes(-len(table) % 8)
+        tables.append(position)
+        body.append(table)
+        position += len(table)
+    columns = []
+    for offsets, column in zip(tables, values):
+        data = b"".join(column)
+        columns.append(COLUMN.pack(offsets, position, len(data)))
+        body.append(data)
+        position += len(data)
+
+    crc = 0
+    for part in body:
+        crc = zlib.crc32(part, crc)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(FIELDS), len(keys), generation, crc))
+        f.writelines(columns)
+        f.writelines(body)
+        f.flush()
+        os.fsync(f.fileno())
+        size = f.tell()
+    os.replace(tmp, path)
+    return size
+
+
+def read_generation(path):
+    # Journal generation folded into a data file, read from the header only
+    try:
+        with open(path, "rb") as f:
+            header = f.read(HEADER.size)
+    except FileNotFoundError:
+        return 0
+    if len(header) < HEADER.size or header[:4] != MAGIC:
+        return 0
+    return HEADER.unpack(header)[4]
+
+
+class MappedFile:
+    # Read-only view of a data file through mmap. Opening only reads the
+    # header and the column table; the pages of a row are read when one of
+    # its fields is decoded. verify() checks the whole body against the CRC.
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        mm = self._mmap
+        if len(mm) < HEADER.size:
+            raise FormatError(f"{path}: en-tête tronqué")
+        magic, version, columns, self.rows, self.generation, self.crc = HEADER.unpack_from(mm)
+        if magic != MAGIC:
+            raise FormatError(f"{path}: fichier de données inconnu")
+        if version != VERSION or columns != len(FIELDS):
+            raise FormatError(f"{path}: version {version} non prise en charge")
+        start = _header_size(columns)
+        tables = [COLUMN.unpack_from(mm, HEADER.size + COLUMN.size * i) for i in range(columns)]
+        if start + 8 * self.rows > len(mm) or tables[-1][1] + tables[-1][2] != len(mm):
+            raise FormatError(f"{path}: fichier tronqué")
+        self._start = start
+        view = memoryview(mm)
+        self.keys = view[start:start + 8 * self.rows].cast("Q")
+        self._columns = [(view[offsets:offsets + 4 * (self.rows + 1)].cast("I"), data)
+                         for offsets, data, _ in tables]
+
+    def verify(self):
+        if zlib.crc32(memoryview(self._mmap)[self._start:]) != self.crc:
+            raise FormatError(f"{self.path}: somme de contrôle invalide")
+
+    def field(self, row, column):
+        offsets, data = self._columns[column]
+        return self._mmap[data + offsets[row]:data + offsets[row + 1]].decode("utf-8")
+
+    def record(self, row):
+        mm = self._mmap
+        return Employee(mm[data + offsets[row]:data + offsets[row + 1]].decode("utf-8")
+                        for offsets, data in self._columns)
+
+    def row_of(self, key):
+        row = bisect_left(self.keys, key)
+        if row < self.rows and self.keys[row] == key:
+            return row
+        return None
+
+    def close(self):
+        # The views have to be released before the map can be closed
+        self.keys.release()
+        for offsets, _ in self._columns:
+            offsets.release()
+        self._columns = []
+        self._mmap.close()
+
+
+class LazyRows(MutableMapping):
+    # key -> record mapping for EmployeeStore.load_rows(): the rows of a
+    # mapped file, decoded on access, plus the changes made since, held in
+    # memory. Keys above those of the file are rows added since; iteration
+    # follows key order, like a store loaded from storage.
+    def __init__(self, mapped):
+        self.mapped = mapped
+        self._changed = {}  # key -> record, rows updated or added
+        self._removed = set()  # Keys of file rows removed
+        self._cache = {}
+        self._base = mapped.keys[-1] + 1 if mapped.rows else 0
+        self._bound = self._base
+        self._len = mapped.rows
+
+    @property
+    def key_bound(self):
+        return self._bound
+
+    def __getitem__(self, key):
+        record = self._changed.get(key)
+        if record is None:
+            record = self._cache.get(key)
+        if record is None:
+            row = self._row(key)
+            if row is None:
+                raise KeyError(key)
+            if len(self._cache) >= CACHE:
+                self._cache.clear()
+            record = self._cache[key] = self.mapped.record(row)
+        return record
+
+    def __setitem__(self, key, record):
+        if key not in self:
+            self._len += 1
+            self._bound = max(self._bound, key + 1)
+        self._changed[key] = record
+        self._removed.discard(key)
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self._changed.pop(key, None)
+        if key < self._base:
+            self._removed.add(key)
+            self._cache.pop(key, None)
+        self._len -= 1
+
+    def __contains__(self, key):
+        return key in self._changed or self._row(key) is not None
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        removed = self._removed
+        for key in self.mapped.keys:
+            if key not in removed:
+                yield key
+        yield from sorted(key for key in self._changed if key >= self._base)
+
+    def column(self, index):
+        # (key, value) pairs of one field, decoding nothing else
+        mapped = self.mapped
+        removed = self._removed
+        changed = self._changed
+        for row, key in enumerate(mapped.keys):
+            if key in changed:
+                yield key, changed[key][index]
+            elif key not in removed:
+                yield key, mapped.field(row, index)
+        for key in sorted(key for key in changed if key >= self._base):
+            yield key, changed[key][index]
+
+    def _row(self, key):
+        if key in self._removed or not isinstance(key, int) or key >= self._base:
+            return None
+        return self.mapped.row_of(key)
+
+
+class _Empty:
+    # Stands for a data file that doesn't exist yet
+    rows = 0
+    keys = ()
+
+    def row_of(self, key):
+        return None
+
+
+class BinaryStorage(JournaledTextStorage):
+    # Journaled storage over the binary format: changes are appended to the
+    # journal like with the text file, compaction writes a new data file with
+    # the generation folded in stored in its header. rows() maps the file for
+    # EmployeeStore.load_rows(), so opening a large roster costs about the
+    # same as opening an empty one. Windows can't replace a mapped file: the
+    # new one is then written next to it as ".pending" and moved in place
+    # when the storage is next opened.
+    def __init__(self, path, threshold=1 << 20):
+        pending = path + ".pending"
+        if os.path.exists(pending):
+            os.replace(pending, path)
+        self.mapped = None
+        super().__init__(path, threshold)
+
+    def rows(self):
+        # Lazy rows of the data file with the journal replayed on top. The
+        # CRC is not checked here, that would read the whole file: a corrupt
+        # body shows when its rows are decoded (load() does check it).
+        if self.mapped is not None:
+            self.mapped.close()  # Mapping of an earlier load
+        path = self._data_path()
+        self.mapped = MappedFile(path) if os.path.exists(path) else None
+        rows = LazyRows(self.mapped or _Empty())
+        replay = EmployeeStore()
+        replay.load_rows(rows)
+        self._replay(replay)
+        return rows
+
+    def load_into(self, store):
+        # Mapped, rows decode when they are used
+        store.load_rows(self.rows())
+
+    def load(self):
+        # Every row decoded, as (key, record) pairs
+        store = EmployeeStore()
+        path = self._data_path()
+        if os.path.exists(path):
+            mapped = MappedFile(path)
+            try:
+                mapped.verify()
+                store.load_items((key, mapped.record(row)) for row, key in enumerate(mapped.keys))
+            finally:
+                mapped.close()
+        self._replay(store)
+        return list(store.items())
+
+    def replace_all(self, pairs):
+        self._wait_compaction()
+        folded = self._rotate()
+        self._compact(list(pairs), folded)
+
+    def snapshot(self):
+        # Only the journal rotation happens on the caller's thread: the rows
+        # as of the rotation are rebuilt from the files by the writer
+        return None, self._rotate()
+
+    def close(self):
+        super().close()
+        if self.mapped is not None:
+            self.mapped.close()
+            self.mapped = None
+
+    def _replay(self, store, folded=None):
+        base = self._base_generation()
+        for generation in self._generations():
+            if generation > base and (folded is None or generation <= folded):
+                for entry in read_journal(self._journal_path(generation)):
+                    apply_entry(store, entry)
+
+    def _compact(self, items, folded):
+        with self._compact_lock:
+            if folded <= self._folded:
+                return 0
+            if items is None:
+                items = self._fold(folded)
+            target = self.path
+            if self.mapped is not None and os.name == "nt":
+                target = self.path + ".pending"
+            size = write_binary(target, items, folded)
+            self._folded = folded
+            for generation in self._generations():
+                if generation <= folded:
+                    os.remove(self._journal_path(generation))
+        return size
+
+    def _fold(self, folded):
+        # (key, record) pairs at the end of generation `folded`: the data file
+        # with the closed journals up to it replayed, on the compaction
+        # thread. Decoded before the file is replaced, Windows can't replace
+        # a mapped file.
+        path = self._data_path()
+        mapped = MappedFile(path) if os.path.exists(path) else None
+        try:
+            store = EmployeeStore()
+            store.load_rows(LazyRows(mapped or _Empty()))
+            self._replay(store, folded)
+            return list(store.items())
+        finally:
+            if mapped is not None:
+                mapped.close()
+
+    def _data_path(self):
+        pending = self.path + ".pending"
+        return pending if os.path.exists(pending) else self.path
+
+    def _base_generation(self):
+        return read_generation(self._data_path())
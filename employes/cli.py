@@ -0,0 +1,275 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+
+from .backups import BACKUP_DIR, KEEP, BackupStore
+from .columns import ColumnarRows
+from .exporter import Export
+from .importer import CsvImport
+from .jobs import JobQueue
+from .metrics import metrics
+from .pdfreport import PdfReport
+from .restore import apply_restore, plan_restore
+from .search import SearchIndex
+from .shared import SharedTextStorage
+from .stats import AGE_MIN, AGE_STEP, DashboardStats, age_bins
+from .storage import DATA_FILE, STORAGE_FILE, SqliteStorage, open_storage
+from .store import FIELDS, EmployeeStore
+from .validation import DataValidator, ValidationReport
+
+# Command-line front end for batch jobs: the storage, validation, export and
+# backup engines of the application without Tk or matplotlib, so it runs on
+# servers with no display. Run as `python -m gestion_des_employes <command>`.
+
+
+def open_store(path):
+    # The same storage setup as the application
+    storage = open_storage(path)
+    if isinstance(storage, SqliteStorage):
+        storage.migrate_text(DATA_FILE)
+    store = EmployeeStore(rows=ColumnarRows)
+    storage.attach(store)
+    storage.load_into(store)
+    return store, storage
+
+
+class Progress:
+    # One self-overwriting status line on stderr, only when it is a terminal
+    def __init__(self, quiet=False):
+        self.enabled = not quiet and sys.stderr.isatty()
+        self._shown = 0
+
+    def show(self, text):
+        now = time.monotonic()
+        if self.enabled and now - self._shown >= 0.2:
+            self._shown = now
+            print("\r" + text, end="", file=sys.stderr, flush=True)
+
+    def done(self):
+        if self.enabled and self._shown:
+            print(file=sys.stderr)
+
+
+def run_job(title, target, total=None, progress=None):
+    # Runs target(job) on a JobQueue and waits for it. Ctrl+C cancels it.
+    jobs = JobQueue(workers=1)
+    job = jobs.submit(title, target, total=total)
+    try:
+        while job.state not in ("done", "failed", "cancelled"):
+            try:
+                time.sleep(0.1)
+            except KeyboardInterrupt:
+                job.cancel()
+            jobs.poll()
+            if progress is not None and job.state == "running":
+                progress.show(f"{title}: {job.done}/{job.total or '?'} ({job.rate():.0f} lignes/s)")
+    finally:
+        jobs.stop()
+        if progress is not None:
+            progress.done()
+    if job.error is not None:
+        raise job.error
+    return job.result
+
+
+def selected_keys(store, query):
+    if not query:
+        return store.keys()
+    return SearchIndex(store).search(query) or []
+
+
+def cmd_import(args, store, storage):
+    # Chunks are committed one transaction each, as in the application. The
+    # validator remembers what it saw, so duplicates within the file and
+    # against the stored rows are left out.
+    job = CsvImport(args.file, None if args.no_validate else DataValidator(store))
+    progress = Progress(args.quiet)
+    report = ValidationReport()
+    rows = 0
+    start = time.perf_counter()
+    job.start()
+    try:
+        while True:
+            item = job.chunks.get()
+            if item[0] == "done":
+                break
+            if item[0] == "error":
+                raise item[1]
+            _, records, chunk_report, position = item
+            with storage.transaction():
+                rows += len(store.extend(records))
+            if isinstance(storage, SharedTextStorage) and storage.pending:
+                storage.sync()  # Other instances wrote meanwhile, merge before appending
+            report.merge(chunk_report)
+            progress.show(f"Importation: {position * 100 // max(job.size, 1)}% ({rows} lignes)")
+    except KeyboardInterrupt:
+        job.cancel()
+    progress.done()
+    metrics.record("import", time.perf_counter() - start, rows, job.size)
+    print(f"{rows} employés importés depuis {args.file} en {time.perf_counter() - start:.1f} s")
+    if report.errors:
+        print(f"{len(report)} lignes invalides ignorées:\n" + report.format(args.errors), file=sys.stderr)
+        return 1 if args.strict else 0
+    return 0
+
+
+def cmd_export(args, store, storage):
+    keys = selected_keys(store, args.query)
+    records = map(store.get, keys)
+    columns = FIELDS if args.all_fields else FIELDS[:4]
+    if args.file.lower().endswith(".pdf"):
+        target = PdfReport(args.file, records, len(keys), columns=columns).run
+    else:
+        target = Export(args.file, records, len(keys), columns=columns).run
+    rows = run_job("Export", target, len(keys), Progress(args.quiet))
+    if rows is None:
+        print("Export annulé", file=sys.stderr)
+        return 1
+    print(f"{rows} lignes exportées vers {args.file}")
+    return 0
+
+
+def cmd_search(args, store, storage):
+    keys = selected_keys(store, args.query)
+    if args.limit:
+        keys = keys[:args.limit]
+    if args.json:
+        for key in keys:
+            print(json.dumps(dict(zip(FIELDS, store.get(key))), ensure_ascii=False))
+    else:
+        writer = csv.writer(sys.stdout)
+        writer.writerow(FIELDS)
+        writer.writerows(map(store.get, keys))
+    return 0
+
+
+def cmd_stats(args, store, storage):
+    stats = DashboardStats(store)
+    mean = stats.mean_age()
+    edges = age_bins()
+    # The outer bins are open-ended: the first one counts every age under AGE_MIN
+    labels = [f"<{AGE_MIN}"] + [f"{edge}-{edge + AGE_STEP - 1}" for edge in edges[1:-1]] + [f"{edges[-1]}+"]
+    histogram = dict(zip(labels, stats.age_histogram()))
+    if args.json:
+        print(json.dumps({"count": stats.count, "mean_age": mean, "ages": histogram,
+                          "departments": dict(stats.departments.most_common())}, ensure_ascii=False))
+        return 0
+    print(f"Employés: {stats.count}")
+    print(f"Âge moyen: {mean:.1f}" if mean is not None else "Âge moyen: -")
+    for label, count in histogram.items():
+        print(f"  {label:>7} ans: {count}")
+    for department, count in stats.departments.most_common():
+        print(f"  {department}: {count}")
+    return 0
+
+
+def cmd_backup(args, store, storage):
+    backups = BackupStore(args.dir)
+    manifest = backups.create(store.items())
+    backups.prune(args.keep)
+    if manifest["written"]:
+        print(f"Backup créé: {manifest['name']} ({manifest['written'] / 1024:.1f} Ko écrits)")
+    else:
+        print("Backup inchangé depuis le précédent")
+    return 0
+
+
+def cmd_restore(args, store, storage):
+    backups = BackupStore(args.dir)
+    if args.list or not args.snapshot:
+        for name in backups.snapshots():
+            print(name)
+        return 0
+    if os.path.isfile(args.snapshot):
+        # Older full-copy backups, matched by content
+        source = open_storage(args.snapshot, shared=False)
+        try:
+            items, keyed = list(source.load()), False
+        finally:
+            source.close()
+    else:
+        items, keyed = backups.load(args.snapshot), True
+    plan = plan_restore(dict(store.items()), items, store.version, keyed=keyed)
+    report = DataValidator().check(list(plan.snapshot.records()))
+    if report.errors:
+        print(f"Attention: {len(report)} lignes du backup sont invalides", file=sys.stderr)
+    if not len(plan):
+        print("Les données sont déjà identiques à ce backup")
+        return 0
+    print(f"Restauration de {args.snapshot}: {plan.summary()}")
+    if not args.yes:
+        print("Aucune modification faite, relancer avec --yes pour appliquer")
+        return 0
+    apply_restore(store, storage, plan)
+    print("Restauration terminée")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m gestion_des_employes",
+                                     description="Gestion des employés en ligne de commande")
+    parser.add_argument("--storage", default=STORAGE_FILE,
+                        help=f"fichier de données (.db, .txt ou .emp, défaut: {STORAGE_FILE})")
+    parser.add_argument("-q", "--quiet", action="store_true", help="pas d'affichage de progression")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser("import", help="importer un fichier CSV")
+    command.add_argument("file")
+    command.add_argument("--no-validate", action="store_true",
+                         help="ne pas valider ni dédoublonner les lignes")
+    command.add_argument("--strict", action="store_true",
+                         help="code de sortie 1 si des lignes sont ignorées")
+    command.add_argument("--errors", type=int, default=20, help="lignes invalides affichées")
+    command.set_defaults(run=cmd_import)
+
+    command = commands.add_parser("export", help="exporter en CSV, JSON Lines (.gz) ou PDF")
+    command.add_argument("file")
+    command.add_argument("--query", help="n'exporter que les résultats de cette recherche")
+    command.add_argument("--all-fields", action="store_true", help="inclure le département")
+    command.set_defaults(run=cmd_export)
+
+    command = commands.add_parser("search", help="rechercher des employés (CSV sur la sortie)")
+    command.add_argument("query")
+    command.add_argument("--limit", type=int, default=0)
+    command.add_argument("--json", action="store_true", help="une ligne JSON par employé")
+    command.set_defaults(run=cmd_search)
+
+    command = commands.add_parser("stats", help="statistiques du tableau de bord")
+    command.add_argument("--json", action="store_true")
+    command.set_defaults(run=cmd_stats)
+
+    command = commands.add_parser("backup", help="créer un backup incrémental")
+    command.add_argument("--dir", default=BACKUP_DIR)
+    command.add_argument("--keep", type=int, default=KEEP, help="backups conservés")
+    command.set_defaults(run=cmd_backup)
+
+    command = commands.add_parser("restore", help="lister ou restaurer un backup")
+    command.add_argument("snapshot", nargs="?", help="nom du backup ou fichier d'un ancien backup")
+    command.add_argument("--list", action="store_true")
+    command.add_argument("--dir", default=BACKUP_DIR)
+    command.add_argument("--yes", action="store_true", help="appliquer sans confirmation")
+    command.set_defaults(run=cmd_restore)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        store, storage = open_store(args.storage)
+    except (OSError, ValueError) as e:
+        print(f"Erreur: {e}", file=sys.stderr)
+        return 1
+    try:
+        return args.run(args, store, storage)
+    except (OSError, ValueError) as e:
+        print(f"Erreur: {e}", file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        return 130
+    finally:
+        storage.close()
+        if os.environ.get("EMPLOYES_METRICS"):
+            metrics.dump(os.environ["EMPLOYES_METRICS"])
@@ -0,0 +1,190 @@
+from array import array
+from collections import Counter
+from collections.abc import MutableMapping
+from heapq import merge
+from itertools import compress
+
+from .store import Employee
+
+NAME, CIN, YEAR, ID, DEPT = range(5)
+REPACK = 1 << 20  # Bytes of replaced names tolerated before the name buffer is rewritten
+
+
+def pack_cin(value):
+    # "AB123456" -> (A * 26 + B) * 10**6 + 123456, or None
+    if (len(value) == 8 and value.isascii() and value[:2].isupper() and value[:2].isalpha()
+            and value[2:].isdigit()):
+        return ((ord(value[0]) - 65) * 26 + ord(value[1]) - 65) * 1000000 + int(value[2:])
+    return None
+
+
+def unpack_cin(packed):
+    letters, number = divmod(packed, 1000000)
+    first, second = divmod(letters, 26)
+    return f"{chr(65 + first)}{chr(65 + second)}{number:06d}"
+
+
+def pack_id(value):
+    # "EMP-2024-001" -> 2024 * 1000 + 1, or None
+    if (len(value) == 12 and value.isascii() and value.startswith("EMP-") and value[8] == "-"
+            and value[4:8].isdigit() and value[9:].isdigit()):
+        return int(value[4:8]) * 1000 + int(value[9:])
+    return None
+
+
+def unpack_id(packed):
+    year, number = divmod(packed, 1000)
+    return f"EMP-{year:04d}-{number:03d}"
+
+
+def pack_year(value):
+    if value.isascii() and value.isdigit() and value[0] != "0" and int(value) < 1 << 16:
+        return int(value)
+    return None
+
+
+class ColumnarRows(MutableMapping):
+    # key -> record mapping for EmployeeStore(rows=ColumnarRows), stored by
+    # column instead of one tuple of strings per row. Columns are arrays
+    # indexed by key (keys are small increasing ints): names are UTF-8 in
+    # one buffer, CINs and IDs are packed into 32-bit ints, years are
+    # array('H') and departments indexes into a list of the distinct names.
+    # That is about 25 bytes plus the name per row. Rows with a field that
+    # doesn't fit its packed format (rare once validated) are kept as records.
+    # Records are rebuilt on access, as Employee tuples.
+    def __init__(self):
+        self._text = (bytearray(), array("Q"), array("I"))  # Names, start and length by key
+        self._cins = array("I")
+        self._years = array("H")
+        self._ids = array("I")
+        self._depts = array("H")
+        self._dept_names = []
+        self._dept_index = {}
+        self._packed = bytearray()  # 1 where the key is a packed row
+        self._other = {}  # key -> record, rows that don't pack
+        self._len = 0
+        self._garbage = 0  # Bytes of names no longer referenced
+
+    @property
+    def key_bound(self):
+        return len(self._packed)
+
+    def __getitem__(self, key):
+        if key < len(self._packed) and self._packed[key]:
+            names, starts, lengths = self._text
+            start = starts[key]
+            return Employee((names[start:start + lengths[key]].decode("utf-8"),
+                             unpack_cin(self._cins[key]), str(self._years[key]),
+                             unpack_id(self._ids[key]), self._dept_names[self._depts[key]]))
+        return self._other[key]
+
+    def __setitem__(self, key, record):
+        if key not in self:
+            self._len += 1
+        self._discard(key)
+        cin, year, emp_id = pack_cin(record[CIN]), pack_year(record[YEAR]), pack_id(record[ID])
+        dept = self._dept(record[DEPT])
+        self._grow(key + 1)
+        if cin is None or year is None or emp_id is None or dept is None:
+            self._other[key] = record
+            return
+        names, starts, lengths = self._text
+        name = record[NAME].encode("utf-8")
+        starts[key] = len(names)
+        lengths[key] = len(name)
+        names += name
+        self._cins[key] = cin
+        self._years[key] = year
+        self._ids[key] = emp_id
+        self._depts[key] = dept
+        self._packed[key] = 1
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self._discard(key)
+        self._len -= 1
+
+    def __contains__(self, key):
+        return key in self._other or (isinstance(key, int) and 0 <= key < len(self._packed)
+                                      and self._packed[key] == 1)
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        return merge(compress(range(len(self._packed)), self._packed), sorted(self._other))
+
+    def clear(self):
+        self.__init__()
+
+    def column(self, index):
+        # (key, value) pairs of one field, in key order
+        packed = self._packed
+        keys = compress(range(len(packed)), packed)
+        if index == NAME:
+            names, starts, lengths = self._text
+            values = (names[starts[key]:starts[key] + lengths[key]].decode("utf-8")
+                      for key in compress(range(len(packed)), packed))
+        elif index == CIN:
+            values = map(unpack_cin, compress(self._cins, packed))
+        elif index == YEAR:
+            values = map(str, compress(self._years, packed))
+        elif index == ID:
+            values = map(unpack_id, compress(self._ids, packed))
+        else:
+            values = map(self._dept_names.__getitem__, compress(self._depts, packed))
+        other = sorted((key, record[index]) for key, record in self._other.items())
+        return merge(zip(keys, values), other)
+
+    def counts(self, index):
+        # Counter of one field's values. Years and departments are counted
+        # on their arrays, only the distinct values are turned into strings.
+        if index == YEAR:
+            counts = Counter({str(year): n for year, n in Counter(compress(self._years, self._packed)).items()})
+        elif index == DEPT:
+            counts = Counter({self._dept_names[dept]: n
+                              for dept, n in Counter(compress(self._depts, self._packed)).items()})
+        else:
+            return Counter(value for _, value in self.column(index))
+        counts.update(record[index] for record in self._other.values())
+        return counts
+
+    def _dept(self, value):
+        index = self._dept_index.get(value)
+        if index is None:
+            if len(self._dept_names) >= 1 << 16:
+                return None
+            index = self._dept_index[value] = len(self._dept_names)
+            self._dept_names.append(value)
+        return index
+
+    def _grow(self, size):
+        missing = size - len(self._packed)
+        if missing <= 0:
+            return
+        _, starts, lengths = self._text
+        for column in (starts, lengths, self._cins, self._years, self._ids, self._depts):
+            column.frombytes(bytes(missing * column.itemsize))
+        self._packed += bytes(missing)
+
+    def _discard(self, key):
+        if key in self._other:
+            del self._other[key]
+        elif key < len(self._packed) and self._packed[key]:
+            self._packed[key] = 0
+            self._garbage += self._text[2][key]
+            if self._garbage > REPACK and self._garbage > len(self._text[0]) // 2:
+                self._repack()
+
+    def _repack(self):
+        # Rewrites the name buffer without the replaced names. The new buffer
+        # and offsets replace the old ones in one assignment, so a reader on
+        # another thread sees either the old or the new set.
+        names, starts, lengths = self._text
+        buffer, new_starts = bytearray(), array("Q", bytes(len(starts) * 8))
+        for key in compress(range(len(self._packed)), self._packed):
+            new_starts[key] = len(buffer)
+            buffer += names[starts[key]:starts[key] + lengths[key]]
+        self._text = (buffer, new_starts, array("I", lengths))
+        self._garbage = 0
@@ -0,0 +1,74 @@
+import csv
+import gzip
+import json
+import os
+from itertools import islice
+
+from .store import COLUMNS
+
+CHUNK = 10000  # Records written between two progress reports
+
+
+def export_format(path):
+    # "csv" or "jsonl" from the extension, a trailing .gz means gzip
+    base = path[:-3] if path.lower().endswith(".gz") else path
+    if os.path.splitext(base)[1].lower() in (".jsonl", ".ndjson", ".json"):
+        return "jsonl"
+    return "csv"
+
+
+class Export:
+    # Streams records to CSV or JSON Lines, gzip-compressed when the path ends
+    # in .gz. Meant to run as a JobQueue job: run(job) consumes `records`
+    # CHUNK at a time, so memory use doesn't grow with the export, and
+    # reports the rows written after each chunk. The file is written under a
+    # temporary name and renamed once complete.
+    def __init__(self, path, records, total=None, columns=COLUMNS, chunk=CHUNK):
+        self.path = path
+        self.records = records
+        self.total = total
+        self.columns = columns
+        self.chunk = chunk
+        self.format = export_format(path)
+
+    def _open(self, path):
+        if self.path.lower().endswith(".gz"):
+            return gzip.open(path, "wt", encoding="utf-8", newline="", compresslevel=6)
+        return open(path, "w", encoding="utf-8", newline="")
+
+    def run(self, job):
+        # Returns the number of rows written, or None once cancelled
+        tmp = self.path + ".tmp"
+        rows = 0
+        width = len(self.columns)
+        try:
+            with self._open(tmp) as f:
+                if self.format == "csv":
+                    writer = csv.writer(f)
+                    writer.writerow(self.columns)
+                    write = writer.writerows
+                else:
+                    encode = json.JSONEncoder(ensure_ascii=False).encode
+                    columns = self.columns
+
+                    def write(chunk):
+                        f.writelines(encode(dict(zip(columns, record))) + "\n" for record in chunk)
+
+                records = iter(self.records)
+                while not job.cancelled:
+                    chunk = [record[:width] for record in islice(records, self.chunk)]
+                    if not chunk:
+                        break
+                    write(chunk)
+                    rows += len(chunk)
+                    job.report(rows)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        if job.cancelled:
+            os.remove(tmp)
+            return None
+        os.replace(tmp, self.path)
+        job.nbytes = os.path.getsize(self.path)
+        return rows
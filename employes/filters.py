@@ -0,0 +1,110 @@
+from itertools import compress
+
+YEAR, DEPT = 2, 4  # Record positions of Année and Département
+
+FLAGS = bytes.maketrans(b"01", b"\x00\x01")
+
+
+def _set_bit(bitmaps, value, key):
+    bitmap = bitmaps.get(value)
+    if bitmap is None:
+        bitmap = bitmaps[value] = bytearray()
+    index = key >> 3
+    if index >= len(bitmap):
+        bitmap.extend(bytes(index - len(bitmap) + 1))
+    bitmap[index] |= 1 << (key & 7)
+
+
+def _clear_bit(bitmaps, value, key):
+    bitmap = bitmaps.get(value)
+    if bitmap is not None and (key >> 3) < len(bitmap):
+        bitmap[key >> 3] &= ~(1 << (key & 7)) & 0xFF
+
+
+def _to_int(bitmap):
+    return int.from_bytes(bitmap, "little")
+
+
+class FilterEngine:
+    # Per-value bitmaps over store keys for Année and Département. A filter
+    # is the AND of one OR per field, computed on Python ints, so combining
+    # criteria costs a few big-int operations instead of a pass over the rows.
+    def __init__(self, store):
+        self.store = store
+        self._years = {}
+        self._depts = {}
+        self._built = False
+        self._cache = {}
+        store.subscribe(self._on_change)
+
+    def select(self, year=None, year_from=None, year_to=None, dept=None):
+        # Returns the matching bitmap as an int, or None when nothing is filtered
+        criteria = (year or None, year_from or None, year_to or None, dept or None)
+        if criteria == (None, None, None, None):
+            return None
+        cached = self._cache.get(criteria)
+        if cached is not None:
+            return cached
+        self._ensure_built()
+
+        result = -1
+        if year:
+            result &= _to_int(self._years.get(str(year), b""))
+        if year_from or year_to:
+            low = int(year_from) if year_from else -1
+            high = int(year_to) if year_to else 10 ** 6
+            span = 0
+            for value, bitmap in self._years.items():
+                if value.isdigit() and low <= int(value) <= high:
+                    span |= _to_int(bitmap)
+            result &= span
+        if dept:
+            # Rows without a department are never filtered out
+            result &= _to_int(self._depts.get(dept, b"")) | _to_int(self._depts.get("", b""))
+        if result == -1:
+            result = 0
+        self._cache[criteria] = result
+        return result
+
+    def keys(self, bitmap):
+        # Decode a bitmap into store keys, in key (= store) order. The binary
+        # string is reversed so that character i is bit i.
+        bits = bin(bitmap)[:1:-1]
+        if bits.count("1") * 20 < len(bits):
+            # Sparse: jump from one set bit to the next
+            keys = []
+            index = bits.find("1")
+            while index != -1:
+                keys.append(index)
+                index = bits.find("1", index + 1)
+            return keys
+        return list(compress(range(len(bits)), bits.encode().translate(FLAGS)))
+
+    def restrict(self, keys, bitmap):
+        # Keep the keys set in bitmap, preserving the order of keys
+        flags = bin(bitmap)[:1:-1].encode().translate(FLAGS).ljust(self.store.key_bound, b"\x00")
+        return [key for key in keys if flags[key]]
+
+    def _ensure_built(self):
+        if self._built:
+            return
+        self._years = {}
+        self._depts = {}
+        for key, value in self.store.column(YEAR):
+            _set_bit(self._years, value, key)
+        for key, value in self.store.column(DEPT):
+            _set_bit(self._depts, value, key)
+        self._built = True
+
+    def _on_change(self, op, key, old, new):
+        self._cache.clear()
+        if not self._built:
+            return
+        if old is not None:
+            _clear_bit(self._years, old[YEAR], key)
+            _clear_bit(self._depts, old[DEPT], key)
+        if new is not None:
+            _set_bit(self._years, new[YEAR], key)
+            _set_bit(self._depts, new[DEPT], key)
+        if op == "reset":
+            self._built = False
@@ -0,0 +1,77 @@
+import csv
+import io
+import os
+import queue
+import threading
+from itertools import islice
+
+from .store import make_record
+from .validation import ValidationReport
+
+CHUNK = 5000  # Records per chunk handed to the UI
+
+
+class CsvImport:
+    # Parses and validates a CSV file on a worker thread. Chunks go through a
+    # small bounded queue, so memory stays flat whatever the file size and the
+    # parser waits whenever the UI falls behind. Queue items are
+    # ("chunk", records, report, position), then ("done",) or ("error", exc);
+    # the ValidationReport lists the rows left out by CSV line number.
+    def __init__(self, path, validator=None, chunk=CHUNK):
+        self.path = path
+        self.validator = validator
+        self.chunk = chunk
+        self.size = os.path.getsize(path)
+        self.chunks = queue.Queue(maxsize=4)
+        self._cancelled = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="csv-import", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def _put(self, item):
+        while not self._cancelled.is_set():
+            try:
+                self.chunks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _run(self):
+        try:
+            with open(self.path, "rb") as raw:
+                # Progress comes from the binary position, the text layer
+                # doesn't allow tell() while iterating
+                reader = csv.reader(io.TextIOWrapper(raw, encoding="utf-8-sig", newline=""))
+                next(reader, None)  # Header
+                line = 2
+                while not self._cancelled.is_set():
+                    rows = list(islice(reader, self.chunk))
+                    if not rows:
+                        break
+                    lines = []
+                    records = []
+                    for offset, values in enumerate(rows):
+                        if any(values):
+                            lines.append(line + offset)
+                            records.append(make_record(values))
+                    line += len(rows)
+                    report = ValidationReport()
+                    if self.validator is not None:
+                        report = self.validator.check(records, lines)
+                        if report.errors:
+                            records = [record for line, record in zip(lines, records)
+                                       if line not in report]
+                    if not self._put(("chunk", records, report, raw.tell())):
+                        return
+            self._put(("done",))
+        except Exception as e:
+            self._put(("error", e))
@@ -0,0 +1,164 @@
+import heapq
+import itertools
+import os
+import queue
+import threading
+import time
+
+from .metrics import metrics
+
+HIGH, NORMAL, LOW = 0, 1, 2  # Job priorities, lower runs first
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    # One piece of background work. target(job) runs on a JobQueue worker
+    # thread, reports progress with report() and checks `cancelled` (or calls
+    # check()) between steps; its return value becomes `result`. `state` goes
+    # "queued" -> "running" -> "done", "failed" or "cancelled". Finished jobs
+    # are recorded in the metrics as "job:<title>" with `done` rows and the
+    # `nbytes` a target reports having read or written.
+    def __init__(self, jobs, title, target, priority, total, on_done):
+        self.id = next(jobs._ids)
+        self.title = title
+        self.target = target
+        self.priority = priority
+        self.total = total
+        self.on_done = on_done
+        self.state = "queued"
+        self.done = 0
+        self.nbytes = 0
+        self.result = None
+        self.error = None
+        self.started = None
+        self.finished = None
+        self._events = jobs.events
+        self._cancelled = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def check(self):
+        if self._cancelled.is_set():
+            raise JobCancelled()
+
+    def report(self, done, total=None):
+        self.done = done
+        if total is not None:
+            self.total = total
+        self._events.put(("progress", self))
+
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.perf_counter()) - self.started
+
+    def rate(self):
+        # Progress units (rows) per second since the job started
+        return self.done / max(self.elapsed(), 1e-6)
+
+
+class JobQueue:
+    # Runs jobs on a few worker threads, highest priority first and in
+    # submission order within a priority. CPU-bound jobs can share the
+    # process pool from process_pool(). State changes are queued as
+    # (event, job) in `events` for the UI thread: poll() drains them and
+    # runs the on_done(result) callbacks of the jobs that succeeded.
+    def __init__(self, workers=3):
+        self.events = queue.Queue()
+        self.active = {}  # job id -> job, queued or running
+        self._ids = itertools.count(1)
+        self._heap = []
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._pool = None
+        self._threads = [threading.Thread(target=self._run, name=f"job-worker-{i}", daemon=True)
+                         for i in range(workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, title, target, priority=NORMAL, total=None, on_done=None):
+        job = Job(self, title, target, priority, total, on_done)
+        self.active[job.id] = job
+        with self._cond:
+            heapq.heappush(self._heap, (priority, job.id, job))
+            self._cond.notify()
+        self.events.put(("queued", job))
+        return job
+
+    def busy(self):
+        return bool(self.active) or not self.events.empty()
+
+    def poll(self):
+        # Call from the UI thread. Returns the jobs whose state changed.
+        changed = {}
+        while True:
+            try:
+                event, job = self.events.get_nowait()
+            except queue.Empty:
+                break
+            changed[job.id] = job
+            if event == "finished":
+                self.active.pop(job.id, None)
+                if job.state == "done" and job.on_done is not None:
+                    job.on_done(job.result)
+        return list(changed.values())
+
+    def process_pool(self):
+        # Shared by the jobs that render in other processes, created on first use
+        with self._cond:
+            if self._pool is None:
+                from concurrent.futures import ProcessPoolExecutor
+                self._pool = ProcessPoolExecutor(max(1, (os.cpu_count() or 2) - 1))
+            return self._pool
+
+    def cancel_all(self):
+        for job in list(self.active.values()):
+            job.cancel()
+
+    def stop(self):
+        self.cancel_all()
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)  # Running chunks are short
+
+    def _next(self):
+        with self._cond:
+            while not self._heap and not self._stopped:
+                self._cond.wait()
+            if self._stopped:
+                return None
+            return heapq.heappop(self._heap)[2]
+
+    def _run(self):
+        while True:
+            job = self._next()
+            if job is None:
+                return
+            job.started = time.perf_counter()
+            if not job.cancelled:
+                job.state = "running"
+                self.events.put(("started", job))
+                try:
+                    job.result = job.target(job)
+                except JobCancelled:
+                    pass
+                except Exception as e:
+                    job.error = e
+            job.finished = time.perf_counter()
+            if job.cancelled:
+                job.state = "cancelled"
+            else:
+                job.state = "failed" if job.error is not None else "done"
+                metrics.record("job:" + job.title, job.elapsed(), job.done, job.nbytes)
+            self.events.put(("finished", job))
@@ -0,0 +1,239 @@
+import glob
+import json
+import os
+import threading
+
+from .storage import TextStorage
+from .store import EmployeeStore, make_record, read_employees, write_employees
+
+HEADER = "# journal: "  # First line of a compacted file: last journal folded in
+
+
+def read_journal(path):
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.endswith("\n"):
+                break  # Torn last write after a crash
+            yield json.loads(line)
+
+
+def apply_entry(store, entry):
+    # Updates and removals name their row by its old value. The key they may
+    # carry is only a hint (keys can change across reloads): it saves the
+    # ID index lookup, which would index every row of a lazily loaded store.
+    op = entry["op"]
+    if op == "add":
+        store.add(entry["new"])
+        return
+    old = make_record(entry["old"])
+    key = entry.get("key")
+    if key is None or store.get(key, None) != old:
+        key = store.find(old)
+    if key is None:
+        return
+    if op == "update":
+        store.update(key, entry["new"])
+    elif op == "remove":
+        store.remove(key)
+
+
+class Journal:
+    # Append-only JSON Lines log with group commit: appends only write to the
+    # file buffer, a background thread flushes and fsyncs them at most every
+    # `interval` seconds (sooner once `batch` entries are waiting).
+    def __init__(self, path, interval=0.05, batch=500):
+        self.path = path
+        self.interval = interval
+        self.batch = batch
+        self._file = open(path, "a", encoding="utf-8")
+        self.size = self._file.tell()
+        self._pending = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._sync_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="journal-sync", daemon=True)
+        self._thread.start()
+
+    def append(self, op, old=None, new=None, key=None):
+        entry = {"op": op}
+        if key is not None:
+            entry["key"] = key
+        if old is not None:
+            entry["old"] = list(old)
+        if new is not None:
+            entry["new"] = list(new)
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._cond:
+            self._file.write(line)
+            self.size += len(line.encode("utf-8"))
+            self._pending += 1
+            if self._pending == 1 or self._pending >= self.batch:
+                self._cond.notify()
+
+    def flush(self):
+        with self._sync_lock:
+            with self._cond:
+                self._file.flush()
+                self._pending = 0
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+        with self._sync_lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                if self._pending < self.batch:
+                    self._cond.wait(self.interval)  # Let more entries join this commit
+            self.flush()
+
+
+class JournaledTextStorage(TextStorage):
+    # Text storage where every change is an O(1) journal append instead of a
+    # rewrite. The journal is split in numbered generations; once the current
+    # one passes `threshold` bytes a new generation starts and a background
+    # thread folds the older ones into the text file. The compacted file
+    # starts with "# journal: N" so replay skips generations <= N, which
+    # keeps recovery correct whichever step a crash interrupts.
+    def __init__(self, path, threshold=1 << 20):
+        super().__init__(path)
+        self.threshold = threshold
+        self._compactor = None
+        self._compact_lock = threading.Lock()
+        self._folded = self._base_generation()  # Last generation in the text file
+        self.generation = max([self._base_generation()] + self._generations()) + 1
+        self.journal = Journal(self._journal_path(self.generation))
+
+    def load(self):
+        store = EmployeeStore()
+        store.load(read_employees(self.path))
+        base = self._base_generation()
+        for generation in self._generations():
+            path = self._journal_path(generation)
+            if generation <= base:
+                os.remove(path)  # Already folded in, left over by a crash
+            else:
+                for entry in read_journal(path):
+                    apply_entry(store, entry)
+        return list(store.items())
+
+    def count(self):
+        return len(self.load())
+
+    def insert(self, key, record):
+        self.journal.append("add", new=record)
+
+    def insert_many(self, pairs):
+        for _, record in pairs:
+            self.journal.append("add", new=record)
+        self._maybe_compact()
+
+    def replace_all(self, pairs):
+        self._wait_compaction()
+        folded = self._rotate()
+        self._compact([record for _, record in pairs], folded)
+
+    def flush(self):
+        self.journal.flush()
+
+    def snapshot(self):
+        # Only the journal rotation happens on the caller's thread: the rows
+        # as of the rotation are rebuilt from the files by the writer
+        return None, self._rotate()
+
+    def write_snapshot(self, snapshot):
+        return self._compact(*snapshot)
+
+    def close(self):
+        self._wait_compaction()
+        self.journal.close()
+        if not self.journal.size:
+            os.remove(self.journal.path)  # Nothing was written, don't leave it around
+
+    def _on_change(self, op, key, old, new):
+        if op == "add":
+            self.journal.append("add", new=new)
+        elif op == "update":
+            self.journal.append("update", old=old, new=new, key=key)
+        elif op == "remove":
+            self.journal.append("remove", old=old, key=key)
+        else:
+            return
+        self._maybe_compact()
+
+    def _maybe_compact(self):
+        if self.journal.size < self.threshold or self.store is None:
+            return
+        if self._compactor is not None and self._compactor.is_alive():
+            return
+        self._compactor = threading.Thread(target=self._compact, args=self.snapshot(),
+                                           name="journal-compaction", daemon=True)
+        self._compactor.start()
+
+    def _rotate(self):
+        self.journal.close()
+        folded = self.generation
+        self.generation += 1
+        self.journal = Journal(self._journal_path(self.generation))
+        return folded
+
+    def _compact(self, records, folded):
+        # Background compactions and auto-saves may overlap: the lock orders
+        # them and an older snapshot never replaces a newer one
+        with self._compact_lock:
+            if folded <= self._folded:
+                return 0
+            if records is None:
+                records = self._fold(folded)
+            size = write_employees(self.path, records, f"{HEADER}{folded}\n")
+            self._folded = folded
+            for generation in self._generations():
+                if generation <= folded:
+                    os.remove(self._journal_path(generation))
+        return size
+
+    def _fold(self, folded):
+        # The rows at the end of generation `folded`: the text file with the
+        # closed journals up to it replayed, read on the compaction thread
+        store = EmployeeStore()
+        store.load(read_employees(self.path))
+        base = self._base_generation()
+        for generation in self._generations():
+            if base < generation <= folded:
+                for entry in read_journal(self._journal_path(generation)):
+                    apply_entry(store, entry)
+        return store.records()
+
+    def _wait_compaction(self):
+        if self._compactor is not None:
+            self._compactor.join()
+            self._compactor = None
+
+    def _journal_path(self, generation):
+        return f"{self.path}.journal.{generation}"
+
+    def _generations(self):
+        generations = []
+        for path in glob.glob(glob.escape(self.path) + ".journal.*"):
+            suffix = path.rsplit(".", 1)[1]
+            if suffix.isdigit():
+                generations.append(int(suffix))
+        return sorted(generations)
+
+    def _base_generation(self):
+        if not os.path.exists(self.path):
+            return 0
+        with open(self.path, "r", encoding="utf-8") as f:
+            first = f.readline()
+        return int(first[len(HEADER):]) if first.startswith(HEADER) else 0
@@ -0,0 +1,382 @@
+import hashlib
+import itertools
+import json
+import os
+import queue
+import shutil
+import smtplib
+import threading
+import time
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email.utils import formatdate, make_msgid
+
+OUTBOX = "outbox"
+MAX_ATTEMPTS = 6
+BACKOFF = 30  # Seconds before the first retry, doubled on every attempt
+MAX_BACKOFF = 3600
+BATCH = 50  # Recipients handed to one connection at a time
+
+
+class SmtpConfig:
+    # Server settings, from EMPLOYES_SMTP_* environment variables by default.
+    # Pointing host/port at a local stand-in server (e.g. aiosmtpd or
+    # `python -m smtpd` on older Pythons) is enough to test delivery.
+    def __init__(self, host="localhost", port=25, user=None, password=None,
+                 starttls=False, sender="rapports@localhost", timeout=30):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.starttls = starttls
+        self.sender = sender
+        self.timeout = timeout
+
+    @classmethod
+    def from_env(cls, environ=os.environ):
+        return cls(host=environ.get("EMPLOYES_SMTP_HOST", "localhost"),
+                   port=int(environ.get("EMPLOYES_SMTP_PORT", 25)),
+                   user=environ.get("EMPLOYES_SMTP_USER") or None,
+                   password=environ.get("EMPLOYES_SMTP_PASSWORD") or None,
+                   starttls=environ.get("EMPLOYES_SMTP_STARTTLS", "") not in ("", "0"),
+                   sender=environ.get("EMPLOYES_SMTP_FROM", "rapports@localhost"))
+
+
+class SmtpPool:
+    # Keeps up to `size` authenticated SMTP sessions open between sends.
+    # A session idle for more than `idle` seconds is checked with NOOP before
+    # reuse and closed by prune(); one that errors is dropped, not returned.
+    def __init__(self, config, size=2, idle=60, max_messages=100):
+        self.config = config
+        self.size = size
+        self.idle = idle
+        self.max_messages = max_messages  # Reconnect after this many messages
+        self._idle = []  # (connection, messages sent, last used)
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def acquire(self):
+        self._slots.acquire()
+        with self._lock:
+            entry = self._idle.pop() if self._idle else None
+        try:
+            if entry is not None:
+                connection, sent, used = entry
+                if time.monotonic() - used < self.idle or self._alive(connection):
+                    return [connection, sent]
+                self._close(connection)
+            return [self._connect(), 0]
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, session, broken=False):
+        connection, sent = session
+        if broken or sent >= self.max_messages:
+            self._close(connection)
+        else:
+            with self._lock:
+                self._idle.append((connection, sent, time.monotonic()))
+        self._slots.release()
+
+    def prune(self):
+        # Close the sessions idle for longer than `idle` seconds
+        now = time.monotonic()
+        with self._lock:
+            stale = [entry for entry in self._idle if now - entry[2] >= self.idle]
+            self._idle = [entry for entry in self._idle if now - entry[2] < self.idle]
+        for connection, _, _ in stale:
+            self._close(connection)
+
+    def open(self):
+        # Number of sessions kept open
+        return len(self._idle)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection, _, _ in idle:
+            self._close(connection)
+
+    def _connect(self):
+        config = self.config
+        connection = smtplib.SMTP(config.host, config.port, timeout=config.timeout)
+        try:
+            if config.starttls:
+                connection.starttls()
+            if config.user:
+                connection.login(config.user, config.password or "")
+        except BaseException:
+            self._close(connection)
+            raise
+        return connection
+
+    def _alive(self, connection):
+        try:
+            return connection.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def _close(self, connection):
+        try:
+            connection.quit()
+        except (smtplib.SMTPException, OSError):
+            connection.close()
+
+
+def _write_json(path, data):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class Outbox:
+    # Messages waiting for delivery, one JSON file each in `path`, so they
+    # survive a restart. Attachments are stored once under attachments/ by
+    # content hash and shared by every message that refers to them; failed
+    # messages are moved to failed/.
+    def __init__(self, path=OUTBOX):
+        self.path = path
+        self.attachments = os.path.join(path, "attachments")
+        self.failed = os.path.join(path, "failed")
+        os.makedirs(self.attachments, exist_ok=True)
+        os.makedirs(self.failed, exist_ok=True)
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+
+    def add_attachment(self, path):
+        # Moves a rendered file into the outbox, returns its content name
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        name = digest.hexdigest() + os.path.splitext(path)[1]
+        target = os.path.join(self.attachments, name)
+        if os.path.exists(target):
+            os.remove(path)
+        else:
+            shutil.move(path, target)
+        return name
+
+    def attachment_path(self, name):
+        return os.path.join(self.attachments, name)
+
+    def put(self, recipients, subject, body, attachment=None, filename=None):
+        # One message file per recipient, so each one retries on its own
+        now = time.time()
+        messages = []
+        for recipient in recipients:
+            message = {"id": f"{now:.6f}-{os.getpid()}-{next(self._ids)}", "to": recipient,
+                       "subject": subject, "body": body, "attachment": attachment,
+                       "filename": filename, "attempts": 0, "next_try": now, "error": None}
+            _write_json(self._message_path(message), message)
+            messages.append(message)
+        return messages
+
+    def due(self, now=None):
+        # Messages ready to be (re)tried, oldest first
+        now = time.time() if now is None else now
+        messages = []
+        for message in self.pending():
+            if message["next_try"] <= now:
+                messages.append(message)
+        return messages
+
+    def count(self):
+        # Messages waiting, without reading them
+        return sum(1 for name in os.listdir(self.path) if name.endswith(".json"))
+
+    def pending(self):
+        messages = []
+        for name in sorted(os.listdir(self.path)):
+            if name.endswith(".json"):
+                try:
+                    with open(os.path.join(self.path, name), "r", encoding="utf-8") as f:
+                        messages.append(json.load(f))
+                except (OSError, ValueError):
+                    continue  # Being replaced, picked up next time
+        return messages
+
+    def retry_later(self, message, error, max_attempts=MAX_ATTEMPTS):
+        # Returns False once the message was given up on
+        message["attempts"] += 1
+        message["error"] = str(error)
+        if message["attempts"] >= max_attempts:
+            self.fail(message, error)
+            return False
+        delay = min(BACKOFF * 2 ** (message["attempts"] - 1), MAX_BACKOFF)
+        message["next_try"] = time.time() + delay
+        _write_json(self._message_path(message), message)
+        return True
+
+    def fail(self, message, error):
+        message["error"] = str(error)
+        _write_json(os.path.join(self.failed, message["id"] + ".json"), message)
+        self.done(message)
+
+    def done(self, message):
+        os.remove(self._message_path(message))
+
+    def collect(self, attachment):
+        # Drop an attachment once no pending message refers to it
+        if attachment is None:
+            return
+        with self._lock:
+            if all(message["attachment"] != attachment for message in self.pending()):
+                path = self.attachment_path(attachment)
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def _message_path(self, message):
+        return os.path.join(self.path, message["id"] + ".json")
+
+
+class Mailer:
+    # Delivers the outbox on a background thread. Due messages sharing the
+    # same subject, body and attachment are sent as one batch over a pooled
+    # connection: the MIME message (attachment encoded included) is built
+    # once per batch and only the To header changes per recipient. Transient
+    # failures are retried with exponential backoff; a refused recipient
+    # fails right away. Outcomes land in `results` as ("sent", message) or
+    # ("failed", message, error).
+    def __init__(self, config=None, outbox=None, pool=None, interval=5):
+        self.config = config or SmtpConfig.from_env()
+        self.outbox = outbox or Outbox()
+        self.pool = pool or SmtpPool(self.config)
+        self.interval = interval
+        self.results = queue.Queue()
+        self._waiting = self.outbox.count()  # Kept up to date by send() and the mailer thread
+        self._waiting_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = False
+        self._thread = None
+
+    def start(self):
+        # Messages left over from a previous run go out as well
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="mailer", daemon=True)
+            self._thread.start()
+
+    def send(self, recipients, subject, body, attachment=None, filename=None):
+        # Queues one message per recipient; `attachment` is a file moved into
+        # the outbox and shared by all of them
+        if attachment is not None:
+            attachment = self.outbox.add_attachment(attachment)
+        with self._waiting_lock:
+            messages = self.outbox.put(recipients, subject, body, attachment, filename)
+            self._waiting += len(messages)
+        self.start()
+        self._wake.set()
+        return messages
+
+    def pending(self):
+        # Messages not delivered or given up on yet; cheap enough to poll
+        return self._waiting
+
+    def poll(self):
+        # (sent, failed) since the last poll
+        sent, failed = [], []
+        while True:
+            try:
+                result = self.results.get_nowait()
+            except queue.Empty:
+                break
+            (sent if result[0] == "sent" else failed).append(result)
+        return sent, failed
+
+    def stop(self):
+        self._stopped = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.pool.close()
+
+    def deliver(self):
+        # One delivery pass over the due messages; returns how many were sent
+        sent = 0
+        groups = {}
+        for message in self.outbox.due():
+            key = (message["subject"], message["body"], message["attachment"], message["filename"])
+            groups.setdefault(key, []).append(message)
+        for messages in groups.values():
+            payload = self._build(messages[0])
+            for start in range(0, len(messages), BATCH):
+                if self._stopped:
+                    break
+                sent += self._send_batch(payload, messages[start:start + BATCH])
+            self.outbox.collect(messages[0]["attachment"])
+        return sent
+
+    def _build(self, message):
+        msg = MIMEMultipart()
+        msg["From"] = self.config.sender
+        msg["Subject"] = message["subject"]
+        msg["Date"] = formatdate(localtime=True)
+        msg.attach(MIMEText(message["body"], "plain", "utf-8"))
+        if message["attachment"] is not None:
+            with open(self.outbox.attachment_path(message["attachment"]), "rb") as f:
+                part = MIMEApplication(f.read(), _subtype="pdf")
+            part.add_header("Content-Disposition", "attachment",
+                            filename=message["filename"] or message["attachment"])
+            msg.attach(part)
+        return msg.as_bytes()
+
+    def _send_batch(self, payload, messages):
+        try:
+            session = self.pool.acquire()
+        except (smtplib.SMTPException, OSError) as e:
+            for message in messages:
+                self._retry(message, e)
+            return 0
+        sent = 0
+        broken = False
+        domain = self.config.sender.rpartition("@")[2] or "localhost"  # Spares a getfqdn() per message
+        try:
+            for index, message in enumerate(messages):
+                headers = f"To: {message['to']}\r\nMessage-ID: {make_msgid(domain=domain)}\r\n".encode("utf-8")
+                try:
+                    session[0].sendmail(self.config.sender, [message["to"]], headers + payload)
+                except (smtplib.SMTPException, OSError) as e:
+                    if isinstance(e, smtplib.SMTPRecipientsRefused) or getattr(e, "smtp_code", 0) >= 500:
+                        # Permanent refusal of this message, the session is still fine
+                        self.outbox.fail(message, e)
+                        self.results.put(("failed", message, e))
+                        continue
+                    # The session is in doubt: retry this one and the rest later
+                    broken = True
+                    for rest in messages[index:]:
+                        self._retry(rest, e)
+                    break
+                session[1] += 1
+                sent += 1
+                self.outbox.done(message)
+                self.results.put(("sent", message))
+        finally:
+            self.pool.release(session, broken)
+        return sent
+
+    def _retry(self, message, error):
+        if not self.outbox.retry_later(message, error):
+            self.results.put(("failed", message, error))
+
+    def _run(self):
+        # Sleeps until send() when nothing is pending and no session is open
+        while not self._stopped:
+            self._wake.clear()
+            try:
+                self.deliver()
+            except Exception as e:
+                self.results.put(("failed", None, e))
+            self.pool.prune()
+            with self._waiting_lock:
+                waiting = self.outbox.pending()
+                self._waiting = len(waiting)
+            if waiting:
+                delay = min(message["next_try"] for message in waiting) - time.time()
+                self._wake.wait(min(max(delay, self.interval), self.pool.idle))
+            else:
+                self._wake.wait(self.pool.idle if self.pool.open() else None)
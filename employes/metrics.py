@@ -0,0 +1,163 @@
+import csv
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Upper bounds of the latency buckets, in milliseconds; one more bucket
+# collects everything slower
+BOUNDS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+STALL = 0.1  # Seconds a Tk callback may hold the event loop before it's flagged
+
+
+class Histogram:
+    # Latencies of one operation as bucket counts, plus the rows and bytes
+    # it handled. Percentiles are read off the buckets (upper bound).
+    def __init__(self):
+        self.buckets = [0] * (len(BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.nbytes = 0
+
+    def add(self, seconds, rows=0, nbytes=0):
+        ms = seconds * 1000
+        index = 0
+        while index < len(BOUNDS) and ms > BOUNDS[index]:
+            index += 1
+        self.buckets[index] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.rows += rows
+        self.nbytes += nbytes
+
+    def percentile(self, p):
+        # Seconds under which p percent of the calls finished
+        if not self.count:
+            return 0.0
+        wanted = p / 100 * self.count
+        seen = 0
+        for bound, count in zip(BOUNDS, self.buckets):
+            seen += count
+            if seen >= wanted:
+                return min(bound / 1000, self.max)
+        return self.max
+
+    def summary(self):
+        return {"count": self.count, "total": self.total,
+                "mean": self.total / self.count if self.count else 0.0,
+                "p50": self.percentile(50), "p95": self.percentile(95), "p99": self.percentile(99),
+                "max": self.max, "rows": self.rows, "bytes": self.nbytes,
+                "buckets": dict(zip([f"<={bound}ms" for bound in BOUNDS] + ["slower"], self.buckets))}
+
+
+class Sample:
+    # Handed out by Metrics.timed(): set rows / nbytes before the block ends
+    __slots__ = ("rows", "nbytes")
+
+    def __init__(self, rows=0, nbytes=0):
+        self.rows = rows
+        self.nbytes = nbytes
+
+
+class Metrics:
+    # Per-operation latency histograms, fed from any thread. Recording is a
+    # perf_counter pair and a few integer updates under a lock, cheap enough
+    # to stay on in production.
+    def __init__(self):
+        self.started = time.time()
+        self.histograms = {}
+        self.stalls = deque(maxlen=200)  # (wall time, seconds, callback), newest last
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds, rows=0, nbytes=0):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.add(seconds, rows, nbytes)
+
+    def stall(self, seconds, callback):
+        self.stalls.append((time.time(), seconds, callback))
+        self.record("tk:stall", seconds)
+
+    @contextmanager
+    def timed(self, name, rows=0, nbytes=0):
+        sample = Sample(rows, nbytes)
+        start = time.perf_counter()
+        try:
+            yield sample
+        finally:
+            self.record(name, time.perf_counter() - start, sample.rows, sample.nbytes)
+
+    def snapshot(self):
+        with self._lock:
+            return {name: histogram.summary() for name, histogram in sorted(self.histograms.items())}
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+            self.stalls.clear()
+            self.started = time.time()
+
+    def dump(self, path):
+        # JSON with the histograms and stalls, or one CSV line per operation
+        operations = self.snapshot()
+        if path.lower().endswith(".csv"):
+            fields = ("count", "total", "mean", "p50", "p95", "p99", "max", "rows", "bytes")
+            with open(path, "w", encoding="utf-8", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(("operation",) + fields)
+                for name, summary in operations.items():
+                    writer.writerow([name] + [summary[field] for field in fields])
+            return
+        document = {"started": self.started, "dumped": time.time(), "operations": operations,
+                    "stalls": [{"time": at, "seconds": seconds, "callback": callback}
+                               for at, seconds, callback in self.stalls]}
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(document, f, indent=2, ensure_ascii=False)
+
+
+class StallDetector:
+    # Times every Tk callback (commands, bindings, after() and idle tasks)
+    # by swapping in a timing tkinter.CallWrapper, and reports the ones that
+    # held the event loop for more than `threshold` seconds. A callback that
+    # ran a nested event loop (a modal dialog) kept the UI alive and doesn't
+    # count. install() must run before the widgets are created.
+    def __init__(self, metrics, threshold=STALL):
+        self.metrics = metrics
+        self.threshold = threshold
+        self.calls = 0
+
+    def install(self):
+        import tkinter
+        detector = self
+
+        class TimedCallWrapper(tkinter.CallWrapper):
+            def __call__(self, *args):
+                calls = detector.calls = detector.calls + 1
+                start = time.perf_counter()
+                try:
+                    return super().__call__(*args)
+                finally:
+                    detector.check(self.func, time.perf_counter() - start, detector.calls != calls)
+
+        tkinter.CallWrapper = TimedCallWrapper
+
+    def check(self, func, seconds, nested):
+        if seconds > self.threshold and not nested:
+            self.metrics.stall(seconds, _callback_name(func))
+
+
+def _callback_name(func):
+    name = getattr(func, "__qualname__", None)
+    if name is None or name.endswith("<locals>.callit"):
+        # after() wraps the function in a closure renamed after it
+        return getattr(func, "__name__", repr(func))
+    return name
+
+
+metrics = Metrics()  # The application-wide registry
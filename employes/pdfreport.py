@@ -0,0 +1,223 @@
+import os
+import re
+import shutil
+import tempfile
+from itertools import islice
+
+from . import startup
+from .store import COLUMNS
+
+ROWS_PER_PAGE = 40
+PAGES_PER_CHUNK = 25  # Pages rendered by one worker task
+ROW_COST = 2048  # Rough bytes held per in-flight row (pickled rows + canvas)
+MEMORY_LIMIT = 256 * 1024 * 1024
+
+# Page layout in points (letter, 612 x 792)
+PAGE_WIDTH, PAGE_HEIGHT = 612, 792
+MARGIN = 40
+TITLE_HEIGHT = 28
+HEADER_HEIGHT = 22
+ROW_HEIGHT = 16
+WIDTHS = (190, 100, 70, 172)
+TOTAL_FORM = "pagetotal"  # Form drawing the page total, filled in once it is known
+TOTAL_TEXT = re.compile(rb"\(\d+\) Tj")
+
+
+def page_count(rows, rows_per_page=ROWS_PER_PAGE):
+    return max(1, -(-rows // rows_per_page))
+
+
+def _fit(text, width, size, string_width):
+    # Cut text to the column width, so every row keeps a fixed height
+    if string_width(text, "Helvetica", size) <= width:
+        return text
+    while text and string_width(text + "...", "Helvetica", size) > width:
+        text = text[:-1]
+    return text + "..."
+
+
+def _draw_page(canvas, rows, title, page, pages, columns, string_width, colors):
+    top = PAGE_HEIGHT - MARGIN
+    canvas.setFont("Helvetica-Bold", 14)
+    canvas.drawString(MARGIN, top - 14, title)
+    canvas.setFont("Helvetica", 9)
+    label = f"Page {page} / "
+    canvas.drawString(MARGIN, MARGIN / 2, label)
+    canvas.saveState()
+    canvas.translate(MARGIN + string_width(label, "Helvetica", 9), MARGIN / 2)
+    canvas.doForm(TOTAL_FORM)
+    canvas.restoreState()
+
+    width = sum(WIDTHS)
+    y = top - TITLE_HEIGHT
+    bottom = y - HEADER_HEIGHT - ROW_HEIGHT * len(rows)
+    canvas.setFillColor(colors.blue)
+    canvas.rect(MARGIN, y - HEADER_HEIGHT, width, HEADER_HEIGHT, stroke=0, fill=1)
+    canvas.setFillColor(colors.beige)
+    canvas.rect(MARGIN, bottom, width, y - HEADER_HEIGHT - bottom, stroke=0, fill=1)
+
+    canvas.setFillColor(colors.whitesmoke)
+    canvas.setFont("Helvetica-Bold", 11)
+    x = MARGIN
+    for column, column_width in zip(columns, WIDTHS):
+        canvas.drawCentredString(x + column_width / 2, y - HEADER_HEIGHT + 7, column)
+        x += column_width
+
+    canvas.setFillColor(colors.black)
+    canvas.setFont("Helvetica", 9)
+    row_y = y - HEADER_HEIGHT
+    for row in rows:
+        row_y -= ROW_HEIGHT
+        x = MARGIN
+        for value, column_width in zip(row, WIDTHS):
+            canvas.drawCentredString(x + column_width / 2, row_y + 5,
+                                     _fit(value, column_width - 6, 9, string_width))
+            x += column_width
+
+    # Grid
+    canvas.setStrokeColor(colors.black)
+    canvas.setLineWidth(0.5)
+    xs = [MARGIN]
+    for column_width in WIDTHS:
+        xs.append(xs[-1] + column_width)
+    ys = [y, y - HEADER_HEIGHT] + [y - HEADER_HEIGHT - ROW_HEIGHT * i for i in range(1, len(rows) + 1)]
+    canvas.grid(xs, ys)
+
+
+def render_chunk(path, rows, title, first_page, pages, rows_per_page, columns):
+    # Runs in a pool process: renders rows as consecutive pages into path.
+    # The page total is a form drawn with `pages`, the expected total;
+    # set_total() rewrites it once the document is put together.
+    from reportlab.lib import colors
+    from reportlab.pdfbase.pdfmetrics import stringWidth
+    from reportlab.pdfgen.canvas import Canvas
+
+    canvas = Canvas(path, pagesize=(PAGE_WIDTH, PAGE_HEIGHT), pageCompression=1)
+    page = first_page
+    for start in range(0, len(rows), rows_per_page):
+        _draw_page(canvas, rows[start:start + rows_per_page], title, page, pages,
+                   columns, stringWidth, colors)
+        canvas.showPage()
+        page += 1
+    if not rows:
+        _draw_page(canvas, rows, title, page, pages, columns, stringWidth, colors)
+        canvas.showPage()
+    canvas.beginForm(TOTAL_FORM)
+    canvas.setFont("Helvetica", 9)
+    canvas.drawString(0, 0, str(pages or 0))
+    canvas.endForm()
+    canvas.save()
+    return path
+
+
+def set_total(writer, pages):
+    # Writes the actual page total into the total form of every chunk
+    NameObject = startup.load("pypdf.generic").NameObject
+    text = f"({pages}) Tj".encode("ascii")
+    done = set()
+    for page in writer.pages:
+        form = page["/Resources"]["/XObject"].raw_get("/FormXob." + TOTAL_FORM)
+        if form.idnum in done:
+            continue
+        done.add(form.idnum)
+        stream = form.get_object()
+        data = TOTAL_TEXT.sub(text, stream.get_data())
+        stream[NameObject("/Filter")] = NameObject("/FlateDecode")  # pypdf only re-encodes Flate
+        stream.set_data(data)
+
+
+class PdfReport:
+    # Renders a roster as a paginated PDF. Rows are cut into chunks of
+    # PAGES_PER_CHUNK fixed-height pages, rendered by a process pool into
+    # temporary files that are put together once all of them are done. The
+    # number of chunks in flight is bounded by memory_limit, so `records` is
+    # never held in full while rendering; the final merge holds the
+    # compressed pages, about the size of the output file. `total` (the
+    # expected number of rows) only seeds the page totals: rows that turn out
+    # to be missing (e.g. deleted meanwhile) are accounted for at the merge.
+    # Meant to run as a JobQueue job: run(job) reports the rows laid out so
+    # far. `pool` is a shared ProcessPoolExecutor; without one the report
+    # starts its own.
+    def __init__(self, path, records, total=None, title="Liste des Employés",
+                 columns=COLUMNS, rows_per_page=ROWS_PER_PAGE, pages_per_chunk=PAGES_PER_CHUNK,
+                 pool=None, processes=None, memory_limit=MEMORY_LIMIT):
+        self.path = path
+        self.records = records
+        self.total = total
+        self.title = title
+        self.columns = columns
+        self.rows_per_page = rows_per_page
+        self.chunk = rows_per_page * pages_per_chunk
+        self.pool = pool
+        self.processes = processes or max(1, (os.cpu_count() or 2) - 1)
+        self.max_pending = max(1, min(2 * self.processes, memory_limit // (self.chunk * ROW_COST)))
+        self.rows = 0
+        self.pages = 0
+
+    def run(self, job):
+        # Returns the number of rows laid out, or None once cancelled
+        workdir = tempfile.mkdtemp(prefix="pdf-report-")
+        tmp = self.path + ".tmp"
+        try:
+            pages = page_count(self.total, self.rows_per_page) if self.total is not None else None
+            if self.pool is not None:
+                chunks = self._render(self.pool, workdir, pages, job)
+            else:
+                from concurrent.futures import ProcessPoolExecutor
+                with ProcessPoolExecutor(self.processes) as pool:
+                    chunks = self._render(pool, workdir, pages, job)
+            if job.cancelled:
+                return None
+            writer = startup.load("pypdf").PdfWriter()
+            for path in chunks:
+                writer.append(path)
+                os.remove(path)
+            if self.pages != pages:
+                set_total(writer, self.pages)
+            with open(tmp, "wb") as f:
+                writer.write(f)
+            os.replace(tmp, self.path)
+            job.nbytes = os.path.getsize(self.path)
+            return self.rows
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    def _render(self, pool, workdir, pages, job):
+        # Returns the chunk files in page order
+        width = len(self.columns)
+        records = iter(self.records)
+        pending = []  # (future, rows, pages) in page order
+        chunks = []
+        first_page = 1
+        try:
+            while not job.cancelled:
+                chunk = [tuple(record[:width]) for record in islice(records, self.chunk)]
+                if not chunk and first_page > 1:
+                    break
+                while len(pending) >= self.max_pending:
+                    chunks.append(self._wait(*pending.pop(0), job))
+                path = os.path.join(workdir, f"{first_page:08d}.pdf")
+                count = page_count(len(chunk), self.rows_per_page)
+                pending.append((pool.submit(render_chunk, path, chunk, self.title, first_page,
+                                            pages, self.rows_per_page, self.columns),
+                                len(chunk), count))
+                first_page += count
+                if len(chunk) < self.chunk:
+                    break
+            while pending and not job.cancelled:
+                chunks.append(self._wait(*pending.pop(0), job))
+        finally:
+            for future, _, _ in pending:
+                future.cancel()
+        return chunks
+
+    def _wait(self, future, rows, pages, job):
+        path = future.result()
+        self.rows += rows
+        self.pages += pages
+        job.report(self.rows)
+        return path
@@ -0,0 +1,100 @@
+from .store import EmployeeStore
+
+BULK = 0.5  # Above this share of rows changed, a restore reloads everything
+
+
+class RestorePlan:
+    # Differences between the current rows and a backup: `added` records,
+    # `removed` keys and `changed` (key, record) pairs. `version` is the
+    # store version the plan was computed against.
+    def __init__(self, snapshot, added, removed, changed, version, total, keyed):
+        self.snapshot = snapshot
+        self.added = added
+        self.removed = removed
+        self.changed = changed
+        self.version = version
+        self.total = total  # Rows in the current store
+        self.keyed = keyed
+
+    def __len__(self):
+        return len(self.added) + len(self.removed) + len(self.changed)
+
+    def bulk(self):
+        # Cheaper to reload than to apply row by row
+        return len(self) > BULK * max(self.total, len(self.snapshot))
+
+    def summary(self):
+        return (f"{len(self.added)} ajouté(s), {len(self.removed)} supprimé(s), "
+                f"{len(self.changed)} modifié(s)")
+
+
+def _match(current, wanted):
+    # Pairs equal records of two (key, record) sequences. Returns the keys
+    # of the current rows left over and the wanted pairs left over.
+    counts = {}
+    for _, record in wanted:
+        counts[record] = counts.get(record, 0) + 1
+    removed = []
+    for key, record in current:
+        if counts.get(record):
+            counts[record] -= 1
+        else:
+            removed.append(key)
+    added = []
+    for key, record in wanted:
+        if counts.get(record):
+            counts[record] -= 1
+            added.append((key, record))
+    return removed, added
+
+
+def plan_restore(current, items, version=None, keyed=True):
+    # current: {key: record} copy of the store, items: (key, record) pairs of
+    # the backup. Rows are paired by content first: backends that reload
+    # from text renumber their keys, so equal keys don't mean the same row.
+    # With snapshots of the backup store (keyed), a current row and a backup
+    # row left over under the same key count as one changed row; older
+    # backups number their rows from 0 and are matched by content only.
+    snapshot = EmployeeStore()
+    snapshot.load_items(items)
+    removed, added = _match(current.items(), snapshot.items())
+    changed = []
+    if keyed:
+        wanted = dict(added)
+        unmatched = []
+        for key in removed:
+            record = wanted.pop(key, None)
+            if record is None:
+                unmatched.append(key)
+            else:
+                changed.append((key, record))
+        removed = unmatched
+        added = [(key, record) for key, record in added if key in wanted]
+    added = [record for _, record in added]
+    return RestorePlan(snapshot, added, removed, changed, version, len(current), keyed)
+
+
+def apply_restore(store, storage, plan):
+    # Applies a plan in one storage transaction. Returns the keys of the added
+    # rows, or None when everything was reloaded (a single "reset" event).
+    if plan.bulk():
+        write_restore(storage, plan)
+        load_restore(store, plan)
+        return None
+    with storage.transaction():
+        for key in plan.removed:
+            store.remove(key)
+        for key, record in plan.changed:
+            store.update(key, record)
+        return store.extend(plan.added)
+
+
+def write_restore(storage, plan):
+    # Storage half of a bulk restore. May run on a worker thread as long as
+    # nothing else uses the storage meanwhile; load_restore() then puts the
+    # same rows in the store, whose "reset" the storage ignores.
+    storage.replace_all(plan.snapshot.items())
+
+
+def load_restore(store, plan):
+    store.load_items(plan.snapshot.items())
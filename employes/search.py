@@ -0,0 +1,300 @@
+import queue
+import threading
+import time
+from array import array
+
+from .metrics import metrics
+
+SEARCH_FIELDS = (0, 1, 2, 3)  # Nom, CIN, Année, ID
+SEPARATOR = "\x1f"  # Never typed, so matches can't span two fields
+CHUNK = 50000  # Rows checked between two cancellation checks
+
+
+class SearchCancelled(Exception):
+    pass
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class SearchIndex:
+    # Substring search over Nom, CIN, Année and ID backed by a trigram index.
+    # Posting lists are append-only arrays of store keys; edits and deletes
+    # leave stale entries behind that are filtered out by checking the
+    # candidate text, and the index is rebuilt once too many pile up.
+    def __init__(self, store, fields=SEARCH_FIELDS):
+        self.store = store
+        self.fields = fields
+        self._texts = {}
+        self._grams = {}
+        self._stale = 0
+        self._built = False
+        self.version = None  # Store version the index reflects
+        self._last_query = None
+        self._last_result = None
+        self._last_version = None
+        # Searches may run on a worker thread while the store changes on the
+        # Tk thread: a change aborts the running search and waits for the
+        # lock. A build reads the rows without it, the changes made meanwhile
+        # are queued in _backlog and replayed once it's done.
+        self._lock = threading.Condition()
+        self._interrupted = False
+        self._building = False
+        self._backlog = []
+        store.subscribe(self._on_change)
+
+    def text(self, record):
+        return SEPARATOR.join(record[i] for i in self.fields).lower()
+
+    def build(self):
+        with self._lock:
+            self._ensure_built()
+
+    def search(self, query, cancelled=None):
+        # Returns matching keys in store order, or None when the query is empty
+        return self.lookup(query, cancelled)[1]
+
+    def lookup(self, query, cancelled=None):
+        # Returns (version, keys) where version is the store version the keys
+        # were computed from. Raises SearchCancelled when cancelled() turns
+        # true or the store changes meanwhile.
+        query = query.lower()
+        if not query:
+            self._last_query = None
+            return self.store.version, None
+        with self._lock:
+            self._interrupted = False
+            self._ensure_built()
+            version = self.version
+
+            candidates = None
+            sorted_candidates = True
+            if (self._last_query is not None and self._last_query in query
+                    and self._last_version == version):
+                # The query extends the previous one: narrow its results
+                candidates = self._last_result
+
+            if len(query) >= 3:
+                postings = self._postings(query)
+                if candidates is None or len(postings) < len(candidates):
+                    candidates = postings
+                    sorted_candidates = False
+
+            texts = self._texts
+            if candidates is not None and len(candidates) > len(texts) // 2:
+                candidates = None  # A plain scan is cheaper than that many lookups
+            if candidates is None:
+                candidates = list(texts)
+            elif not sorted_candidates:
+                candidates = sorted(set(candidates))
+
+            result = []
+            for start in range(0, len(candidates), CHUNK):
+                if self._interrupted or (cancelled is not None and cancelled()):
+                    raise SearchCancelled(query)
+                result += [key for key in candidates[start:start + CHUNK]
+                           if query in texts.get(key, "")]
+
+            self._last_query = query
+            self._last_result = result
+            self._last_version = version
+            return version, result
+
+    def _postings(self, query):
+        # Shortest posting list among the query's trigrams
+        best = None
+        for gram in trigrams(query):
+            posting = self._grams.get(gram)
+            if posting is None:
+                return ()
+            if best is None or len(posting) < len(best):
+                best = posting
+        return best
+
+    def _ensure_built(self):
+        # Called with the lock held, which is released while the rows are
+        # read. Loops if a replayed change was a reset.
+        while True:
+            while self._building:
+                self._lock.wait()
+            if self._built and self._stale <= len(self._texts) // 2 + 1024:
+                return
+            self._build()
+
+    def _build(self):
+        self._building = True
+        version = self.store.version
+        self._lock.release()
+        try:
+            texts, grams = self._read()
+        finally:
+            self._lock.acquire()
+            self._building = False
+            self._lock.notify_all()
+        self._texts = texts
+        self._grams = grams
+        self.version = version
+        self._stale = 0
+        self._built = True
+        backlog, self._backlog = self._backlog, []
+        for change in backlog:
+            self._apply(*change)
+
+    def _read(self):
+        # Bulk build with lists, then pack the postings into arrays. A row
+        # being written on the Tk thread may be missing or read half-written:
+        # its change is in the backlog and is replayed over it.
+        get = self.store.get
+        texts = {}
+        grams = {}
+        for key in self.store.keys():
+            try:
+                record = get(key, None)
+                if record is None:
+                    continue
+                text = texts[key] = self.text(record)
+            except (IndexError, UnicodeDecodeError):
+                continue
+            for field in text.split(SEPARATOR):
+                for gram in trigrams(field):
+                    posting = grams.get(gram)
+                    if posting is None:
+                        grams[gram] = [key]
+                    else:
+                        posting.append(key)
+        return texts, {gram: array("I", posting) for gram, posting in grams.items()}
+
+    def _add(self, key, record, skip=()):
+        text = self.text(record)
+        self._texts[key] = text
+        grams = self._grams
+        for field in text.split(SEPARATOR):
+            for gram in trigrams(field):
+                if gram in skip:
+                    continue
+                posting = grams.get(gram)
+                if posting is None:
+                    grams[gram] = posting = array("I")
+                posting.append(key)
+
+    def _on_change(self, op, key, old, new):
+        self._interrupted = True
+        with self._lock:
+            self._last_query = None
+            if self._building:
+                self._backlog.append((op, key, old, new))
+            elif self._built:
+                self._apply(op, key, old, new)
+
+    def _apply(self, op, key, old, new):
+        # Replaying a change the build already saw is harmless: texts are
+        # overwritten and a key posted twice is matched once
+        self.version = self.store.version
+        if op == "add":
+            self._add(key, new)
+        elif op == "update":
+            # Keys already posted under the old grams stay valid
+            old_grams = set()
+            for field in self._texts.get(key, "").split(SEPARATOR):
+                old_grams |= trigrams(field)
+            self._add(key, new, skip=old_grams)
+            self._stale += 1
+        elif op == "remove":
+            self._texts.pop(key, None)
+            self._stale += 1
+        else:
+            self._built = False
+            self._texts = {}
+            self._grams = {}
+
+
+class SearchWorker:
+    # Runs searches on a background thread. submit() debounces: only the last
+    # query typed within `delay` seconds is searched, and a new query cancels
+    # the one in progress. Results land in `results` as
+    # (generation, version, query, keys) for the UI to poll.
+    def __init__(self, index, delay=0.1):
+        self.index = index
+        self.delay = delay
+        self.results = queue.Queue()
+        self.generation = 0
+        self._pending = None
+        self._prepare = False
+        self._stopped = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="search-worker", daemon=True)
+        self._thread.start()
+
+    def submit(self, query, delay=None):
+        with self._cond:
+            self.generation += 1
+            deadline = time.monotonic() + (self.delay if delay is None else delay)
+            self._pending = (self.generation, query, deadline)
+            self._cond.notify()
+            return self.generation
+
+    def cancel(self):
+        with self._cond:
+            self.generation += 1
+            self._pending = None
+
+    def prepare(self):
+        # Build the index in the background so the first keystroke doesn't pay for it
+        with self._cond:
+            self._prepare = True
+            self._cond.notify()
+
+    def is_current(self, generation):
+        return generation == self.generation
+
+    def busy(self):
+        return self._pending is not None
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+
+    def _next(self):
+        with self._cond:
+            while not self._stopped:
+                if self._pending is not None:
+                    remaining = self._pending[2] - time.monotonic()
+                    if remaining <= 0:
+                        return self._pending
+                    self._cond.wait(remaining)
+                elif self._prepare:
+                    self._prepare = False
+                    return "prepare"
+                else:
+                    self._cond.wait()
+            return None
+
+    def _run(self):
+        while True:
+            task = self._next()
+            if task is None:
+                return
+            if task == "prepare":
+                self.index.build()
+                continue
+            generation, query, _ = task
+            start = time.perf_counter()
+            try:
+                version, keys = self.index.lookup(query, lambda: generation != self.generation)
+            except SearchCancelled:
+                # Cancelled by a newer query, or interrupted by a store change
+                # while still current: in that case search again
+                with self._cond:
+                    if self._pending is task:
+                        self._pending = (generation, query, 0)
+                continue
+            # Publish before clearing _pending so a poller never sees an idle
+            # worker with the result still missing
+            metrics.record("search", time.perf_counter() - start, len(keys or ()))
+            if generation == self.generation:
+                self.results.put((generation, version, query, keys))
+            with self._cond:
+                if self._pending is task:
+                    self._pending = None
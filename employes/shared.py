@@ -0,0 +1,488 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from .journal import HEADER, JournaledTextStorage, apply_entry
+from .storage import TextStorage
+from .store import EmployeeStore, make_record, parse_line, read_employees, write_employees
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+WAIT = 10.0  # Seconds to wait for another instance's lock before giving up
+POLL = 0.5   # Seconds between two looks at the shared files
+BATCH = 10000  # Pending changes appended at once outside transactions
+
+
+def _stat(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+class FileLock:
+    # Exclusive lock held across processes and machines: an advisory lock on
+    # a side file, which network shares (SMB, NFS) pass on to the server.
+    # Re-entrant within a thread; threads of one process take turns.
+    def __init__(self, path, timeout=WAIT):
+        self.path = path
+        self.timeout = timeout
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._file = None
+
+    def acquire(self):
+        self._lock.acquire()
+        if self._depth == 0:
+            try:
+                self._lock_file()
+            except BaseException:
+                self._lock.release()
+                raise
+        self._depth += 1
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0:
+            self._unlock_file()
+        self._lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _lock_file(self):
+        if self._file is None:
+            self._file = open(self.path, "a+b")
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                if os.name == "nt":
+                    self._file.seek(0)
+                    msvcrt.locking(self._file.fileno(), msvcrt.LK_NBLCK, 1)
+                else:
+                    fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return
+            except OSError:
+                if time.monotonic() >= deadline:
+                    raise TimeoutError(f"{self.path}: verrouillé par une autre instance")
+                time.sleep(0.01)
+
+    def _unlock_file(self):
+        if os.name == "nt":
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+
+
+class ChangeWatcher:
+    # Calls signature() every `interval` seconds on a background thread and
+    # raises a flag when its value changes. Size and mtime polling rather
+    # than inotify, which doesn't see writes made from other machines.
+    def __init__(self, signature, interval=POLL):
+        self.signature = signature
+        self.interval = interval
+        self._changed = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="share-watcher", daemon=True)
+        self._thread.start()
+
+    def poll(self):
+        # True once after each change
+        if self._changed.is_set():
+            self._changed.clear()
+            return True
+        return False
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        last = None
+        while not self._stopped.wait(self.interval):
+            try:
+                current = self.signature()
+            except OSError:
+                continue  # Share briefly unreachable, look again later
+            if current != last:
+                if last is not None:
+                    self._changed.set()
+                last = current
+
+
+class Merge:
+    # What a sync did to the store on behalf of other instances: keys
+    # `added`, `updated` and `removed`, or `reloaded` as a whole. `conflicts`
+    # lists the local changes that lost, as (record before, ours, theirs);
+    # ours or theirs is None for a removal.
+    def __init__(self):
+        self.added = []
+        self.updated = []
+        self.removed = []
+        self.conflicts = []
+        self.reloaded = False
+
+    def __len__(self):
+        return len(self.added) + len(self.updated) + len(self.removed) + len(self.conflicts)
+
+    def __bool__(self):
+        return self.reloaded or len(self) > 0
+
+    def summary(self):
+        if self.reloaded:
+            return "données rechargées"
+        return (f"{len(self.added)} ajouté(s), {len(self.removed)} supprimé(s), "
+                f"{len(self.updated)} modifié(s)")
+
+
+class SharedTextStorage(TextStorage):
+    # Journaled text file that several instances, on several machines, use
+    # at once. All of them append to the same journal generations under a
+    # FileLock, and each one replays what the others appended since its last
+    # sync. A change carries the record it was made on, which acts as the
+    # record's version: replayed in journal order, it only applies if the
+    # record still has that value. The first writer wins everywhere; a later
+    # change to the same record is dropped and reported to its author.
+    #
+    # Local changes wait in `_pending` until commit() (end of a transaction)
+    # or sync() appends them. commit() only does so while no other instance
+    # wrote in between, so it never touches the store; sync() merges first.
+    # Same files as JournaledTextStorage: a compacted text file starting with
+    # "# journal: N" and journal generations N+1, N+2...
+    _journal_path = JournaledTextStorage._journal_path
+    _generations = JournaledTextStorage._generations
+    _base_generation = JournaledTextStorage._base_generation
+    _wait_compaction = JournaledTextStorage._wait_compaction
+
+    def __init__(self, path, threshold=1 << 20):
+        super().__init__(path)
+        self.threshold = threshold
+        self.lock = FileLock(path + ".lock")
+        self.generation = None  # Read position in the journal: generation, byte offset
+        self.offset = 0
+        self._pending = []
+        self._merging = False
+        self._compactor = None
+
+    @property
+    def pending(self):
+        # Local changes not appended to the shared journal yet
+        return len(self._pending)
+
+    def load(self):
+        items, self.generation, self.offset = self._read()
+        return items
+
+    def count(self):
+        return len(self._read()[0])
+
+    def signature(self):
+        # What the ChangeWatcher compares: the text file, the journal being
+        # read and the next one (created when another instance rotates)
+        if self.generation is None:
+            return None
+        return (_stat(self.path), _stat(self._journal_path(self.generation)),
+                _stat(self._journal_path(self.generation + 1)))
+
+    @contextmanager
+    def transaction(self):
+        # The changes of a transaction are appended together when it ends
+        self._depth += 1
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            if self._depth == 0:
+                self.commit()
+
+    def commit(self):
+        # Appends the pending changes, unless another instance wrote since
+        # the last sync: they then wait for sync(). True if none are left.
+        with self.lock:
+            return self._commit()
+
+    def sync(self):
+        # Merges what the other instances appended since the last sync, then
+        # appends the pending changes. Returns a Merge.
+        merge = Merge()
+        with self.lock:
+            entries = self._read_new()
+            if entries is None:
+                self._reload(merge)
+            else:
+                self._merging = True
+                try:
+                    for entry in entries:
+                        self._apply(entry, merge)
+                finally:
+                    self._merging = False
+            self._commit(caught_up=True)
+        return merge
+
+    def insert(self, key, record):
+        self._pending.append({"op": "add", "new": record})
+
+    def insert_many(self, pairs):
+        self._pending.extend({"op": "add", "new": record} for _, record in pairs)
+        self.commit()
+
+    def replace_all(self, pairs):
+        # New contents for every instance, the others reload them
+        self._wait_compaction()
+        with self.lock:
+            generations = self._generations()
+            folded = max(generations + [self._base_generation(), self.generation or 0])
+            size = write_employees(self.path, (record for _, record in pairs), f"{HEADER}{folded}\n")
+            for generation in generations:
+                os.remove(self._journal_path(generation))
+            self._pending = []
+            self.generation, self.offset = folded + 1, 0
+        return size
+
+    def flush(self):
+        self.commit()
+
+    def snapshot(self):
+        # Commits and starts a new generation, the older ones get folded into
+        # the text file. None if there's nothing to fold or other instances'
+        # changes have to be merged first.
+        with self.lock:
+            if not self._commit() or not self.offset:
+                return None
+            return self._rotate()
+
+    def write_snapshot(self, snapshot):
+        if snapshot is None:
+            return 0
+        return self._compact(*snapshot)
+
+    def close(self):
+        if self.store is not None and self.generation is not None:
+            self.sync()
+        self._wait_compaction()
+        self.lock.close()
+
+    def _on_change(self, op, key, old, new):
+        if self._merging or op == "reset":
+            return
+        entry = {"op": op}
+        if old is not None:
+            entry["old"] = old
+        if new is not None:
+            entry["new"] = new
+        self._pending.append(entry)
+        if not self._depth and len(self._pending) >= BATCH:
+            self.commit()
+
+    def _read(self, folded=None):
+        # Rows of the text file with the newer generations (up to `folded`)
+        # replayed, and the position reached
+        with self.lock:
+            store = EmployeeStore()
+            store.load(read_employees(self.path))
+            base = self._base_generation()
+            generation, offset = base + 1, 0
+            for generation in [g for g in self._generations()
+                               if g > base and (folded is None or g <= folded)]:
+                with open(self._journal_path(generation), "rb") as f:
+                    data = f.read()
+                offset = data.rfind(b"\n") + 1
+                for entry in _entries(data[:offset]):
+                    apply_entry(store, entry)
+        return list(store.items()), generation, offset
+
+    def _read_new(self):
+        # Entries appended since the last sync, or None when the generation
+        # being read was folded and removed meanwhile (too far behind)
+        entries = []
+        while True:
+            try:
+                with open(self._journal_path(self.generation), "rb") as f:
+                    f.seek(self.offset)
+                    data = f.read()
+            except FileNotFoundError:
+                if self.generation <= self._base_generation():
+                    return None
+                data = b""
+            end = data.rfind(b"\n") + 1
+            entries.extend(_entries(data[:end]))
+            self.offset += end
+            if not os.path.exists(self._journal_path(self.generation + 1)):
+                return entries
+            self.generation, self.offset = self.generation + 1, 0
+
+    def _apply(self, entry, merge):
+        store = self.store
+        new = make_record(entry["new"]) if "new" in entry else None
+        if entry["op"] == "add":
+            merge.added.append(store.add(new))
+            return
+        old = make_record(entry["old"])
+        chain = self._chain(old)
+        if chain:
+            # Changed here too but not appended yet: the other instance was
+            # first, its change replaces ours
+            ours = chain[-1].get("new")
+            self._pending = [pending for pending in self._pending
+                             if not any(pending is changed for changed in chain)]
+            merge.conflicts.append((old, ours, new))
+            if ours is None:
+                if new is not None:
+                    merge.added.append(store.add(new))
+                return
+            old = ours
+        key = store.find(old)
+        if key is None:
+            return  # Made on a value changed first, every instance drops it
+        if new is None:
+            store.remove(key)
+            merge.removed.append(key)
+        else:
+            store.update(key, new)
+            merge.updated.append(key)
+
+    def _chain(self, old):
+        # The pending changes made on record `old`, following its new values
+        chain = []
+        for pending in self._pending:
+            if pending["op"] != "add" and pending["old"] == old:
+                chain.append(pending)
+                if pending["op"] == "remove":
+                    break
+                old = pending["new"]
+        return chain
+
+    def _reload(self, merge):
+        # Too far behind to replay: reload everything (under new keys, keys
+        # are never reused) and redo the pending changes whose records are
+        # still as they were
+        pending, self._pending = self._pending, []
+        bound = self.store.key_bound
+        self._merging = True
+        try:
+            self.store.load_items((key + bound, record) for key, record in self.load())
+        finally:
+            self._merging = False
+        for entry in pending:
+            if entry["op"] != "add" and self.store.find(entry["old"]) is None:
+                merge.conflicts.append((make_record(entry["old"]), entry.get("new"), None))
+            else:
+                apply_entry(self.store, entry)  # Pending again through _on_change
+        merge.reloaded = True
+
+    def _commit(self, caught_up=False):
+        if self.generation is None:
+            _, self.generation, self.offset = self._read()
+        if self._pending:
+            if not caught_up and not self._caught_up():
+                return False
+            self._append(self._pending)
+            self._pending = []
+        if self.offset >= self.threshold and self.store is not None:
+            if self._compactor is not None and self._compactor.is_alive():
+                return True  # It waits for this lock, it can't be joined here
+            self._compactor = threading.Thread(target=self._compact, args=self._rotate(),
+                                               name="journal-compaction", daemon=True)
+            self._compactor.start()
+        return True
+
+    def _caught_up(self):
+        # Nothing appended by another instance since the last sync
+        stat = _stat(self._journal_path(self.generation))
+        return ((stat[0] if stat else 0) == self.offset
+                and not os.path.exists(self._journal_path(self.generation + 1)))
+
+    def _append(self, entries):
+        lines = "".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries)
+        with open(self._journal_path(self.generation), "ab") as f:
+            if f.tell() != self.offset:
+                f.write(b"\n")  # After the torn last line of an instance that crashed
+            f.write(lines.encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+            self.offset = f.tell()
+
+    def _rotate(self):
+        # Closes the current generation for every instance. The rows to fold
+        # are rebuilt from the files by the compaction, not copied here.
+        folded = self.generation
+        self.generation, self.offset = folded + 1, 0
+        open(self._journal_path(self.generation), "ab").close()  # Tells the others
+        return None, folded
+
+    def _compact(self, records, folded):
+        # The lock is only held to read the files and to rename the new text
+        # file in: the replay and the rewrite happen in between, without it,
+        # so the other instances' syncs don't wait on them. The generation
+        # just folded is kept until the next compaction, for instances that
+        # haven't read its end yet; later than that they reload.
+        if records is None:
+            records = self._fold(folded)
+            if records is None:
+                return 0  # Another instance folded as far already
+        fd, tmp = tempfile.mkstemp(prefix=os.path.basename(self.path) + ".",
+                                   suffix=".compact", dir=os.path.dirname(os.path.abspath(self.path)))
+        os.close(fd)
+        try:
+            size = write_employees(tmp, records, f"{HEADER}{folded}\n")
+            with self.lock:
+                if folded <= self._base_generation():
+                    return 0
+                os.replace(tmp, self.path)
+                for generation in self._generations():
+                    if generation < folded:
+                        os.remove(self._journal_path(generation))
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        return size
+
+    def _fold(self, folded):
+        # The rows at the end of generation `folded`, or None if the text
+        # file already folds it in. Only reading the files takes the lock:
+        # closed generations don't change any more, the replay runs without it.
+        with self.lock:
+            base = self._base_generation()
+            if folded <= base:
+                return None
+            lines = []
+            if os.path.exists(self.path):
+                with open(self.path, "r", encoding="utf-8") as f:
+                    lines = f.readlines()
+            journals = []
+            for generation in self._generations():
+                if base < generation <= folded:
+                    with open(self._journal_path(generation), "rb") as f:
+                        journals.append(f.read())
+        store = EmployeeStore()
+        store.load(parse_line(line) for line in lines if line.strip() and not line.startswith("#"))
+        for data in journals:
+            for entry in _entries(data[:data.rfind(b"\n") + 1]):
+                apply_entry(store, entry)
+        return store.records()
+
+
+def _entries(data):
+    for line in data.splitlines():
+        try:
+            yield json.loads(line)
+        except ValueError:
+            pass  # Torn write of an instance that crashed
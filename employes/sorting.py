@@ -0,0 +1,90 @@
+from math import log2
+
+from .store import COLUMNS
+
+
+def text_key(value):
+    return value.lower()
+
+
+# Typed keys are flattened to ints or plain strings, which compare much
+# faster than tuples when sorting hundreds of thousands of rows
+
+def year_key(value):
+    # Numeric years first, anything else after them
+    return int(value) if value.isdigit() else 1 << 32
+
+
+def id_key(value):
+    # "EMP-2024-001" -> "EMP\x00000002024\x00000000001", so that the year and
+    # the sequence number compare numerically; malformed IDs sort last
+    parts = value.split("-")
+    if len(parts) == 3 and parts[1].isdigit() and parts[2].isdigit():
+        return f"{parts[0]}\x00{int(parts[1]):09d}\x00{int(parts[2]):09d}"
+    return "\uffff" + value
+
+
+SORT_KEYS = {
+    "Nom": text_key,
+    "CIN": str,
+    "Année": year_key,
+    "ID": id_key,
+}
+
+
+class SortCache:
+    # Sort permutations of the store keys computed on typed keys. A spec is a
+    # tuple of (column, descending) pairs, the first one being the primary
+    # sort. Typed columns are built once and kept up to date from store
+    # events; permutations are cached until the next mutation.
+    def __init__(self, store):
+        self.store = store
+        self._columns = {}  # column -> typed keys indexed by store key
+        self._orders = {}
+        store.subscribe(self._on_change)
+
+    def order(self, spec):
+        # All store keys in spec order
+        spec = tuple(spec)
+        order = self._orders.get(spec)
+        if order is None:
+            order = self._orders[spec] = self._sort(self.store.keys(), spec)
+        return order
+
+    def sort(self, keys, spec):
+        # Put a subset of the store keys (e.g. search results) in spec order
+        spec = tuple(spec)
+        if not spec:
+            return keys
+        if len(keys) == len(self.store):
+            return self.order(spec)
+        if len(keys) * log2(len(keys) + 2) < len(self.store):
+            return self._sort(list(keys), spec)
+        wanted = set(keys)
+        return [key for key in self.order(spec) if key in wanted]
+
+    def _sort(self, keys, spec):
+        # Stable multi-column sort: sort by the last column first
+        for column, descending in reversed(spec):
+            keys.sort(key=self._column(column).__getitem__, reverse=descending)
+        return keys
+
+    def _column(self, column):
+        values = self._columns.get(column)
+        if values is None:
+            index = COLUMNS.index(column)
+            convert = SORT_KEYS[column]
+            values = self._columns[column] = [None] * self.store.key_bound
+            for key, value in self.store.column(index):
+                values[key] = convert(value)
+        return values
+
+    def _on_change(self, op, key, old, new):
+        self._orders.clear()
+        if op == "reset":
+            self._columns.clear()
+        elif new is not None:
+            for column, values in self._columns.items():
+                if key >= len(values):
+                    values.extend([None] * (key + 1 - len(values)))
+                values[key] = SORT_KEYS[column](new[COLUMNS.index(column)])
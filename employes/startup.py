@@ -0,0 +1,57 @@
+import importlib
+import sys
+import time
+
+# Subsystems that must not be imported before they are first used. Their
+# presence in sys.modules after the login window is up is a startup regression.
+HEAVY_MODULES = ("matplotlib", "reportlab", "PIL", "requests", "smtplib",
+                 "email.mime", "tkcalendar")
+
+
+class StartupReport:
+    # Startup phases and on-demand imports, timed from `start` (perf_counter
+    # taken as early as possible in the main module). Printed in the spirit
+    # of `python -X importtime`: one line per phase or import, microseconds.
+    def __init__(self, start=None):
+        self.start = time.perf_counter() if start is None else start
+        self.phases = []   # (name, seconds since start)
+        self.imports = []  # (module, seconds spent importing, seconds since start)
+
+    def mark(self, name):
+        self.phases.append((name, time.perf_counter() - self.start))
+
+    def elapsed(self, name):
+        for phase, seconds in self.phases:
+            if phase == name:
+                return seconds
+        return None
+
+    def heavy_modules(self):
+        # HEAVY_MODULES currently loaded, whoever imported them
+        return [name for name in HEAVY_MODULES if name in sys.modules]
+
+    def format(self):
+        lines = ["startup: cumulative [us] | event"]
+        events = [(seconds, f"phase {name}") for name, seconds in self.phases]
+        events += [(at, f"import {module} ({spent * 1e6:.0f} us)") for module, spent, at in self.imports]
+        for seconds, event in sorted(events):
+            lines.append(f"startup: {seconds * 1e6:14.0f} | {event}")
+        heavy = self.heavy_modules()
+        lines.append("startup: heavy modules loaded: " + (", ".join(heavy) if heavy else "none"))
+        return "\n".join(lines)
+
+
+report = StartupReport()
+
+
+def load(module):
+    # importlib.import_module, timing the first import of each module so that
+    # on-demand loads show up in the startup report
+    loaded = sys.modules.get(module)
+    if loaded is not None:
+        return loaded
+    start = time.perf_counter()
+    loaded = importlib.import_module(module)
+    end = time.perf_counter()
+    report.imports.append((module, end - start, end - report.start))
+    return loaded
@@ -0,0 +1,110 @@
+from collections import Counter
+from datetime import datetime
+
+YEAR, DEPT = 2, 4  # Record positions of Année and Département
+
+# Fixed age bins so the chart keeps the same bars from one update to the next:
+# [AGE_MIN, AGE_MIN + AGE_STEP), ... with the outer bins open-ended
+AGE_MIN, AGE_MAX, AGE_STEP = 20, 70, 5
+
+
+def age_bins():
+    # Left edges of the bins, the last one collects every age >= AGE_MAX
+    return list(range(AGE_MIN - AGE_STEP, AGE_MAX + 1, AGE_STEP))
+
+
+class DashboardStats:
+    # Aggregates for the dashboard kept up to date from store events: count,
+    # birth years and departments are counters, so an add, edit or delete
+    # costs a couple of dict updates. The age histogram is derived from the
+    # (at most ~100) distinct years when read. `version` only moves when an
+    # aggregate actually changed, e.g. renaming an employee leaves it alone.
+    # After a reload the counters are rebuilt on first read, so rows loaded
+    # lazily aren't all decoded before the dashboard is opened.
+    def __init__(self, store):
+        self.store = store
+        self.count = 0
+        self._years = Counter()  # Valid birth year (int) -> employees
+        self._departments = Counter()
+        self._built = False
+        self.version = 0
+        self._histogram = None  # (version, current year, counts)
+        self._rebuild()
+        store.subscribe(self._on_change)
+
+    @property
+    def years(self):
+        self._ensure_built()
+        return self._years
+
+    @property
+    def departments(self):
+        self._ensure_built()
+        return self._departments
+
+    def age_histogram(self):
+        # Employee count per bin of age_bins(), recomputed only after a change
+        # (or when the year rolls over)
+        current_year = datetime.now().year
+        cached = self._histogram
+        if cached is not None and cached[:2] == (self.version, current_year):
+            return cached[2]
+        edges = age_bins()
+        counts = [0] * len(edges)
+        for year, count in self.years.items():
+            age = current_year - year
+            index = (min(max(age, edges[0]), edges[-1]) - edges[0]) // AGE_STEP
+            counts[index] += count
+        self._histogram = (self.version, current_year, counts)
+        return counts
+
+    def mean_age(self):
+        total = sum(self.years.values())
+        if not total:
+            return None
+        return datetime.now().year - sum(year * count for year, count in self.years.items()) / total
+
+    def _rebuild(self):
+        self.count = len(self.store)
+        self._built = False
+        self.version += 1
+
+    def _ensure_built(self):
+        if self._built:
+            return
+        # Counted per distinct value, columnar rows don't even build strings
+        self._years.clear()
+        for year, count in self.store.counts(YEAR).items():
+            if year.isdigit():
+                self._years[int(year)] += count
+        self._departments = +self.store.counts(DEPT)
+        self._departments.pop("", None)
+        self._built = True
+
+    def _count(self, record, delta):
+        years, departments = self._years, self._departments
+        year = record[YEAR]
+        if year.isdigit():
+            years[int(year)] += delta
+            if not years[int(year)]:
+                del years[int(year)]
+        if record[DEPT]:
+            departments[record[DEPT]] += delta
+            if not departments[record[DEPT]]:
+                del departments[record[DEPT]]
+
+    def _on_change(self, op, key, old, new):
+        if op == "reset":
+            self._rebuild()
+            return
+        if op == "update" and (old[YEAR], old[DEPT]) == (new[YEAR], new[DEPT]):
+            return
+        if old is not None:
+            if self._built:
+                self._count(old, -1)
+            self.count -= op == "remove"
+        if new is not None:
+            if self._built:
+                self._count(new, 1)
+            self.count += op == "add"
+        self.version += 1
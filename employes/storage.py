@@ -0,0 +1,335 @@
+import os
+import sqlite3
+from contextlib import contextmanager
+
+from .store import format_line, read_employees, write_employees
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS employes (
+    id INTEGER PRIMARY KEY,
+    nom TEXT NOT NULL,
+    cin TEXT NOT NULL,
+    annee TEXT NOT NULL,
+    emp_id TEXT NOT NULL,
+    departement TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS employes_cin ON employes (cin);
+CREATE INDEX IF NOT EXISTS employes_emp_id ON employes (emp_id);
+CREATE INDEX IF NOT EXISTS employes_annee ON employes (annee);
+"""
+
+# Statements are kept as constants so sqlite3's statement cache reuses the
+# prepared versions instead of compiling them for every row
+SELECT_ALL = "SELECT id, nom, cin, annee, emp_id, departement FROM employes ORDER BY id"
+INSERT = "INSERT INTO employes (id, nom, cin, annee, emp_id, departement) VALUES (?, ?, ?, ?, ?, ?)"
+UPDATE = "UPDATE employes SET nom = ?, cin = ?, annee = ?, emp_id = ?, departement = ? WHERE id = ?"
+DELETE = "DELETE FROM employes WHERE id = ?"
+
+BATCH = 10000  # Rows per executemany call in bulk writes
+
+DB_FILE = "employes.db"
+DATA_FILE = "employes.txt"  # Legacy text format, migrated into DB_FILE once
+# Set to a .txt path to keep the text format (journaled, safe to share
+# between instances) instead of SQLite, or to a .emp path for the
+# memory-mapped binary format
+STORAGE_FILE = os.environ.get("EMPLOYES_STORAGE", DB_FILE)
+DATABASES = (".db", ".sqlite", ".sqlite3")
+# Filesystem types of /proc/mounts that are network shares
+NETWORK_FILESYSTEMS = {"nfs", "nfs4", "cifs", "smb3", "smbfs", "9p", "afs", "ceph",
+                       "glusterfs", "lustre", "fuse.sshfs"}
+
+
+def on_network_share(path):
+    # True when path is on a network filesystem. EMPLOYES_SHARED=1 (or 0)
+    # overrides the detection, e.g. for a share it doesn't recognize.
+    forced = os.environ.get("EMPLOYES_SHARED")
+    if forced:
+        return forced != "0"
+    path = os.path.abspath(path)
+    if os.name == "nt":
+        drive = os.path.splitdrive(path)[0]
+        if drive.startswith("\\\\"):
+            return True  # UNC path
+        import ctypes
+        return ctypes.windll.kernel32.GetDriveTypeW(drive + "\\") == 4  # DRIVE_REMOTE
+    try:
+        with open("/proc/mounts", encoding="utf-8") as f:
+            mounts = [line.split()[1:3] for line in f]
+    except OSError:
+        return False  # No /proc (macOS): only EMPLOYES_SHARED tells
+    directory = os.path.realpath(os.path.dirname(path))
+    found, kind = "", None
+    for point, fstype in mounts:
+        point = point.replace("\\040", " ")
+        inside = directory == point or directory.startswith(point.rstrip("/") + "/")
+        if inside and len(point) >= len(found):
+            found, kind = point, fstype
+    return kind in NETWORK_FILESYSTEMS
+
+
+def open_storage(path, shared=True):
+    # The file extension picks the backend. Text files are opened for use by
+    # several instances at once unless shared is False (e.g. to read a backup).
+    extension = os.path.splitext(path)[1].lower()
+    if shared and extension in DATABASES + (".emp",) and on_network_share(path):
+        return _shared_text(path)
+    if extension in DATABASES:
+        return SqliteStorage(path)
+    if extension == ".emp":
+        from .binfile import BinaryStorage
+        return BinaryStorage(path)
+    if shared:
+        from .shared import SharedTextStorage
+        return SharedTextStorage(path)
+    from .journal import JournaledTextStorage
+    return JournaledTextStorage(path)
+
+
+def _shared_text(path):
+    # Neither SQLite (its locks don't always reach the server, WAL needs
+    # shared memory) nor the binary file (single writer) can be shared by
+    # instances on several machines: on a network share the rows go to a
+    # text file next to path instead. Rows already in path are moved there
+    # by the first instance to get the lock.
+    from .shared import SharedTextStorage
+    storage = SharedTextStorage(os.path.splitext(path)[0] + ".txt")
+    with storage.lock:
+        if os.path.exists(path) and not os.path.exists(storage.path):
+            if os.path.splitext(path)[1].lower() in DATABASES:
+                conn = sqlite3.connect(path)
+                try:
+                    write_employees(storage.path, (row[1:] for row in conn.execute(SELECT_ALL)))
+                finally:
+                    conn.close()
+            else:
+                from .binfile import BinaryStorage
+                source = BinaryStorage(path)
+                try:
+                    write_employees(storage.path, (record for _, record in source.load()))
+                finally:
+                    source.close()
+            os.replace(path, path + ".migrated")
+    return storage
+
+
+def _batches(pairs):
+    batch = []
+    for key, record in pairs:
+        batch.append((key,) + tuple(record))
+        if len(batch) >= BATCH:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class SqliteStorage:
+    # One row per employee, the row id is the store key. Writes follow store
+    # events one row at a time; wrap bulk changes in transaction(). For one
+    # instance at a time: open_storage() doesn't use it on network shares.
+    def __init__(self, path):
+        self.path = path
+        # Not tied to the opening thread: a bulk restore rewrites the table
+        # from a job thread while nothing else uses the storage
+        self.conn = sqlite3.connect(path, isolation_level=None, cached_statements=64,
+                                    check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self._depth = 0
+        self._wal = (0, 0)  # (log, checkpointed) frames after the last checkpoint
+
+    def load(self):
+        # Yields (key, record) pairs in key order
+        for row in self.conn.execute(SELECT_ALL):
+            yield row[0], row[1:]
+
+    def count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM employes").fetchone()[0]
+
+    def load_into(self, store):
+        store.load_items(self.load())
+
+    def read_records(self):
+        # Uses its own connection so it can run on another thread; the read
+        # transaction sees a consistent snapshot while the UI keeps writing
+        conn = sqlite3.connect(self.path)
+        try:
+            for row in conn.execute(SELECT_ALL):
+                yield row[1:]
+        finally:
+            conn.close()
+
+    def attach(self, store):
+        store.subscribe(self._on_change)
+
+    def detach(self, store):
+        store.unsubscribe(self._on_change)
+
+    @contextmanager
+    def transaction(self):
+        # Commits once at the end, even when the block fails: the store only
+        # undoes the change whose write failed, the ones before it stay
+        if self._depth == 0:
+            self.conn.execute("BEGIN IMMEDIATE")
+        self._depth += 1
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            if self._depth == 0 and self.conn.in_transaction:
+                self.conn.execute("COMMIT")
+
+    @contextmanager
+    def _atomic(self):
+        # All or nothing, for bulk writes that don't go through the store.
+        # A savepoint, so it also nests in transaction().
+        self.conn.execute("SAVEPOINT bulk")
+        try:
+            yield
+        except BaseException:
+            self.conn.execute("ROLLBACK TO bulk")
+            self.conn.execute("RELEASE bulk")
+            raise
+        self.conn.execute("RELEASE bulk")
+
+    def insert(self, key, record):
+        self.conn.execute(INSERT, (key,) + tuple(record))
+
+    def update(self, key, record):
+        self.conn.execute(UPDATE, tuple(record) + (key,))
+
+    def delete(self, key):
+        self.conn.execute(DELETE, (key,))
+
+    def insert_many(self, pairs):
+        with self._atomic():
+            for batch in _batches(pairs):
+                self.conn.executemany(INSERT, batch)
+
+    def replace_all(self, pairs):
+        with self._atomic():
+            self.conn.execute("DELETE FROM employes")
+            for batch in _batches(pairs):
+                self.conn.executemany(INSERT, batch)
+
+    def flush(self):
+        # Everything is already committed; fold the WAL back into the database
+        if self._depth == 0:
+            self.conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+    def snapshot(self):
+        # Rows are committed as they change, there is nothing to copy
+        return None
+
+    def write_snapshot(self, snapshot):
+        # Runs on the auto-save thread, which needs its own connection.
+        # Returns the bytes checkpointed from the WAL into the database.
+        conn = sqlite3.connect(self.path)
+        try:
+            _, log, checkpointed = conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+            page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        finally:
+            conn.close()
+        # The frame counters are cumulative until the WAL restarts from the top
+        previous = self._wal[1] if log >= self._wal[0] else 0
+        self._wal = (log, checkpointed)
+        return max(checkpointed - previous, 0) * page_size
+
+    def migrate_text(self, text_path):
+        # One-shot import of a legacy employes.txt into an empty database.
+        # The text file is kept, renamed, so it is never imported twice.
+        if not os.path.exists(text_path) or self.count():
+            return 0
+        rows = list(enumerate(read_employees(text_path)))
+        self.insert_many(rows)
+        os.replace(text_path, text_path + ".migrated")
+        return len(rows)
+
+    def close(self):
+        self.conn.close()
+
+    def _on_change(self, op, key, old, new):
+        if op == "add":
+            self.insert(key, new)
+        elif op == "update":
+            self.update(key, new)
+        elif op == "remove":
+            self.delete(key)
+
+
+class TextStorage:
+    # Legacy "Nom: x, CIN: y, Année: z, ID: w" file. Additions are appended,
+    # any other change rewrites the file from the attached store (once per
+    # transaction).
+    def __init__(self, path):
+        self.path = path
+        self.store = None
+        self._depth = 0
+        self._dirty = False
+
+    def load(self):
+        return enumerate(read_employees(self.path))
+
+    def count(self):
+        return sum(1 for _ in read_employees(self.path))
+
+    def load_into(self, store):
+        store.load_items(self.load())
+
+    def attach(self, store):
+        self.store = store
+        store.subscribe(self._on_change)
+
+    def detach(self, store):
+        store.unsubscribe(self._on_change)
+        self.store = None
+
+    @contextmanager
+    def transaction(self):
+        self._depth += 1
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            if self._depth == 0 and self._dirty:
+                self._rewrite()
+
+    def insert(self, key, record):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(format_line(record))
+
+    def insert_many(self, pairs):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.writelines(format_line(record) for _, record in pairs)
+
+    def replace_all(self, pairs):
+        write_employees(self.path, (record for _, record in pairs))
+        self._dirty = False
+
+    def flush(self):
+        pass
+
+    def snapshot(self):
+        # The file is rewritten as changes happen, there is nothing to copy
+        return None
+
+    def write_snapshot(self, snapshot):
+        return 0
+
+    def close(self):
+        pass
+
+    def _rewrite(self):
+        if self._depth:
+            self._dirty = True
+            return
+        self.replace_all(self.store.items())
+
+    def _on_change(self, op, key, old, new):
+        if op == "add":
+            if self._depth and self._dirty:
+                return  # The pending rewrite will include it
+            self.insert(key, new)
+        elif op in ("update", "remove"):
+            self._rewrite()
@@ -0,0 +1,301 @@
+import os
+import re
+from collections import Counter
+from operator import itemgetter
+
+FIELDS = ("Nom", "CIN", "Année", "ID", "Département")
+COLUMNS = FIELDS[:4]  # Columns shown in the table
+_MISSING = object()
+
+
+class Employee(tuple):
+    # A record: (nom, cin, annee, id, departement). Still a tuple, so it
+    # compares, hashes and serializes like one, with no per-instance dict.
+    __slots__ = ()
+
+    nom = property(itemgetter(0))
+    cin = property(itemgetter(1))
+    annee = property(itemgetter(2))
+    id = property(itemgetter(3))
+    departement = property(itemgetter(4))
+
+
+def make_record(values):
+    values = [str(v).strip() for v in values][:len(FIELDS)]
+    values += [""] * (len(FIELDS) - len(values))
+    return Employee(values)
+
+
+LINE = re.compile(r"^Nom: (.*), CIN: (.*?), Année: (.*?), ID: (.*?)(?:, Département: (.*))?$")
+
+
+def parse_line(line):
+    # Format: "Nom: x, CIN: y, Année: z, ID: w[, Département: d]". Anchoring
+    # on the labels keeps names containing ", " in one piece.
+    match = LINE.match(line.strip())
+    if match:
+        return make_record(value or "" for value in match.groups())
+    parts = line.strip().split(", ")
+    return make_record(p.split(": ", 1)[-1] for p in parts)
+
+
+def format_line(record):
+    line = ", ".join(f"{field}: {value}" for field, value in zip(COLUMNS, record))
+    if record[4]:
+        line += f", Département: {record[4]}"
+    return line + "\n"
+
+
+def read_employees(path):
+    if not os.path.exists(path):
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip() and not line.startswith("#"):
+                yield parse_line(line)
+
+
+def write_employees(path, records, header=""):
+    # Written to a temporary file renamed over path, so a crash leaves either
+    # the old or the new contents. Returns the number of bytes written.
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(header)
+        f.writelines(format_line(record) for record in records)
+        f.flush()
+        os.fsync(f.fileno())
+        size = f.tell()
+    os.replace(tmp, path)
+    return size
+
+
+def _index_add(index, value, key):
+    # Keys are stored directly; only duplicated values pay for a list
+    found = index.get(value)
+    if found is None:
+        index[value] = key
+    elif isinstance(found, list):
+        found.append(key)
+    else:
+        index[value] = [found, key]
+
+
+def _index_remove(index, value, key):
+    found = index.get(value)
+    if isinstance(found, list):
+        found.remove(key)
+        if len(found) == 1:
+            index[value] = found[0]
+    elif found == key:
+        del index[value]
+
+
+def _index_get(index, value):
+    found = index.get(value)
+    if isinstance(found, list):
+        return found[0]
+    return found
+
+
+class EmployeeStore:
+    def __init__(self, rows=dict):
+        # Row keys are increasing integers, so key order is insertion order.
+        # rows makes the key -> record mapping, e.g. ColumnarRows.
+        self._new_rows = rows
+        self._rows = rows()
+        self._by_id = {}
+        self._by_cin = {}
+        self._next_key = 0
+        self._indexed = True  # False until the ID/CIN indexes of lazy rows are built
+        self._listeners = []
+        self.version = 0
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, key):
+        return key in self._rows
+
+    def __iter__(self):
+        return iter(self._rows)
+
+    @property
+    def key_bound(self):
+        # Every key, past or present, is below this bound
+        return self._next_key
+
+    def get(self, key, default=_MISSING):
+        # With a default, a key removed meanwhile (e.g. while a worker thread
+        # reads the rows) gives the default instead of raising KeyError
+        if default is _MISSING:
+            return self._rows[key]
+        return self._rows.get(key, default)
+
+    def keys(self):
+        return list(self._rows)
+
+    def items(self):
+        return self._rows.items()
+
+    def records(self):
+        return self._rows.values()
+
+    def column(self, index):
+        # (key, value) pairs of one field. Rows kept by column (lazy or
+        # columnar) produce them without building the records.
+        column = getattr(self._rows, "column", None)
+        if column is not None:
+            return column(index)
+        return ((key, record[index]) for key, record in self._rows.items())
+
+    def counts(self, index):
+        # Counter of the values of one field
+        counts = getattr(self._rows, "counts", None)
+        if counts is not None:
+            return counts(index)
+        return Counter(value for _, value in self.column(index))
+
+    def subscribe(self, callback):
+        # callback(op, key, old, new) with op in "add", "update", "remove", "reset"
+        self._listeners.append(callback)
+
+    def unsubscribe(self, callback):
+        self._listeners.remove(callback)
+
+    def _notify(self, op, key=None, old=None, new=None):
+        # A listener that raises refuses the change (e.g. the storage failed
+        # to write it): the row is put back before the error propagates
+        self.version += 1
+        for position, callback in enumerate(self._listeners):
+            try:
+                callback(op, key, old, new)
+            except BaseException:
+                if op != "reset":
+                    self._undo(op, key, old, new, self._listeners[:position])
+                raise
+
+    def _undo(self, op, key, old, new, notified):
+        # Reverts one row change; the listeners that already saw it get the
+        # reverse change
+        if new is not None:
+            self._unindex(key, new)
+            if old is None:
+                del self._rows[key]
+        if old is not None:
+            self._rows[key] = old
+            self._index(key, old)
+        self.version += 1
+        op = {"add": "remove", "remove": "add"}.get(op, op)
+        for callback in notified:
+            callback(op, key, new, old)
+
+    def find_by_id(self, emp_id):
+        self._ensure_indexed()
+        return _index_get(self._by_id, emp_id)
+
+    def find_by_cin(self, cin):
+        self._ensure_indexed()
+        return _index_get(self._by_cin, cin)
+
+    def cin_values(self):
+        # Distinct CINs in the store, as a live set-like view
+        self._ensure_indexed()
+        return self._by_cin.keys()
+
+    def id_values(self):
+        self._ensure_indexed()
+        return self._by_id.keys()
+
+    def find(self, record):
+        # Key of a row equal to record, looked up through the ID index
+        record = make_record(record)
+        self._ensure_indexed()
+        found = self._by_id.get(record[3])
+        for key in found if isinstance(found, list) else (found,):
+            if key is not None and self._rows[key] == record:
+                return key
+        return None
+
+    def add(self, record):
+        record = make_record(record)
+        key = self._next_key
+        self._next_key += 1
+        self._rows[key] = record
+        self._index(key, record)
+        self._notify("add", key, None, record)
+        return key
+
+    def extend(self, records):
+        return [self.add(record) for record in records]
+
+    def load(self, records):
+        # Bulk replace: listeners get a single "reset" instead of one event per row
+        self.load_items(enumerate(records, self._next_key))
+
+    def load_items(self, items):
+        # Same as load() with the keys given, e.g. row ids from storage.
+        # Keys must come in increasing order.
+        self._clear()
+        rows = self._rows
+        for key, record in items:
+            record = make_record(record)
+            rows[key] = record
+            self._index(key, record)
+            self._next_key = max(self._next_key, key + 1)
+        self._notify("reset")
+
+    def load_rows(self, rows):
+        # Bulk replace with a mapping of key -> record that decodes rows on
+        # access (e.g. a memory-mapped file). Nothing is read here: the ID and
+        # CIN indexes are built the first time they are used.
+        self._clear()
+        self._rows = rows
+        self._indexed = False
+        self._next_key = max(self._next_key, rows.key_bound)
+        self._notify("reset")
+
+    def update(self, key, record):
+        record = make_record(record)
+        old = self._rows[key]
+        self._unindex(key, old)
+        self._rows[key] = record
+        self._index(key, record)
+        self._notify("update", key, old, record)
+        return old
+
+    def remove(self, key):
+        record = self._rows.pop(key)
+        self._unindex(key, record)
+        self._notify("remove", key, record, None)
+        return record
+
+    def clear(self):
+        self._clear()
+        self._notify("reset")
+
+    def _clear(self):
+        self._rows = self._new_rows()
+        self._by_id.clear()
+        self._by_cin.clear()
+        self._indexed = True
+
+    def _ensure_indexed(self):
+        if self._indexed:
+            return
+        self._indexed = True
+        for key, cin in self.column(1):
+            _index_add(self._by_cin, cin, key)
+        for key, emp_id in self.column(3):
+            _index_add(self._by_id, emp_id, key)
+
+    def _index(self, key, record):
+        if not self._indexed:
+            return
+        _index_add(self._by_cin, record[1], key)
+        _index_add(self._by_id, record[3], key)
+
+    def _unindex(self, key, record):
+        if not self._indexed:
+            return
+        _index_remove(self._by_cin, record[1], key)
+        _index_remove(self._by_id, record[3], key)
@@ -0,0 +1,186 @@
+import re
+import time
+from datetime import datetime
+from operator import itemgetter
+
+from .store import FIELDS
+
+NAME, CIN, YEAR, ID = 0, 1, 2, 3  # Record positions
+
+CIN_PATTERN = re.compile(r"[A-Z]{2}\d{6}")  # XX123456
+ID_PATTERN = re.compile(r"EMP-\d{4}-\d{3}")  # EMP-2024-001
+MIN_YEAR = 1900
+ADULT_AGE = 18
+
+
+def _not_matching(pattern):
+    # Matches the lines of a "\n"-joined column that don't fully match pattern
+    return re.compile(r"^(?!(?:%s)$).*$" % pattern.pattern, re.M)
+
+
+CIN_MISMATCH = _not_matching(CIN_PATTERN)
+ID_MISMATCH = _not_matching(ID_PATTERN)
+
+
+def _mismatches(pattern, mismatch, values):
+    # Indexes of the values not matching pattern. The column is joined and
+    # scanned by a single regex pass; failures are rare, so turning match
+    # offsets back into indexes costs next to nothing.
+    text = "\n".join(values)
+    if text.count("\n") != len(values) - 1:
+        # A value spans lines, fall back to one match per value
+        return [i for i, value in enumerate(values) if pattern.fullmatch(value) is None]
+    indexes = []
+    line = 0
+    last = 0
+    for match in mismatch.finditer(text):
+        line += text.count("\n", last, match.start())
+        last = match.start()
+        indexes.append(line)
+    return indexes if values else []
+
+
+class ValidationReport:
+    # Per-row errors: {row: [(field, message), ...]}, where row is the
+    # record's index in the checked batch or the label given for it
+    # (e.g. its CSV line number)
+    def __init__(self):
+        self.errors = {}
+
+    def __len__(self):
+        return len(self.errors)
+
+    def __contains__(self, row):
+        return row in self.errors
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    def add(self, row, field, message):
+        errors = self.errors.get(row)
+        if errors is None:
+            errors = self.errors[row] = []
+        errors.append((field, message))
+
+    def merge(self, other):
+        for row, errors in other.errors.items():
+            for field, message in errors:
+                self.add(row, field, message)
+
+    def format(self, limit=20, label="Ligne"):
+        lines = [f"{label} {row}: " + "; ".join(f"{field} {message}" for field, message in errors)
+                 for row, errors in sorted(self.errors.items())[:limit]]
+        if len(self.errors) > limit:
+            lines.append(f"... et {len(self.errors) - limit} autres")
+        return "\n".join(lines)
+
+
+class DataValidator:
+    # Field checks are static so the form can call them one at a time. An
+    # instance checks whole batches and remembers the CINs and IDs it has
+    # seen, so duplicates are caught across successive batches as well as
+    # against the rows already in `store`.
+    _max_year = None
+    _expires = 0
+
+    def __init__(self, store=None):
+        self.store = store
+        self._cins = set()  # Values seen in earlier batches
+        self._ids = set()
+
+    @classmethod
+    def max_year(cls):
+        # Latest acceptable birth year, recomputed at most once an hour
+        now = time.monotonic()
+        if now >= cls._expires:
+            cls._max_year = datetime.now().year - ADULT_AGE
+            cls._expires = now + 3600
+        return cls._max_year
+
+    @staticmethod
+    def validate_cin(cin):
+        return CIN_PATTERN.fullmatch(cin) is not None
+
+    @staticmethod
+    def validate_year(year):
+        try:
+            return MIN_YEAR <= int(year) <= DataValidator.max_year()
+        except ValueError:
+            return False
+
+    @staticmethod
+    def validate_id(id_str):
+        return ID_PATTERN.fullmatch(id_str) is not None
+
+    def check(self, records, rows=None, ignore=None):
+        # Validates records (tuples in store order) and returns a
+        # ValidationReport. rows gives the label of each record in the
+        # report, ignore a store key whose values don't count as duplicates
+        # (the row being edited).
+        report = ValidationReport()
+        rows = range(len(records)) if rows is None else list(rows)
+        add = report.add
+
+        # Column passes that run in C when everything is valid; only the
+        # failures go through per-value checks
+        names = list(map(itemgetter(NAME), records))
+        if "" in names:
+            for i, name in enumerate(names):
+                if not name:
+                    add(rows[i], FIELDS[NAME], "manquant")
+        years = list(map(itemgetter(YEAR), records))
+        valid = {str(year) for year in range(MIN_YEAR, self.max_year() + 1)}
+        if not valid.issuperset(years):
+            for i, year in enumerate(years):
+                if year not in valid and not self.validate_year(year):
+                    add(rows[i], FIELDS[YEAR], f"hors limites ({MIN_YEAR}-{self.max_year()})")
+        cins = list(map(itemgetter(CIN), records))
+        for i in _mismatches(CIN_PATTERN, CIN_MISMATCH, cins):
+            add(rows[i], FIELDS[CIN], "format invalide (XX123456)")
+        ids = list(map(itemgetter(ID), records))
+        for i in _mismatches(ID_PATTERN, ID_MISMATCH, ids):
+            add(rows[i], FIELDS[ID], "format invalide (EMP-AAAA-NNN)")
+
+        self._duplicates(report, rows, cins, CIN, self._cins, ignore)
+        self._duplicates(report, rows, ids, ID, self._ids, ignore)
+
+        # Only accepted rows count for the next batches: a rejected row is
+        # not imported, so a later row may still use its CIN or ID
+        if report.ok:
+            self._cins.update(cins)
+            self._ids.update(ids)
+        else:
+            errors = report.errors
+            for i, row in enumerate(rows):
+                if row not in errors:
+                    self._cins.add(cins[i])
+                    self._ids.add(ids[i])
+        return report
+
+    def _duplicates(self, report, rows, values, field, seen, ignore):
+        # Set operations do the work in C; the per-value loops only run when
+        # duplicates were found
+        name = FIELDS[field]
+        unique = set(values)
+        unique.discard("")
+        clashes = seen & unique
+        if self.store is not None:
+            known = self.store.cin_values() if field == CIN else self.store.id_values()
+            find = self.store.find_by_cin if field == CIN else self.store.find_by_id
+            existing = {value for value in known & unique if find(value) != ignore}
+        else:
+            existing = ()
+        if len(unique) == len(values) and not clashes and not existing:
+            return
+
+        count = len(values)
+        first = dict(zip(reversed(values), range(count - 1, -1, -1)))  # value -> first index
+        first.pop("", None)
+        for i in sorted(set(range(count)).difference(first.values())):
+            if values[i]:
+                report.add(rows[i], name, f"en double (voir {rows[first[values[i]]]})")
+        for value in clashes:
+            report.add(rows[first[value]], name, "en double (lot précédent)")
+        for value in existing:
+            report.add(rows[first[value]], name, "déjà utilisé par un employé existant")
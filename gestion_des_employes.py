@@ -1,27 +1,37 @@
+import sys
+import time
+STARTED = time.perf_counter()  # Startup report reference point
+if __name__ == "__main__" and len(sys.argv) > 1:
+    # Batch mode, e.g. `python -m gestion_des_employes import feed.csv`:
+    # dispatched before tkinter is imported, so no display is needed
+    from employes.cli import main
+    sys.exit(main())
 from tkinter import *
 from tkinter import messagebox, ttk
 from tkinter import filedialog
 import os
-import csv
 from datetime import datetime
-import json
-import shutil
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from reportlab.pdfgen import canvas as pdf_canvas
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from email.mime.application import MIMEApplication
-import locale
-from tkcalendar import DateEntry
+import itertools
+import queue
 import re
-from PIL import Image, ImageTk, ImageDraw
-import requests
-from io import BytesIO
+import threading
+from employes import (HIGH, LOW, NORMAL, AutoSaver, BackupStore, ChangeWatcher, ColumnarRows,
+                      CsvImport, DashboardStats, DataValidator, EmployeeStore, Export, FilterEngine, JobQueue,
+                      PdfReport, SearchIndex, SearchWorker, SharedTextStorage, SortCache,
+                      SqliteStorage, StallDetector, ValidationReport, apply_restore, load_restore, make_record,
+                      open_storage, plan_restore, write_restore)
+from employes.backups import KEEP as BACKUP_KEEP
+from employes.metrics import metrics
+from employes.stats import AGE_STEP, age_bins
+from employes.storage import DATA_FILE, STORAGE_FILE
+from employes import startup
+
+# matplotlib, reportlab and the email packages are imported through
+# startup.load() the first time they are needed, not here
+startup.report.start = STARTED
+startup.report.mark("imports")
+
+OUTBOX = "outbox"  # Email reports waiting for delivery
 
 class CustomWidget:
     @staticmethod
@@ -56,8 +66,8 @@ class ModernEntry(Entry):
         # Create canvas for custom border animation
         self.canvas = Canvas(master, height=2, bg="white", highlightthickness=0)
         self.canvas.place(x=self.winfo_x(), y=self.winfo_y() + self.winfo_height())
-        self.bind("<FocusIn>", self._animate_border_in)
-        self.bind("<FocusOut>", self._animate_border_out)
+        self.bind("<FocusIn>", self._animate_border_in, add="+")
+        self.bind("<FocusOut>", self._animate_border_out, add="+")
         
     def _clear_placeholder(self, event=None):
         if self.get() == self.placeholder:
@@ -131,63 +141,367 @@ class Tooltip:
             self.tooltip.destroy()
             self.tooltip = None
 
-class EmployeeStats:
-    def __init__(self, parent, tree):
-        self.parent = parent
-        self.tree = tree
-        self.fig, self.ax = plt.subplots(figsize=(6, 4))
-        
-    def show_age_distribution(self):
-        current_year = datetime.now().year
-        ages = []
-        for item in self.tree.get_children():
-            values = self.tree.item(item)["values"]
-            try:
-                birth_year = int(values[2])  # Année column
-                age = current_year - birth_year
-                ages.append(age)
-            except:
+class ProgressDialog(Toplevel):
+    # Small modal-less window with a message, a progress bar and a Cancel
+    # button for work running off the Tk thread
+    def __init__(self, parent, title, on_cancel, maximum=100):
+        super().__init__(parent)
+        self.title(title)
+        self.geometry("400x150")
+        self.transient(parent)
+        self.message = StringVar(value="Préparation...")
+        Label(self, textvariable=self.message, font=("Segoe UI", 10)).pack(pady=10)
+        self.bar = ttk.Progressbar(self, length=360, maximum=max(maximum, 1))
+        self.bar.pack(padx=20)
+        Button(self, text="Annuler", command=on_cancel,
+               font=("Segoe UI", 10), bg="#e74c3c", fg="white").pack(pady=10)
+        self.protocol("WM_DELETE_WINDOW", on_cancel)
+        
+    def update_progress(self, value, message):
+        self.bar["value"] = value
+        self.message.set(message)
+
+class JobsPanel(Frame):
+    # One line per queued or running job in the status bar: title, progress
+    # bar, rate and a cancel button. Hidden while there are no jobs.
+    def __init__(self, parent, jobs, **kwargs):
+        super().__init__(parent, **kwargs)
+        self.jobs = jobs
+        self.rows = {}  # job id -> (frame, progress bar, label)
+        
+    def update_jobs(self, changed):
+        for job in changed:
+            row = self.rows.get(job.id)
+            if job.id not in self.jobs.active:
+                if row is not None:
+                    row[0].destroy()
+                    del self.rows[job.id]
                 continue
-                
-        if not ages:
+            if row is None:
+                frame = Frame(self, bg=self["bg"])
+                frame.pack(side=LEFT, padx=5)
+                Label(frame, text=job.title, font=("Segoe UI", 9), bg=self["bg"]).pack(side=LEFT)
+                bar = ttk.Progressbar(frame, length=100, mode="determinate" if job.total else "indeterminate")
+                bar.pack(side=LEFT, padx=3)
+                label = Label(frame, font=("Segoe UI", 9), bg=self["bg"], fg="#7f8c8d")
+                label.pack(side=LEFT)
+                Button(frame, text="✕", command=job.cancel, relief=FLAT, bg=self["bg"],
+                       font=("Segoe UI", 8)).pack(side=LEFT)
+                row = self.rows[job.id] = (frame, bar, label)
+            _, bar, label = row
+            if job.state == "queued":
+                label.config(text="en attente")
+            elif job.total:
+                bar.config(maximum=job.total, value=job.done)
+                label.config(text=f"{job.done}/{job.total} ({job.rate():.0f}/s)")
+            else:
+                bar.step()
+                label.config(text="en cours")
+
+class PerformanceWindow(Toplevel):
+    # Hidden diagnostics view (Ctrl+Shift+P): latency percentiles, rows and
+    # bytes per instrumented operation, and the latest event loop stalls.
+    # Refreshed every second while open.
+    COLUMNS = ("Opération", "Appels", "p50 ms", "p95 ms", "Max ms", "Lignes", "Ko")
+    
+    def __init__(self, parent, metrics):
+        super().__init__(parent)
+        self.title("Performance")
+        self.geometry("720x480")
+        self.metrics = metrics
+        self.refresh_id = None
+        self.tree = ttk.Treeview(self, columns=self.COLUMNS, show="headings", height=12)
+        for column in self.COLUMNS:
+            self.tree.heading(column, text=column)
+            self.tree.column(column, width=200 if column == "Opération" else 80,
+                             anchor=W if column == "Opération" else E)
+        self.tree.pack(fill=BOTH, expand=True, padx=10, pady=(10, 5))
+        Label(self, text="Blocages de la boucle Tk (> 100 ms), les plus récents en premier:",
+              font=("Segoe UI", 9)).pack(anchor=W, padx=10)
+        self.stalls = Listbox(self, height=6, font=("Consolas", 9))
+        self.stalls.pack(fill=X, padx=10, pady=5)
+        buttons = Frame(self)
+        buttons.pack(pady=5)
+        Button(buttons, text="Exporter...", command=self.dump,
+               font=("Segoe UI", 10)).pack(side=LEFT, padx=5)
+        Button(buttons, text="Réinitialiser", command=self.reset,
+               font=("Segoe UI", 10)).pack(side=LEFT, padx=5)
+        self.refresh()
+        
+    def refresh(self):
+        self.tree.delete(*self.tree.get_children())
+        for name, summary in self.metrics.snapshot().items():
+            self.tree.insert("", END, values=(
+                name, summary["count"], f"{summary['p50'] * 1000:.1f}", f"{summary['p95'] * 1000:.1f}",
+                f"{summary['max'] * 1000:.1f}", summary["rows"], f"{summary['bytes'] / 1024:.1f}"))
+        self.stalls.delete(0, END)
+        for at, seconds, callback in reversed(self.metrics.stalls):
+            self.stalls.insert(END, f"{datetime.fromtimestamp(at):%H:%M:%S}  "
+                                    f"{seconds * 1000:7.0f} ms  {callback}")
+        self.refresh_id = self.after(1000, self.refresh)
+        
+    def destroy(self):
+        # The pending refresh would run on a destroyed window
+        if self.refresh_id is not None:
+            self.after_cancel(self.refresh_id)
+            self.refresh_id = None
+        super().destroy()
+        
+    def dump(self):
+        filename = filedialog.asksaveasfilename(
+            parent=self, defaultextension=".json",
+            filetypes=[("JSON files", "*.json"), ("CSV files", "*.csv")]
+        )
+        if filename:
+            try:
+                self.metrics.dump(filename)
+            except OSError as e:
+                messagebox.showerror("Erreur", f"Erreur lors de l'export: {str(e)}", parent=self)
+        
+    def reset(self):
+        self.metrics.reset()
+        self.tree.delete(*self.tree.get_children())
+        self.stalls.delete(0, END)
+
+class VirtualTreeview:
+    # Keeps only the visible window of rows (plus overscan) as Tk items.
+    # Items are fixed "slots" that get recycled while scrolling, the row
+    # data itself stays in the store.
+    def __init__(self, parent, store, columns, rowheight=30, overscan=4, **kwargs):
+        self.store = store
+        self.columns = columns
+        self.rowheight = rowheight
+        self.overscan = overscan
+        self.keys = []
+        self.offset = 0
+        self.visible = 15
+        self.selected = set()
+        self.focus_index = None
+        self._expected_selection = set()
+        
+        self.slots = []        # Slot iids in display order
+        self.slot_keys = {}    # iid -> store key shown
+        self.slot_values = {}  # iid -> record shown
+        self.attached = set()
+        self.slot_ids = itertools.count()  # Never reused: slots get rotated while scrolling
+        
+        self.tree = ttk.Treeview(parent, columns=columns, show="headings",
+                                 height=self.visible, selectmode="extended", **kwargs)
+        self.yscroll = ttk.Scrollbar(parent, orient="vertical", command=self.yview)
+        self.tree.configure(yscrollcommand=self._on_tree_scroll)
+        
+        self.tree.bind("<Configure>", self._on_configure)
+        self.tree.bind("<<TreeviewSelect>>", self._on_select)
+        self.tree.bind("<MouseWheel>", self._on_mousewheel)
+        self.tree.bind("<Button-4>", lambda e: self.scroll(-3))
+        self.tree.bind("<Button-5>", lambda e: self.scroll(3))
+        self.tree.bind("<Up>", lambda e: self.move_focus(-1))
+        self.tree.bind("<Down>", lambda e: self.move_focus(1))
+        self.tree.bind("<Prior>", lambda e: self.move_focus(-self.visible))
+        self.tree.bind("<Next>", lambda e: self.move_focus(self.visible))
+        self.tree.bind("<Home>", lambda e: self.move_focus(-len(self.keys)))
+        self.tree.bind("<End>", lambda e: self.move_focus(len(self.keys)))
+        
+        self._resize_slots()
+        
+    def set_rows(self, keys):
+        # Slots that still show the same row are left untouched
+        self.keys = list(keys)
+        self.selected.intersection_update(self.keys)
+        self.focus_index = None
+        self._scroll_to(0)
+        
+    def append(self, key):
+        self.keys.append(key)
+        self.refresh()
+
+    def extend(self, keys):
+        self.keys.extend(keys)
+        self.refresh()
+        
+    def remove(self, keys):
+        keys = set(keys)
+        self.keys = [key for key in self.keys if key not in keys]
+        self.selected -= keys
+        self.focus_index = None
+        self._scroll_to(self.offset)
+        
+    def selection(self):
+        if len(self.selected) <= 1:
+            return list(self.selected)
+        return [key for key in self.keys if key in self.selected]
+        
+    def refresh(self):
+        self._render()
+        
+    def see(self, index):
+        if index < self.offset:
+            self._scroll_to(index)
+        elif index >= self.offset + self.visible:
+            self._scroll_to(index - self.visible + 1)
+            
+    def scroll(self, rows):
+        self._scroll_to(self.offset + rows)
+        return "break"
+        
+    def yview(self, *args):
+        if args[0] == "moveto":
+            self._scroll_to(int(float(args[1]) * len(self.keys)))
+        elif args[0] == "scroll":
+            step = self.visible if args[2] == "pages" else 1
+            self.scroll(int(args[1]) * step)
+            
+    def move_focus(self, delta):
+        if not self.keys:
+            return "break"
+        if self.focus_index is None:
+            index = min(self.offset, len(self.keys) - 1)
+        else:
+            index = max(0, min(len(self.keys) - 1, self.focus_index + delta))
+        self.focus_index = index
+        self.selected = {self.keys[index]}
+        self.see(index)
+        self._render()
+        return "break"
+        
+    def _scroll_to(self, offset):
+        self.offset = max(0, min(offset, len(self.keys) - self.visible))
+        self._render()
+        
+    def _resize_slots(self):
+        count = self.visible + self.overscan
+        while len(self.slots) < count:
+            iid = f"slot{next(self.slot_ids)}"
+            self.tree.insert("", END, iid=iid)
+            self.slots.append(iid)
+            self.slot_keys[iid] = None
+            self.slot_values[iid] = None
+            self.attached.add(iid)
+        while len(self.slots) > count:
+            iid = self.slots.pop()
+            self.tree.delete(iid)
+            del self.slot_keys[iid], self.slot_values[iid]
+            self.attached.discard(iid)
+            
+    def _render(self):
+        window = self.keys[self.offset:self.offset + len(self.slots)]
+        shown = [self.slot_keys[iid] for iid in self.slots]
+        
+        # Recycle the slots that scrolled out instead of rewriting every row
+        if len(window) == len(self.slots) and len(self.attached) == len(self.slots):
+            for shift in range(1, len(self.slots)):
+                if shown[shift:] == window[:-shift]:
+                    for iid in self.slots[:shift]:
+                        self.tree.move(iid, "", len(self.slots))
+                    self.slots = self.slots[shift:] + self.slots[:shift]
+                    break
+                if shown[:-shift] == window[shift:]:
+                    for iid in reversed(self.slots[-shift:]):
+                        self.tree.move(iid, "", 0)
+                    self.slots = self.slots[-shift:] + self.slots[:-shift]
+                    break
+        
+        for index, iid in enumerate(self.slots):
+            if index < len(window):
+                key = window[index]
+                values = self.store.get(key)
+                # Compared by value: columnar rows build a new record on every get
+                if self.slot_keys[iid] != key or self.slot_values[iid] != values:
+                    self.tree.item(iid, values=values[:len(self.columns)])
+                    self.slot_keys[iid] = key
+                    self.slot_values[iid] = values
+                if iid not in self.attached:
+                    self.tree.move(iid, "", index)
+                    self.attached.add(iid)
+            elif iid in self.attached:
+                self.tree.detach(iid)
+                self.attached.discard(iid)
+                self.slot_keys[iid] = None
+                self.slot_values[iid] = None
+        
+        # Restore selection and focus for the rows in the window
+        visible_selection = [iid for iid in self.slots
+                             if iid in self.attached and self.slot_keys[iid] in self.selected]
+        self._expected_selection = {self.slot_keys[iid] for iid in visible_selection}
+        self.tree.selection_set(visible_selection)
+        if self.focus_index is not None and 0 <= self.focus_index - self.offset < len(window):
+            self.tree.focus(self.slots[self.focus_index - self.offset])
+        
+        total = len(self.keys)
+        if total:
+            self.yscroll.set(self.offset / total, min(1.0, (self.offset + self.visible) / total))
+        else:
+            self.yscroll.set(0.0, 1.0)
+            
+    def _on_configure(self, event=None):
+        bbox = self.tree.bbox(self.slots[0]) if self.slots[0] in self.attached else None
+        top, height = (bbox[1], bbox[3]) if bbox else (self.rowheight, self.rowheight)
+        visible = max(1, (self.tree.winfo_height() - top) // max(1, height))
+        if visible != self.visible:
+            self.visible = visible
+            self._resize_slots()
+            self._scroll_to(self.offset)
+            
+    def _on_tree_scroll(self, first, last):
+        # The Treeview scrolled by itself (e.g. clicking the partially visible
+        # last row): turn that into a virtual scroll
+        if float(first) > 0:
+            shift = max(1, round(float(first) * len(self.attached)))
+            self.tree.yview_moveto(0)
+            self.scroll(shift)
+            
+    def _on_select(self, event=None):
+        keys = {self.slot_keys[iid] for iid in self.tree.selection()}
+        if keys == self._expected_selection:
             return
+        self.selected = keys
+        self._expected_selection = keys
+        focus = self.tree.focus()
+        if focus in self.attached:
+            self.focus_index = self.offset + self.slots.index(focus)
             
-        self.ax.clear()
-        self.ax.hist(ages, bins=10, color='#3498db', alpha=0.7)
+    def _on_mousewheel(self, event):
+        if abs(event.delta) >= 120:
+            rows = -3 * (event.delta // 120)
+        else:
+            rows = -3 if event.delta > 0 else 3
+        return self.scroll(rows)
+
+class EmployeeStats:
+    # Age chart drawn from DashboardStats. The bars are created once and then
+    # resized in place; nothing is redrawn unless the stats version moved.
+    def __init__(self, parent, stats):
+        self.parent = parent
+        self.stats = stats
+        self.drawn_version = None
+        Figure = startup.load("matplotlib.figure").Figure
+        FigureCanvasTkAgg = startup.load("matplotlib.backends.backend_tkagg").FigureCanvasTkAgg
+        self.fig = Figure(figsize=(6, 4))
+        self.ax = self.fig.add_subplot()
+        edges = age_bins()
+        self.bars = self.ax.bar(edges, [0] * len(edges), width=AGE_STEP, align="edge",
+                                color='#3498db', alpha=0.7)
+        self.ax.set_xticks(edges + [edges[-1] + AGE_STEP])
         self.ax.set_title("Distribution d'âge des employés")
         self.ax.set_xlabel("Âge")
         self.ax.set_ylabel("Nombre d'employés")
+        self.canvas = FigureCanvasTkAgg(self.fig, self.parent)
+        self.canvas.get_tk_widget().pack(fill=BOTH, expand=True)
         
-        if not hasattr(self, 'canvas'):
-            self.canvas = FigureCanvasTkAgg(self.fig, self.parent)
-            self.canvas.get_tk_widget().pack(fill=BOTH, expand=True)
-        else:
-            self.canvas.draw()
-
-class DataValidator:
-    @staticmethod
-    def validate_cin(cin):
-        # Format: XX123456
-        pattern = r'^[A-Z]{2}\d{6}$'
-        return bool(re.match(pattern, cin))
-        
-    @staticmethod
-    def validate_year(year):
-        try:
-            year = int(year)
-            current_year = datetime.now().year
-            return 1900 <= year <= current_year - 18
-        except:
-            return False
-            
-    @staticmethod
-    def validate_id(id_str):
-        # Format: EMP-2024-001
-        pattern = r'^EMP-\d{4}-\d{3}$'
-        return bool(re.match(pattern, id_str))
+    def show_age_distribution(self):
+        if self.drawn_version == self.stats.version:
+            return
+        counts = self.stats.age_histogram()
+        for bar, count in zip(self.bars, counts):
+            bar.set_height(count)
+        self.ax.set_ylim(0, max(max(counts), 1) * 1.1)
+        self.drawn_version = self.stats.version
+        self.canvas.draw_idle()
 
 class EmployeeManager:
     def __init__(self):
+        # Times every Tk callback; has to be in place before the first widget
+        StallDetector(metrics).install()
         self.win = Tk()
         self.win.title("Connexion")
         self.win.geometry("320x280")
@@ -210,6 +524,38 @@ class EmployeeManager:
             }
         }
         
+        # Employee data lives in the store, the Treeview only renders it
+        self.store = EmployeeStore(rows=ColumnarRows)  # Packed columns, ~25 bytes + name per row
+        self.storage = open_storage(STORAGE_FILE)
+        if isinstance(self.storage, SqliteStorage):
+            self.storage.migrate_text(DATA_FILE)
+        self.storage.attach(self.store)  # Single-row writes follow store changes
+        self.auto_saver = AutoSaver(self.store, self.storage)
+        # A text file may be shared with other instances: their changes are
+        # merged in as they land, ours are appended on the same timer
+        self.share_watcher = None
+        if isinstance(self.storage, SharedTextStorage):
+            self.share_watcher = ChangeWatcher(self.storage.signature)
+        self.share_polling = False
+        self.editing_key = None
+        self.search_index = SearchIndex(self.store)
+        self.search_worker = SearchWorker(self.search_index, delay=0.1)
+        self.search_polling = False
+        self.search_keys = None  # None when no text search is active
+        self.filters = FilterEngine(self.store)
+        self.filter_criteria = {}
+        self.sorter = SortCache(self.store)
+        self.sort_spec = []  # [(column, descending), ...], primary sort first
+        self.dashboard_stats = DashboardStats(self.store)
+        self.dashboard_pending = None  # after() id of the next dashboard refresh
+        self.store.subscribe(self.on_store_change)
+        self.jobs = JobQueue(workers=3)
+        self.jobs_polling = False
+        self.mailer = None  # Created on the first email report
+        self.mailer_polling = False
+        self.backups = BackupStore()
+        self.restoring = None  # Event set once a bulk restore's storage rewrite is over
+        
         # Language support
         self.current_language = "fr"
         self.load_language()
@@ -226,10 +572,13 @@ class EmployeeManager:
         self.win.bind("<Control-d>", lambda e: self.toggle_theme())
         self.win.bind("<Control-p>", lambda e: self.export_to_pdf())
         self.win.bind("<Control-m>", lambda e: self.send_email_report())
+        self.win.bind("<Control-P>", lambda e: self.show_performance())  # Not in the menus
         
         # Auto-save timer
         self.auto_save_id = None
         self.start_auto_save()
+        self.win.protocol("WM_DELETE_WINDOW", self.on_close)
+        startup.report.mark("login window built")
 
     def load_language(self):
         self.translations = {
@@ -346,8 +695,9 @@ class EmployeeManager:
         # Create main container with modern design
         self.setup_menu()
         self.create_main_interface()
-        self.create_dashboard()
-        self.setup_status_bar()
+        self.setup_status_bar()  # The dashboard is built when first opened
+        if os.path.isdir(OUTBOX):
+            self.win.after_idle(self.resume_outbox)
         
     def setup_menu(self):
         menubar = Menu(self.win)
@@ -366,7 +716,7 @@ class EmployeeManager:
         file_menu.add_separator()
         file_menu.add_command(label="Envoyer Rapport (Ctrl+M)", command=self.send_email_report)
         file_menu.add_separator()
-        file_menu.add_command(label="Quitter", command=self.win.quit)
+        file_menu.add_command(label="Quitter", command=self.on_close)
         
         # View menu
         view_menu = Menu(menubar, tearoff=0)
@@ -390,11 +740,12 @@ class EmployeeManager:
         search_frame.pack(fill=X, pady=(0, 20))
         
         self.search_var = StringVar()
-        self.search_var.trace('w', self.search_employees)
-        search_entry = ModernEntry(search_frame, 
+        self.search_entry = ModernEntry(search_frame, 
                                  placeholder=self.translations[self.current_language]["search_placeholder"],
+                                 textvariable=self.search_var,
                                  font=("Segoe UI", 10))
-        search_entry.pack(side=LEFT, fill=X, expand=True)
+        self.search_entry.pack(side=LEFT, fill=X, expand=True)
+        self.search_var.trace('w', self.search_employees)
         
         # Advanced filters
         self.setup_filters(search_frame)
@@ -455,11 +806,21 @@ class EmployeeManager:
         year_frame = Frame(filters_frame, bg="#f5f6fa")
         year_frame.pack(side=LEFT, padx=5)
         
+        years = ("",) + tuple(range(1900, datetime.now().year + 1))
         Label(year_frame, text="Année:", bg="#f5f6fa").pack(side=LEFT)
         self.year_filter = ttk.Combobox(year_frame, width=6)
         self.year_filter.pack(side=LEFT)
-        self.year_filter['values'] = tuple(range(1900, datetime.now().year + 1))
+        self.year_filter['values'] = years
         self.year_filter.bind('<<ComboboxSelected>>', self.apply_filters)
+        self.year_filter.bind('<Return>', self.apply_filters)
+        
+        # Optional upper bound, turns the year filter into a range
+        Label(year_frame, text="à", bg="#f5f6fa").pack(side=LEFT, padx=(3, 0))
+        self.year_to_filter = ttk.Combobox(year_frame, width=6)
+        self.year_to_filter.pack(side=LEFT)
+        self.year_to_filter['values'] = years
+        self.year_to_filter.bind('<<ComboboxSelected>>', self.apply_filters)
+        self.year_to_filter.bind('<Return>', self.apply_filters)
         
         # Department filter (if you add department field)
         dept_frame = Frame(filters_frame, bg="#f5f6fa")
@@ -487,10 +848,10 @@ class EmployeeManager:
         style.map("Custom.Treeview.Heading",
                  background=[('active', '#2980b9')])
         
-        # Create Treeview
-        self.tree = ttk.Treeview(parent, style="Custom.Treeview",
-                                columns=("Nom", "CIN", "Année", "ID"),
-                                show="headings", height=15)
+        # Create virtual Treeview, only the visible rows exist as Tk items
+        self.table = VirtualTreeview(parent, self.store, ("Nom", "CIN", "Année", "ID"),
+                                     rowheight=30, style="Custom.Treeview")
+        self.tree = self.table.tree
         
         # Configure columns
         for col in ("Nom", "CIN", "Année", "ID"):
@@ -499,23 +860,21 @@ class EmployeeManager:
             self.tree.column(col, width=150)
         
         # Add scrollbars
-        yscroll = ttk.Scrollbar(parent, orient="vertical", 
-                               command=self.tree.yview)
         xscroll = ttk.Scrollbar(parent, orient="horizontal", 
                                command=self.tree.xview)
         
-        self.tree.configure(yscrollcommand=yscroll.set,
-                          xscrollcommand=xscroll.set)
+        self.tree.configure(xscrollcommand=xscroll.set)
         
         # Pack everything
         self.tree.pack(side=LEFT, fill=BOTH, expand=True)
-        yscroll.pack(side=RIGHT, fill=Y)
+        self.table.yscroll.pack(side=RIGHT, fill=Y)
         xscroll.pack(side=BOTTOM, fill=X)
         
         # Bind events
         self.tree.bind("<Delete>", self.delete_selected)
         self.tree.bind("<Button-3>", self.create_context_menu)
         self.tree.bind("<Double-1>", self.edit_selected)
+        self.tree.bind("<Shift-Button-1>", self.on_heading_shift_click)
         
         # Load initial data
         self.load_employees()
@@ -541,10 +900,10 @@ class EmployeeManager:
         self.employee_count_label.pack(pady=5)
         
         # Age distribution chart
-        self.stats = EmployeeStats(stats_frame, self.tree)
-        self.stats.show_age_distribution()
+        self.stats = EmployeeStats(stats_frame, self.dashboard_stats)
+        self.dashboard_win.protocol("WM_DELETE_WINDOW", self.close_dashboard)
         
-        # Update dashboard
+        # Later updates are triggered by store changes, not by a timer
         self.update_dashboard()
 
     def setup_status_bar(self):
@@ -556,6 +915,10 @@ class EmployeeManager:
                            font=("Segoe UI", 9), bg="#f5f6fa", fg="#7f8c8d")
         status_label.pack(side=LEFT, padx=10)
         
+        # Background jobs (exports, reports, backups)
+        self.jobs_panel = JobsPanel(status_frame, self.jobs, bg="#f5f6fa")
+        self.jobs_panel.pack(side=LEFT, padx=10)
+        
         # Auto-save indicator
         self.auto_save_var = StringVar()
         self.auto_save_var.set("Auto-sauvegarde activée")
@@ -564,6 +927,8 @@ class EmployeeManager:
         auto_save_label.pack(side=RIGHT, padx=10)
 
     def add_employee(self):
+        if self.busy_restoring():
+            return
         # Validate form
         for field, entry in self.employee_entries.items():
             if not entry.get().strip():
@@ -571,78 +936,312 @@ class EmployeeManager:
                 entry.focus()
                 return
         
-        # Add to treeview
+        # Same checks as imports and restores, duplicates included
         values = [entry.get().strip() for entry in self.employee_entries.values()]
-        self.tree.insert("", END, values=values)
+        if self.editing_key in self.store:
+            values.append(self.store.get(self.editing_key)[4])  # Keep the department
+        record = make_record(values)
+        report = DataValidator(self.store).check([record], ignore=self.editing_key)
+        if report.errors:
+            messagebox.showwarning("Validation", report.format(label="Employé"))
+            return
         
-        # Save to file
-        with open("employes.txt", "a", encoding="utf-8") as f:
-            f.write(f"Nom: {values[0]}, CIN: {values[1]}, Année: {values[2]}, ID: {values[3]}\n")
+        # Add to (or update in) the store, storage follows with a single-row
+        # write. If that write fails the store change is undone.
+        try:
+            if self.editing_key in self.store:
+                self.store.update(self.editing_key, record)
+                self.table.refresh()
+                message = "Employé modifié avec succès!"
+            else:
+                self.insert_row(self.store.add(record))
+                message = "Employé ajouté avec succès!"
+        except Exception as e:
+            messagebox.showerror("Erreur", f"Erreur lors de l'enregistrement: {str(e)}")
+            return
         
         self.clear_form()
-        self.update_status("Employé ajouté avec succès!")
+        self.update_status(message)
 
     def clear_form(self):
+        self.editing_key = None
         for entry in self.employee_entries.values():
             entry.delete(0, END)
-        self.employee_entries["nom"].focus()
+        self.employee_entries["name"].focus()
 
     def delete_selected(self, event=None):
-        selected = self.tree.selection()
-        if not selected:
+        selected = self.selected_keys()
+        if not selected or self.busy_restoring():
             return
         
         if messagebox.askyesno("Confirmation", "Voulez-vous vraiment supprimer cet employé?"):
-            self.tree.delete(selected)
-            self.save_current_state()
+            try:
+                self.remove_rows(selected)
+            except Exception as e:
+                messagebox.showerror("Erreur", f"Erreur lors de la suppression: {str(e)}")
+                return
             self.update_status("Employé supprimé!")
 
     def search_employees(self, *args):
-        search_term = self.search_var.get().lower()
-        self.tree.delete(*self.tree.get_children())
+        search_term = self.search_var.get()
+        if search_term == self.search_entry.placeholder:
+            search_term = ""
+        if not search_term:
+            self.search_worker.cancel()
+            self.search_keys = None
+            self.refresh_view()
+            return
         
-        with open("employes.txt", "r", encoding="utf-8") as f:
-            for line in f:
-                if search_term in line.lower():
-                    parts = line.strip().split(", ")
-                    values = [p.split(": ")[1] for p in parts]
-                    self.tree.insert("", END, values=values)
+        # Debounced search on the worker thread, results are polled below
+        self.search_worker.submit(search_term)
+        if not self.search_polling:
+            self.search_polling = True
+            self.win.after(30, self.poll_search_results)
+
+    def poll_search_results(self):
+        latest = None
+        while True:
+            try:
+                latest = self.search_worker.results.get_nowait()
+            except queue.Empty:
+                break
+        
+        if latest is not None:
+            generation, version, query, keys = latest
+            # Drop results of queries the user already typed past
+            if self.search_worker.is_current(generation):
+                if version == self.store.version:
+                    self.search_keys = keys
+                    self.refresh_view()
+                else:
+                    self.search_worker.submit(query, delay=0)
+        
+        if self.search_worker.busy() or not self.search_worker.results.empty():
+            self.win.after(30, self.poll_search_results)
+        else:
+            self.search_polling = False
 
     def export_to_csv(self):
         filename = filedialog.asksaveasfilename(
             defaultextension=".csv",
-            filetypes=[("CSV files", "*.csv"), ("All files", "*.*")]
+            filetypes=[("CSV files", "*.csv"), ("CSV gzip", "*.csv.gz"),
+                       ("JSON Lines", "*.jsonl"), ("JSON Lines gzip", "*.jsonl.gz"),
+                       ("All files", "*.*")]
         )
-        if filename:
-            with open(filename, 'w', newline='', encoding='utf-8') as f:
-                writer = csv.writer(f)
-                writer.writerow(["Nom", "CIN", "Année", "ID"])
-                for item in self.tree.get_children():
-                    writer.writerow(self.tree.item(item)["values"])
-            self.update_status(f"Données exportées vers {filename}")
-
-    def sort_treeview(self, col):
-        items = [(self.tree.set(item, col), item) for item in self.tree.get_children("")]
-        items.sort()
-        for index, (_, item) in enumerate(items):
-            self.tree.move(item, "", index)
+        if not filename:
+            return
+        
+        # The whole table streams straight from the database; a filtered,
+        # searched or sorted view exports its rows in view order. Only the key
+        # list is copied here, records are read on the worker.
+        filtered = self.search_keys is not None or self.filters.select(**self.filter_criteria) is not None
+        if isinstance(self.storage, SqliteStorage) and not filtered and not self.sort_spec:
+            records = self.storage.read_records()
+        else:
+            records = self.view_records(list(self.table.keys))
+        total = len(self.table.keys)
+        export = Export(filename, records, total)
+        self.run_job("Export", export.run, total=total, on_done=lambda rows: self.update_status(
+            f"{rows} lignes exportées vers {filename}"))
+
+    def run_job(self, title, target, priority=NORMAL, total=None, on_done=None):
+        # Long operations run on the job queue; the panel in the status bar
+        # shows them and the queue is polled only while jobs are active
+        job = self.jobs.submit(title, target, priority, total, on_done)
+        if not self.jobs_polling:
+            self.jobs_polling = True
+            self.win.after(100, self.poll_jobs)
+        return job
+
+    def poll_jobs(self):
+        changed = self.jobs.poll()
+        for job in changed:
+            if job.state == "failed":
+                messagebox.showerror("Erreur", f"{job.title}: {str(job.error)}")
+            elif job.state == "cancelled":
+                self.update_status(f"{job.title} annulé")
+        if getattr(self, 'jobs_panel', None) is not None:
+            self.jobs_panel.update_jobs(changed)
+        if self.jobs.busy():
+            self.win.after(100, self.poll_jobs)
+        else:
+            self.jobs_polling = False
+
+    def sort_treeview(self, col, add=False):
+        # Click: sort by col, again to reverse. Shift+click: add col as a
+        # secondary sort (or reverse it if already sorted on)
+        spec = list(self.sort_spec)
+        columns = [column for column, _ in spec]
+        if add and col in columns:
+            index = columns.index(col)
+            spec[index] = (col, not spec[index][1])
+        elif add:
+            spec.append((col, False))
+        elif columns[:1] == [col]:
+            spec = [(col, not spec[0][1])]
+        else:
+            spec = [(col, False)]
+        self.sort_spec = spec
+        
+        arrows = {column: " ▼" if descending else " ▲" for column, descending in spec}
+        for column in ("Nom", "CIN", "Année", "ID"):
+            self.tree.heading(column, text=column + arrows.get(column, ""))
+        self.refresh_view()
+
+    def on_heading_shift_click(self, event):
+        if self.tree.identify_region(event.x, event.y) != "heading":
+            return
+        index = int(self.tree.identify_column(event.x)[1:]) - 1
+        self.sort_treeview(("Nom", "CIN", "Année", "ID")[index], add=True)
+        return "break"
 
     def load_employees(self):
-        if os.path.exists("employes.txt"):
-            with open("employes.txt", "r", encoding="utf-8") as f:
-                for line in f:
-                    parts = line.strip().split(", ")
-                    values = [p.split(": ")[1] for p in parts]
-                    self.tree.insert("", END, values=values)
+        with metrics.timed("load") as sample:
+            self.storage.load_into(self.store)
+            sample.rows = len(self.store)
+        self.search_keys = None
+        self.refresh_view()
+        self.search_worker.prepare()
+        if self.search_var.get() not in ("", self.search_entry.placeholder):
+            self.search_employees()
+        if self.share_watcher is not None and not self.share_polling:
+            self.share_polling = True
+            self.win.after(500, self.poll_shared)
+
+    def poll_shared(self):
+        # The lock is only taken when the shared files moved or local changes
+        # are waiting to be appended
+        if self.restoring is None and (self.share_watcher.poll() or self.storage.pending):
+            try:
+                with metrics.timed("sync") as sample:
+                    merge = self.storage.sync()
+                    sample.rows = len(merge)
+            except OSError as e:
+                self.update_status(f"Fichier partagé indisponible: {str(e)}")
+            else:
+                if merge:
+                    self.show_merge(merge)
+        self.win.after(500, self.poll_shared)
+
+    def show_merge(self, merge):
+        # Changes made by other instances, applied to the view row by row
+        if merge.reloaded:
+            self.search_keys = None
+            self.refresh_view()
+            self.search_worker.prepare()
+        else:
+            if merge.removed:
+                self.forget_rows(merge.removed)
+            added = [key for key in merge.added if key in self.store]
+            if self.search_keys is not None:
+                self.search_keys.extend(added)
+            self.table.extend(added)
+        if self.search_var.get() not in ("", self.search_entry.placeholder):
+            self.search_employees()
+        if self.editing_key is not None and self.editing_key not in self.store:
+            self.editing_key = None  # Removed or replaced by another instance
+        if merge.conflicts:
+            lines = [f"{before.nom} ({before.id}): "
+                     + ("supprimé" if theirs is None else "modifié") + " par une autre instance"
+                     for before, ours, theirs in merge.conflicts[:20]]
+            messagebox.showwarning("Conflit", "Ces modifications n'ont pas été enregistrées, "
+                                   "une autre instance a modifié les mêmes employés avant:\n"
+                                   + "\n".join(lines))
+        self.update_status(f"Modifications d'une autre instance: {merge.summary()}")
+
+    def refresh_view(self):
+        # Text search and filters combine: the search result is restricted
+        # to the rows set in the filter bitmap
+        with metrics.timed("refresh") as sample:
+            with metrics.timed("filter") as filtered:
+                bitmap = self.filters.select(**self.filter_criteria)
+                if self.search_keys is None:
+                    keys = self.store.keys() if bitmap is None else self.filters.keys(bitmap)
+                elif bitmap is None:
+                    keys = self.search_keys
+                else:
+                    keys = self.filters.restrict(self.search_keys, bitmap)
+                filtered.rows = len(keys)
+            if self.sort_spec:
+                with metrics.timed("sort", rows=len(keys)):
+                    keys = self.sorter.sort(keys, self.sort_spec)
+            self.show_rows(keys)
+            sample.rows = len(keys)
+
+    def show_rows(self, keys):
+        self.table.set_rows(keys)
+
+    def insert_row(self, key):
+        if self.search_keys is not None:
+            self.search_keys.append(key)
+        self.table.append(key)
+
+    def remove_rows(self, keys):
+        # One storage commit for the whole selection. A failed write stops
+        # there: the rows removed until then stay removed.
+        try:
+            with self.storage.transaction():
+                for key in keys:
+                    self.store.remove(key)
+        finally:
+            self.forget_rows([key for key in keys if key not in self.store])
+
+    def forget_rows(self, keys):
+        # Drop rows already removed from the store from the search results and the view
+        if self.search_keys is not None:
+            removed = set(keys)
+            self.search_keys = [key for key in self.search_keys if key not in removed]
+        self.table.remove(keys)
+
+    def selected_keys(self):
+        return self.table.selection()
+
+    def view_records(self, keys):
+        # Records of keys, read lazily on a worker thread: rows deleted in the
+        # meantime are skipped instead of failing the job
+        get = self.store.get
+        return (record for record in (get(key, None) for key in keys) if record is not None)
+
+    def view_items(self, keys):
+        # Same as view_records, as (key, record) pairs. Callers keep the
+        # store version of `keys` to tell whether rows changed while read.
+        get = self.store.get
+        return ((key, record) for key, record in ((key, get(key, None)) for key in keys)
+                if record is not None)
+
+    def busy_restoring(self):
+        # Changes wait while a bulk restore rewrites the storage on the job
+        # queue: the store gets the restored rows once it is done
+        if self.restoring is None:
+            return False
+        self.update_status("Restauration en cours, réessayez dans un instant")
+        return True
 
     def save_current_state(self):
-        with open("employes.txt", "w", encoding="utf-8") as f:
-            for item in self.tree.get_children():
-                values = self.tree.item(item)["values"]
-                f.write(f"Nom: {values[0]}, CIN: {values[1]}, Année: {values[2]}, ID: {values[3]}\n")
+        # Changes are written as they happen; a save folds them into the main
+        # file (journal compaction / WAL checkpoint) on a background thread
+        if self.busy_restoring():
+            return
+        if self.auto_saver.save():
+            self.win.after(50, self.poll_auto_save)
+        elif not self.auto_saver.busy():
+            self.auto_save_var.set("Aucune modification à sauvegarder")
+
+    def poll_auto_save(self):
+        result = self.auto_saver.poll()
+        if result is None:
+            self.win.after(50, self.poll_auto_save)
+            return
+        written, seconds, changes, error = result
+        now = datetime.now().strftime("%H:%M:%S")
+        if error is not None:
+            self.auto_save_var.set(f"Échec de la sauvegarde à {now}: {error}")
+        else:
+            self.auto_save_var.set(f"Sauvegardé à {now} ({len(changes)} modif., "
+                                   f"{written / 1024:.1f} Ko en {seconds * 1000:.0f} ms)")
 
     def update_status(self, message=None):
-        count = len(self.tree.get_children())
+        count = len(self.store)
         status = f"{count} employé{'s' if count > 1 else ''} | "
         status += message if message else datetime.now().strftime("%d/%m/%Y %H:%M:%S")
         self.status_var.set(status)
@@ -659,28 +1258,27 @@ class EmployeeManager:
         finally:
             context_menu.grab_release()
 
-    def edit_selected(self):
-        selected = self.tree.selection()
+    def edit_selected(self, event=None):
+        selected = self.selected_keys()
         if not selected:
             return
             
-        item = self.tree.item(selected[0])
-        values = item['values']
+        values = self.store.get(selected[0])
         
         for field, value in zip(self.employee_entries.keys(), values):
             self.employee_entries[field].delete(0, END)
             self.employee_entries[field].insert(0, value)
         
-        self.tree.delete(selected)
-        self.employee_entries["nom"].focus()
+        # The row stays in place, "Ajouter" saves the changes into it
+        self.editing_key = selected[0]
+        self.employee_entries["name"].focus()
 
     def copy_selected(self):
-        selected = self.tree.selection()
+        selected = self.selected_keys()
         if not selected:
             return
             
-        item = self.tree.item(selected[0])
-        values = item['values']
+        values = self.store.get(selected[0])[:4]
         self.win.clipboard_clear()
         self.win.clipboard_append(", ".join(str(v) for v in values))
 
@@ -706,53 +1304,119 @@ class EmployeeManager:
                           foreground=theme["fg"], fieldbackground="white")
 
     def import_from_csv(self, event=None):
+        if self.busy_restoring():
+            return
         filename = filedialog.askopenfilename(
             filetypes=[("CSV files", "*.csv"), ("All files", "*.*")]
         )
-        if filename:
-            try:
-                with open(filename, 'r', newline='', encoding='utf-8') as f:
-                    reader = csv.reader(f)
-                    next(reader)  # Skip header
-                    for row in reader:
-                        self.tree.insert("", END, values=row)
-                self.save_current_state()
-                self.update_status(f"Données importées depuis {filename}")
-            except Exception as e:
-                messagebox.showerror("Erreur", f"Erreur lors de l'importation: {str(e)}")
+        if not filename:
+            return
+        try:
+            # One validator for the whole file, so duplicates across chunks are caught
+            job = CsvImport(filename, DataValidator(self.store))
+        except Exception as e:
+            messagebox.showerror("Erreur", f"Erreur lors de l'importation: {str(e)}")
+            return
+        
+        # Parsing and validation run on the worker; chunks are committed here
+        # in one transaction each, a few at a time between two Tk events
+        dialog = ProgressDialog(self.win, "Importation", job.cancel, job.size)
+        
+        state = {"rows": 0, "report": ValidationReport(), "start": time.perf_counter()}
+        
+        def finish(error=None):
+            metrics.record("import", time.perf_counter() - state["start"], state["rows"], job.size)
+            dialog.destroy()
+            # Rows were appended as they came; put search, filters and sort back
+            self.refresh_view()
+            if self.search_var.get() not in ("", self.search_entry.placeholder):
+                self.search_employees()
+            if error is not None:
+                messagebox.showerror("Erreur", f"Erreur lors de l'importation: {str(error)}")
+            message = f"{state['rows']} employés importés depuis {filename}"
+            if job.cancelled:
+                message = "Importation annulée, " + message
+            report = state["report"]
+            if report.errors:
+                message += f" ({len(report)} lignes invalides ignorées)"
+                messagebox.showwarning("Importation", f"{len(report)} lignes invalides ignorées:\n"
+                                       + report.format())
+            self.update_status(message)
+        
+        def pump():
+            deadline = time.perf_counter() + 0.05
+            while time.perf_counter() < deadline:
+                try:
+                    item = job.chunks.get_nowait()
+                except queue.Empty:
+                    break
+                if item[0] == "done":
+                    finish()
+                    return
+                if item[0] == "error":
+                    finish(item[1])
+                    return
+                _, records, report, position = item
+                try:
+                    with self.storage.transaction():
+                        keys = self.store.extend(records)
+                except Exception as e:
+                    job.cancel()  # finish() refreshes the view with the rows kept
+                    finish(e)
+                    return
+                self.table.extend(keys)
+                state["rows"] += len(keys)
+                state["report"].merge(report)
+                rate = state["rows"] / max(time.perf_counter() - state["start"], 1e-6)
+                dialog.update_progress(position, f"{state['rows']} employés importés ({rate:.0f} lignes/s)")
+            if job.cancelled:
+                finish()
+            else:
+                self.win.after(15, pump)
+        
+        job.start()
+        self.win.after(15, pump)
 
     def backup_data(self, event=None):
-        if not os.path.exists("employes.txt"):
+        if not len(self.store):
             messagebox.showwarning("Backup", "Aucune donnée à sauvegarder.")
             return
             
-        backup_dir = "backups"
-        if not os.path.exists(backup_dir):
-            os.makedirs(backup_dir)
-            
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        backup_file = os.path.join(backup_dir, f"employes_backup_{timestamp}.txt")
-        
-        try:
-            shutil.copy2("employes.txt", backup_file)
-            self.update_status(f"Backup créé: {backup_file}")
-        except Exception as e:
-            messagebox.showerror("Erreur", f"Erreur lors du backup: {str(e)}")
+        # Incremental: only the chunks that changed since earlier snapshots
+        # are written. Only the keys are captured now, the rows are read on
+        # the job queue; if they changed meanwhile the backup starts over.
+        keys, version = list(self.store), self.store.version
+        
+        def backup(job):
+            items = list(self.view_items(keys))
+            if self.store.version != version:
+                return None
+            manifest = self.backups.create(items)
+            job.nbytes = manifest["written"]
+            self.backups.prune(BACKUP_KEEP)
+            return manifest
+        
+        def done(manifest):
+            if manifest is None:
+                self.backup_data()
+            elif manifest["written"]:
+                self.update_status(f"Backup créé: {manifest['name']} ({manifest['written'] / 1024:.1f} Ko écrits)")
+            else:
+                self.update_status("Backup inchangé depuis le précédent")
+        
+        self.run_job("Backup", backup, priority=LOW, on_done=done)
 
     def restore_data(self, event=None):
-        backup_dir = "backups"
-        if not os.path.exists(backup_dir):
-            messagebox.showwarning("Restauration", "Aucun backup disponible.")
-            return
-            
-        backup_files = [f for f in os.listdir(backup_dir) if f.startswith("employes_backup_")]
-        if not backup_files:
+        # Snapshots of the backup store first, then older full-copy backups
+        backup_dir = self.backups.root
+        sources = [(name, f"{name[:4]}-{name[4:6]}-{name[6:8]} {name[9:11]}:{name[11:13]}:{name[13:15]}")
+                   for name in self.backups.snapshots()]
+        sources += [(None, f) for f in sorted((f for f in os.listdir(backup_dir)
+                                                if f.startswith("employes_backup_")), reverse=True)]
+        if not sources:
             messagebox.showwarning("Restauration", "Aucun backup trouvé.")
             return
             
-        # Trier par date (plus récent en premier)
-        backup_files.sort(reverse=True)
-        
         # Créer une fenêtre de sélection
         restore_win = Toplevel(self.win)
         restore_win.title("Restaurer un backup")
@@ -764,22 +1428,111 @@ class EmployeeManager:
         listbox = Listbox(restore_win, font=("Segoe UI", 10))
         listbox.pack(fill=BOTH, expand=True, padx=10, pady=5)
         
-        for backup_file in backup_files:
-            listbox.insert(END, backup_file)
+        for _, label in sources:
+            listbox.insert(END, label)
             
         def do_restore():
             selection = listbox.curselection()
-            if not selection:
+            if not selection or self.busy_restoring():
                 return
                 
-            backup_file = os.path.join(backup_dir, listbox.get(selection[0]))
+            # The backup is read into a fresh store and compared with the
+            # current rows on the job queue; only their keys are copied here
+            # and nothing changes until the preview is confirmed
+            snapshot, label = sources[selection[0]]
+            keys, version = list(self.store), self.store.version
+            self.run_job("Restauration", lambda job: read_backup(snapshot, label, keys, version),
+                         priority=HIGH, on_done=lambda result: confirm_restore(label, *result))
+        
+        def read_backup(snapshot, label, keys, version):
+            if snapshot is not None:
+                items = self.backups.load(snapshot)
+            else:
+                # Older backups are text files, open_storage reads both formats
+                source = open_storage(os.path.join(backup_dir, label), shared=False)
+                try:
+                    items = list(source.load())
+                finally:
+                    source.close()
+            plan = plan_restore(dict(self.view_items(keys)), items, version, keyed=snapshot is not None)
+            report = DataValidator().check(list(plan.snapshot.records()))
+            return plan, report
+        
+        def confirm_restore(label, plan, report, confirmed=False):
+            if plan.version != self.store.version:
+                # Edited in the meantime: compare again with the rows as they are now
+                keys, version = list(self.store), self.store.version
+                self.run_job("Restauration", lambda job: (
+                    plan_restore(dict(self.view_items(keys)), plan.snapshot.items(), version,
+                                 keyed=plan.keyed), report),
+                             priority=HIGH, on_done=lambda result: confirm_restore(label, *result, confirmed))
+                return
+            if not len(plan):
+                self.update_status(f"Aucune différence avec {label}")
+                return
+            message = f"Restaurer {label}?\n{plan.summary()}"
+            if report.errors:
+                message += (f"\n\n{len(report)} enregistrements invalides dans ce backup:\n"
+                            + report.format(label="Enregistrement"))
+            if not confirmed:
+                if not messagebox.askyesno("Restauration", message):
+                    return
+                if plan.version != self.store.version:
+                    # Merged from another instance while the question was up
+                    confirm_restore(label, plan, report, True)
+                    return
+            if plan.bulk():
+                # The storage is rewritten on the job queue; changes wait
+                # until the rows are swapped in the store once it is done
+                written = self.restoring = threading.Event()
+                self.run_job("Restauration", lambda job: rewrite_storage(plan, written),
+                             priority=HIGH, on_done=lambda error: restored(label, plan, error))
+                return
             try:
-                shutil.copy2(backup_file, "employes.txt")
-                self.load_employees()
-                self.update_status(f"Données restaurées depuis {backup_file}")
-                restore_win.destroy()
+                added = apply_restore(self.store, self.storage, plan)
             except Exception as e:
+                # The rows changed before the failure stay changed
+                self.search_keys = None
+                self.refresh_view()
                 messagebox.showerror("Erreur", f"Erreur lors de la restauration: {str(e)}")
+                return
+            # Only the rows that differ are touched in the view
+            if plan.removed:
+                self.forget_rows(plan.removed)
+            for key in added:
+                self.insert_row(key)
+            self.table.refresh()
+            finish_restore(label, plan)
+        
+        def rewrite_storage(plan, written):
+            # Runs on the job queue; returns the error instead of raising so
+            # restored() always puts the store back in service
+            try:
+                write_restore(self.storage, plan)
+            except Exception as e:
+                return e
+            finally:
+                written.set()
+            return None
+        
+        def restored(label, plan, error):
+            self.restoring = None
+            if error is not None:
+                messagebox.showerror("Erreur", f"Erreur lors de la restauration: {str(error)}")
+                return
+            load_restore(self.store, plan)
+            # Reloaded as a whole
+            self.search_keys = None
+            self.refresh_view()
+            self.search_worker.prepare()
+            finish_restore(label, plan)
+        
+        def finish_restore(label, plan):
+            if self.search_var.get() not in ("", self.search_entry.placeholder):
+                self.search_employees()
+            self.update_status(f"Données restaurées depuis {label} ({plan.summary()})")
+            if restore_win.winfo_exists():
+                restore_win.destroy()
                 
         Button(restore_win, text="Restaurer", command=do_restore,
                font=("Segoe UI", 10, "bold"), bg="#3498db", fg="white").pack(pady=10)
@@ -797,7 +1550,7 @@ class EmployeeManager:
         year = self.employee_entries["year"].get().strip()
         if not DataValidator.validate_year(year):
             self.employee_entries["year"].configure(fg="red")
-            Tooltip(self.employee_entries["year"], "Année invalide! (1900-2006)")
+            Tooltip(self.employee_entries["year"], f"Année invalide! (1900-{DataValidator.max_year()})")
             return False
         self.employee_entries["year"].configure(fg="#2c3e50")
         return True
@@ -812,25 +1565,26 @@ class EmployeeManager:
         return True
 
     def apply_filters(self, event=None):
-        year = self.year_filter.get()
+        year = self.year_filter.get().strip()
+        year_to = self.year_to_filter.get().strip()
         dept = self.dept_filter.get()
         
-        self.tree.delete(*self.tree.get_children())
+        if not all(value.isdigit() for value in (year, year_to) if value):
+            messagebox.showwarning("Filtre", "Année invalide!")
+            return
         
-        with open("employes.txt", "r", encoding="utf-8") as f:
-            for line in f:
-                parts = line.strip().split(", ")
-                values = [p.split(": ")[1] for p in parts]
-                
-                # Apply year filter
-                if year and values[2] != year:
-                    continue
-                    
-                # Apply department filter (if you add department field)
-                if dept != "Tous" and len(values) > 4 and values[4] != dept:
-                    continue
-                    
-                self.tree.insert("", END, values=values)
+        # Year filter, or year range when an upper bound is given
+        if year_to:
+            criteria = {"year_from": year, "year_to": year_to}
+        else:
+            criteria = {"year": year}
+        
+        # Department filter (rows without a department always pass)
+        if dept != "Tous":
+            criteria["dept"] = dept
+            
+        self.filter_criteria = criteria
+        self.refresh_view()
 
     def export_to_pdf(self, event=None):
         filename = filedialog.asksaveasfilename(
@@ -839,40 +1593,16 @@ class EmployeeManager:
         )
         if not filename:
             return
-            
-        # Create PDF
-        doc = SimpleDocTemplate(filename, pagesize=letter)
-        elements = []
-        
-        # Title
-        title = "Liste des Employés"
-        elements.append(Paragraph(title, getSampleStyleSheet()["Title"]))
-        
-        # Table data
-        data = [["Nom", "CIN", "Année", "ID"]]
-        for item in self.tree.get_children():
-            data.append(self.tree.item(item)["values"])
-            
-        # Create table
-        table = Table(data)
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.blue),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 14),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-            ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 1), (-1, -1), 12),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
-        elements.append(table)
-        
-        # Build PDF
-        doc.build(elements)
-        self.update_status(f"PDF exporté: {filename}")
+        
+        report = self.pdf_report(filename)
+        self.run_job("Rapport PDF", report.run, total=report.total, on_done=lambda rows: self.update_status(
+            f"PDF exporté: {filename} ({report.pages} pages)"))
+
+    def pdf_report(self, filename):
+        # Pages are laid out in the job queue's process pool and put together
+        # once all are done; only the key list is copied here
+        keys = list(self.table.keys)
+        return PdfReport(filename, self.view_records(keys), len(keys), pool=self.jobs.process_pool())
 
     def send_email_report(self, event=None):
         # Create email dialog
@@ -881,7 +1611,8 @@ class EmployeeManager:
         email_win.geometry("400x300")
         
         # Email form
-        Label(email_win, text="Destinataire:", font=("Segoe UI", 10)).pack(anchor=W, padx=10, pady=5)
+        Label(email_win, text="Destinataires (séparés par des virgules):",
+              font=("Segoe UI", 10)).pack(anchor=W, padx=10, pady=5)
         email_entry = ModernEntry(email_win, placeholder="email@example.com")
         email_entry.pack(fill=X, padx=10)
         
@@ -895,67 +1626,96 @@ class EmployeeManager:
         
         def send_email():
             # Get form data
-            recipient = email_entry.get()
+            recipients = [address for address in re.split(r"[,;\s]+", email_entry.get())
+                          if "@" in address and address != email_entry.placeholder]
             subject = subject_entry.get()
             message = message_text.get("1.0", END)
+            if not recipients:
+                messagebox.showwarning("Email", "Aucun destinataire valide!")
+                return
             
-            try:
-                # Create temporary PDF
-                temp_pdf = "temp_report.pdf"
-                self.export_to_pdf(temp_pdf)
-                
-                # Create email
-                msg = MIMEMultipart()
-                msg["From"] = "your_email@example.com"  # Replace with actual email
-                msg["To"] = recipient
-                msg["Subject"] = subject
-                
-                msg.attach(MIMEText(message, "plain"))
-                
-                # Attach PDF
-                with open(temp_pdf, "rb") as f:
-                    pdf_attachment = MIMEApplication(f.read(), _subtype="pdf")
-                    pdf_attachment.add_header(
-                        "Content-Disposition", "attachment", filename="rapport_employes.pdf")
-                    msg.attach(pdf_attachment)
-                
-                # Send email (configure your SMTP settings)
-                # with smtplib.SMTP("smtp.gmail.com", 587) as server:
-                #     server.starttls()
-                #     server.login("your_email@example.com", "your_password")
-                #     server.send_message(msg)
-                
-                os.remove(temp_pdf)
+            # The report is rendered once on the job queue, then queued in the
+            # outbox for every recipient; delivery goes on in the background
+            mailer = self.get_mailer()
+            report = self.pdf_report(os.path.join(mailer.outbox.path, f"rapport-{os.getpid()}-{time.time_ns()}.pdf"))
+            
+            def render_and_queue(job):
+                if report.run(job) is None:
+                    return None
+                return mailer.send(recipients, subject, message, report.path, "rapport_employes.pdf")
+            
+            self.run_job("Rapport email", render_and_queue, total=report.total, on_done=queued)
+        
+        def queued(messages):
+            if email_win.winfo_exists():
                 email_win.destroy()
-                self.update_status("Rapport envoyé par email!")
-                
-            except Exception as e:
-                messagebox.showerror("Erreur", f"Erreur d'envoi: {str(e)}")
+            self.update_status(f"Rapport en cours d'envoi à {len(messages)} destinataire(s)")
+            if not self.mailer_polling:
+                self.mailer_polling = True
+                self.poll_mailer()
         
         ModernButton(email_win, text="Envoyer", command=send_email,
                     bg="#3498db", fg="white").pack(pady=10)
 
+    def get_mailer(self):
+        # SMTP settings come from the EMPLOYES_SMTP_* environment variables
+        if self.mailer is None:
+            self.mailer = startup.load("employes.mailer").Mailer()
+            self.mailer.start()
+        return self.mailer
+
+    def poll_mailer(self):
+        # Runs only while the outbox has messages waiting
+        sent, failed = self.mailer.poll()
+        if sent or failed:
+            message = f"Emails envoyés: {len(sent)}"
+            if failed:
+                message += f", échecs: {len(failed)} (voir {self.mailer.outbox.failed})"
+            self.update_status(message)
+        if self.mailer.pending() or not self.mailer.results.empty():
+            self.win.after(1000, self.poll_mailer)
+        else:
+            self.mailer_polling = False
+
+    def resume_outbox(self):
+        # Messages left in the outbox by a previous run are sent again
+        if any(name.endswith(".json") for name in os.listdir(OUTBOX)):
+            self.get_mailer()
+            if not self.mailer_polling:
+                self.mailer_polling = True
+                self.poll_mailer()
+
     def show_statistics(self):
-        if hasattr(self, 'dashboard_win'):
+        if getattr(self, 'dashboard_win', None) is not None:
             self.dashboard_win.lift()
         else:
             self.create_dashboard()
 
+    def close_dashboard(self):
+        self.dashboard_win.destroy()
+        self.dashboard_win = None
+
+    def on_store_change(self, op, key, old, new):
+        # Coalesce bursts of changes (imports, multi-row deletes) into one
+        # refresh; while the data is idle the dashboard does no work at all
+        if self.dashboard_pending is None and getattr(self, 'dashboard_win', None) is not None:
+            self.dashboard_pending = self.win.after(200, self.update_dashboard)
+
     def update_dashboard(self):
-        # Update employee count
-        count = len(self.tree.get_children())
-        self.employee_count_label.config(text=str(count))
-        
-        # Update age distribution
-        self.stats.show_age_distribution()
-        
-        # Schedule next update
-        self.win.after(5000, self.update_dashboard)
+        self.dashboard_pending = None
+        if getattr(self, 'dashboard_win', None) is None:
+            return
+        with metrics.timed("dashboard", rows=len(self.store)):
+            count = str(self.dashboard_stats.count)
+            if self.employee_count_label.cget("text") != count:
+                self.employee_count_label.config(text=count)
+            self.stats.show_age_distribution()
 
     def start_auto_save(self):
         def auto_save():
-            self.save_current_state()
-            self.auto_save_var.set("Sauvegardé à " + datetime.now().strftime("%H:%M:%S"))
+            # Skipped entirely when nothing changed since the last save
+            if self.restoring is None and self.auto_saver.save():
+                self.win.after(50, self.poll_auto_save)
             self.auto_save_id = self.win.after(300000, auto_save)  # 5 minutes
         
         self.auto_save_id = self.win.after(300000, auto_save)
@@ -973,6 +1733,13 @@ class EmployeeManager:
         # This would need to be implemented based on your translations dictionary
         pass
 
+    def show_performance(self):
+        window = getattr(self, 'performance_win', None)
+        if window is not None and window.winfo_exists():
+            window.lift()
+            return
+        self.performance_win = PerformanceWindow(self.win, metrics)
+
     def create_modern_button(self, parent, text, command, color):
         btn = ModernButton(parent, text=text, font=("Segoe UI", 10, "bold"),
                           bg=color, fg="white", command=command,
@@ -980,9 +1747,35 @@ class EmployeeManager:
         btn.pack(side=LEFT, padx=5)
         return btn
 
+    def on_close(self):
+        # Flush pending journal entries before the process goes away
+        self.search_worker.stop()
+        if self.share_watcher is not None:
+            self.share_watcher.stop()
+        if self.restoring is not None:
+            self.restoring.wait()  # The storage is being rewritten
+        self.jobs.stop()
+        if self.mailer is not None:
+            self.mailer.stop()
+        self.auto_saver.wait()
+        self.storage.close()
+        if os.environ.get("EMPLOYES_METRICS"):
+            try:
+                metrics.dump(os.environ["EMPLOYES_METRICS"])
+            except OSError as e:
+                print(f"Métriques non écrites: {e}", file=sys.stderr)
+        self.win.destroy()
+
     def run(self):
+        self.win.after_idle(self.on_first_idle)
         self.win.mainloop()
 
+    def on_first_idle(self):
+        # The login window is drawn once the first idle callbacks ran
+        startup.report.mark("login window")
+        if os.environ.get("EMPLOYES_STARTUP_REPORT"):
+            print(startup.report.format(), file=sys.stderr)
+
 if __name__ == "__main__":
     app = EmployeeManager()
     app.run()
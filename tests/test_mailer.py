@@ -0,0 +1,131 @@
+import json
+import os
+import socket
+import socketserver
+import tempfile
+import threading
+import time
+import unittest
+from email import message_from_bytes
+
+from employes.mailer import Mailer, Outbox, SmtpConfig
+
+
+class SmtpStub(socketserver.ThreadingTCPServer):
+    # Just enough of an SMTP server for smtplib: accepts everything and
+    # keeps the received messages as (sender, recipients, data)
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), SmtpHandler)
+        self.messages = []
+        self.port = self.server_address[1]
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class SmtpHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode("ascii") + b"\r\n")
+
+    def handle(self):
+        sender, recipients = None, []
+        self.reply("220 stub ESMTP")
+        for line in self.rfile:
+            command = line.decode("ascii", "replace").strip()
+            verb = command[:4].upper()
+            if verb in ("EHLO", "HELO"):
+                self.reply("250 stub")
+            elif verb == "MAIL":
+                sender, recipients = command.partition(":")[2].strip(" <>"), []
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                recipients.append(command.partition(":")[2].strip(" <>"))
+                self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                data = []
+                for line in self.rfile:
+                    if line == b".\r\n":
+                        break
+                    data.append(line[1:] if line.startswith(b"..") else line)
+                self.server.messages.append((sender, recipients, b"".join(data)))
+                self.reply("250 OK")
+            elif verb in ("RSET", "NOOP"):
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Not implemented")
+
+
+def closed_port():
+    # A port nothing listens on, so connecting to it is refused
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class MailerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.outbox = Outbox(os.path.join(self.tmp.name, "outbox"))
+
+    def start_stub(self):
+        stub = SmtpStub()
+        self.addCleanup(stub.stop)
+        return stub
+
+    def mailer(self, port):
+        mailer = Mailer(config=SmtpConfig(host="127.0.0.1", port=port, timeout=5), outbox=self.outbox)
+        self.addCleanup(mailer.stop)
+        return mailer
+
+    def test_send_drains_the_outbox(self):
+        stub = self.start_stub()
+        mailer = self.mailer(stub.port)
+        mailer.send(["a@example.com", "b@example.com"], "Rapport", "Bonjour")
+        sent = []
+        deadline = time.monotonic() + 10
+        while len(sent) < 2 and time.monotonic() < deadline:
+            sent += mailer.poll()[0]
+            time.sleep(0.01)
+        self.assertEqual(len(sent), 2)
+        self.assertEqual(sorted(recipients[0] for _, recipients, _ in stub.messages),
+                         ["a@example.com", "b@example.com"])
+        message = message_from_bytes(stub.messages[0][2])
+        self.assertEqual(message["Subject"], "Rapport")
+        self.assertEqual(self.outbox.count(), 0)
+        deadline = time.monotonic() + 10
+        while mailer.pending() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(mailer.pending(), 0)
+
+    def test_refused_connection_is_retried(self):
+        mailer = self.mailer(closed_port())
+        self.outbox.put(["a@example.com"], "Rapport", "Bonjour")
+        self.assertEqual(mailer.deliver(), 0)
+        [message] = self.outbox.pending()
+        self.assertEqual(message["attempts"], 1)
+        self.assertGreater(message["next_try"], time.time())
+        self.assertEqual(mailer.deliver(), 0)  # Not due yet
+
+        stub = self.start_stub()
+        mailer.config.port = stub.port
+        message["next_try"] = 0
+        with open(os.path.join(self.outbox.path, message["id"] + ".json"), "w", encoding="utf-8") as f:
+            json.dump(message, f)
+        self.assertEqual(mailer.deliver(), 1)
+        self.assertEqual(len(stub.messages), 1)
+        self.assertEqual(self.outbox.count(), 0)
+        self.assertEqual(mailer.poll()[0][0][1]["id"], message["id"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import textwrap
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAIN = os.path.join(ROOT, "gestion_des_employes.py")
+
+
+def run(code, cwd):
+    # Runs code in a fresh interpreter and returns what it printed as JSON
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    output = subprocess.run([sys.executable, "-c", textwrap.dedent(code)], cwd=cwd, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+class StartupTest(unittest.TestCase):
+    # Heavy subsystems are loaded on first use, never at import time
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def test_gui_import_loads_no_heavy_module(self):
+        result = run("""
+            import json, sys
+            sys.argv = ["gestion_des_employes.py"]
+            import gestion_des_employes
+            from employes import startup
+            print(json.dumps({"heavy": startup.report.heavy_modules(),
+                              "phases": [name for name, _ in startup.report.phases]}))
+        """, self.tmp.name)
+        self.assertEqual(result["heavy"], [])
+        self.assertIn("imports", result["phases"])
+
+    def test_cli_loads_neither_tk_nor_reports(self):
+        result = run(f"""
+            import json, runpy, sys
+            sys.argv = ["gestion_des_employes.py", "--storage", "test.db", "-q", "stats", "--json"]
+            try:
+                runpy.run_path({MAIN!r}, run_name="__main__")
+            except SystemExit as e:
+                code = e.code
+            from employes import startup
+            print(json.dumps({{"code": code, "heavy": startup.report.heavy_modules(),
+                              "loaded": [name for name in ("tkinter", "matplotlib", "reportlab")
+                                         if name in sys.modules]}}))
+        """, self.tmp.name)
+        self.assertEqual(result["code"], 0)
+        self.assertEqual(result["heavy"], [])
+        self.assertEqual(result["loaded"], [])
+
+
+if __name__ == "__main__":
+    unittest.main()